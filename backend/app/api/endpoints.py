@@ -1,33 +1,61 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import datetime
+from typing import List, Optional
+import asyncio
+import base64
+import binascii
+import gzip
 import hashlib
 import json
 import uuid
 
-from app.core.database import supabase
+from app.core.config import settings
+from app.core.repository import repository
 from app.models.schemas import (
     PRDResponse, 
     PRDDetailResponse, 
     AnalysisResultSchema, 
     AutomationScriptRequest,
     AutomationScriptResponse,
+    BatchStatusResponse,
+    BatchUploadResponse,
     RefinementRequest, 
     ChatRequest, 
     ChatResponse,
     QAIntelligenceSchema,
     QAIntelligenceResponse,
+    PRDWorkspaceResponse,
     TestCaseSchema,
     TestCaseListResponse
 )
-from app.services.extractor import extract_text
+from app.services.document_pipeline import (
+    PROCESS_BATCH_JOB,
+    PROCESS_DOCUMENT_JOB,
+    mark_document_failed,
+)
+from app.services.content_hashes import prd_hash as compute_prd_hash
+from app.services.content_hashes import stable_hash, test_suite_hash
+from app.services.job_queue import job_queue
+from app.services.pipeline_events import DRAFT_EVENT, TERMINAL_STAGES, pipeline_events
+from app.services.single_flight import generation_flights
+from app.services.test_case_store import persist_test_cases
+from app.services.upload_spool import (
+    SpooledUpload,
+    UploadRejectedError,
+    discard_spooled_upload,
+    spool_multipart_uploads,
+    spool_zip_members,
+)
 from app.services.analyzer import (
-    analyze_prd_text,
     refine_prd_text,
     chat_with_prd,
+    stream_chat_with_prd,
     calculate_dynamic_quality_score,
     generate_automation_script,
     generate_qa_intelligence,
     generate_test_cases,
+    qa_module_hashes,
     TARGET_FINAL_SCORE,
 )
 
@@ -36,6 +64,18 @@ router = APIRouter()
 # Test user UUID (created in Supabase auth to satisfy FK constraint)
 ANON_USER_ID = "39803246-87ff-4b15-8560-dff026e592bc"
 
+# Analysis columns copied when a duplicate upload reuses an earlier analysis
+ANALYSIS_CLONE_FIELDS = ("standardized_prd", "quality_score", "missing_requirements", "qa_risk_insights", "prd_hash")
+
+# Allowance for multipart boundaries and headers when pre-checking Content-Length
+UPLOAD_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Columns PRDResponse needs; the dashboard list never loads anything else
+PRD_LIST_COLUMNS = "id, filename, status, created_at"
+
+# Workspace bundles smaller than this are sent uncompressed
+WORKSPACE_GZIP_MIN_BYTES = 1024
+
 
 def _count_markdown_bullets(markdown_text: str) -> int:
     return sum(
@@ -45,17 +85,20 @@ def _count_markdown_bullets(markdown_text: str) -> int:
     )
 
 
-def _compute_content_hash(value: object) -> str:
-    serialized = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
-    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+def _dump_model(model: object) -> dict:
+    return model.model_dump() if hasattr(model, "model_dump") else model.dict()
 
 
-def _compute_test_cases_hash(test_cases: list[TestCaseSchema]) -> str:
-    normalized_test_cases = [
-        (test_case.model_dump() if hasattr(test_case, "model_dump") else test_case.dict())
-        for test_case in test_cases
-    ]
-    return _compute_content_hash(normalized_test_cases)
+def _format_sse_event(event: str, data: object) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 def _is_missing_qa_cache_table_error(error: Exception) -> bool:
@@ -71,171 +114,481 @@ def _is_missing_qa_cache_table_error(error: Exception) -> bool:
     )
 
 
-def _invalidate_qa_intelligence_cache(prd_id: str) -> None:
+async def _fetch_qa_intelligence_cache_record(prd_id: str, refresh: bool = False) -> dict | None:
     try:
-        supabase.table("qa_intelligence_cache").delete().eq("prd_id", prd_id).execute()
-    except Exception as cache_err:
-        if _is_missing_qa_cache_table_error(cache_err):
-            print("QA intelligence cache table does not exist yet; skipping invalidation.")
-            return
-        print(f"Failed to invalidate QA intelligence cache for {prd_id}: {cache_err}")
-
-
-def _load_cached_qa_intelligence(prd_id: str, prd_hash: str, test_cases_hash: str) -> QAIntelligenceResponse | None:
-    try:
-        cache_res = supabase.table("qa_intelligence_cache").select("*").eq("prd_id", prd_id).execute()
+        return await repository.get_qa_cache(prd_id, refresh=refresh)
     except Exception as cache_err:
         if _is_missing_qa_cache_table_error(cache_err):
             print("QA intelligence cache table does not exist yet; skipping cache read.")
             return None
         raise
 
-    if not cache_res.data:
+
+async def _load_cached_qa_intelligence(prd_id: str, prd_hash: str, test_cases_hash: str) -> QAIntelligenceResponse | None:
+    # Usually served by the in-process record cache; a stale entry (another
+    # process regenerated since) is re-read once before giving up.
+    cache_record = await _fetch_qa_intelligence_cache_record(prd_id)
+    cached_response = _validate_cached_qa_intelligence(prd_id, cache_record, prd_hash, test_cases_hash)
+    if cached_response is None and cache_record is not None:
+        cache_record = await _fetch_qa_intelligence_cache_record(prd_id, refresh=True)
+        cached_response = _validate_cached_qa_intelligence(prd_id, cache_record, prd_hash, test_cases_hash)
+    return cached_response
+
+
+def _qa_versions(analysis_data: dict, test_case_rows: list[dict]) -> tuple[str, str]:
+    """(prd_hash, test_cases_hash) as stamped at write time, hashed here for rows that predate the stamps."""
+    return (
+        analysis_data.get("prd_hash") or compute_prd_hash(analysis_data["standardized_prd"]),
+        analysis_data.get("test_cases_hash") or test_suite_hash(test_case_rows),
+    )
+
+
+def _validate_cached_qa_intelligence(
+    prd_id: str, cache_record: dict | None, prd_hash: str, test_cases_hash: str
+) -> QAIntelligenceResponse | None:
+    if not cache_record:
         return None
 
-    cache_record = cache_res.data[0]
     if cache_record.get("prd_hash") != prd_hash or cache_record.get("test_cases_hash") != test_cases_hash:
         return None
 
-    intelligence_payload = cache_record.get("intelligence")
+    intelligence = _parse_cached_qa_intelligence(prd_id, cache_record)
+    return QAIntelligenceResponse(prd_id=prd_id, intelligence=intelligence, cached=True) if intelligence else None
+
+
+def _parse_cached_qa_intelligence(prd_id: str, cache_record: dict | None) -> QAIntelligenceSchema | None:
+    intelligence_payload = (cache_record or {}).get("intelligence")
     if not isinstance(intelligence_payload, dict):
         return None
 
     try:
-        return QAIntelligenceResponse(
-            prd_id=prd_id,
-            intelligence=QAIntelligenceSchema(**intelligence_payload),
-            cached=True,
-        )
+        return QAIntelligenceSchema(**intelligence_payload)
     except Exception as parse_err:
         print(f"Cached QA intelligence is invalid for {prd_id}: {parse_err}")
         return None
 
 
-def _store_qa_intelligence_cache(prd_id: str, prd_hash: str, test_cases_hash: str, intelligence: QAIntelligenceSchema) -> None:
+async def _store_qa_intelligence_cache(
+    prd_id: str,
+    prd_hash: str,
+    test_cases_hash: str,
+    intelligence: QAIntelligenceSchema,
+    module_hashes: dict[str, str],
+) -> None:
+    cache_row = {
+        "prd_id": prd_id,
+        "prd_hash": prd_hash,
+        "test_cases_hash": test_cases_hash,
+        "intelligence": _dump_model(intelligence),
+        "module_hashes": module_hashes,
+    }
     try:
-        intelligence_payload = intelligence.model_dump() if hasattr(intelligence, "model_dump") else intelligence.dict()
-        supabase.table("qa_intelligence_cache").delete().eq("prd_id", prd_id).execute()
-        supabase.table("qa_intelligence_cache").insert({
-            "prd_id": prd_id,
-            "prd_hash": prd_hash,
-            "test_cases_hash": test_cases_hash,
-            "intelligence": intelligence_payload,
-        }).execute()
+        try:
+            await repository.upsert_qa_cache(cache_row)
+        except Exception as cache_err:
+            if "module_hashes" not in str(cache_err):
+                raise
+            print("qa_intelligence_cache.module_hashes column does not exist yet; storing without it.")
+            cache_row.pop("module_hashes")
+            await repository.upsert_qa_cache(cache_row)
     except Exception as cache_err:
         if _is_missing_qa_cache_table_error(cache_err):
             print("QA intelligence cache table does not exist yet; skipping cache write.")
             return
         print(f"Failed to store QA intelligence cache for {prd_id}: {cache_err}")
 
-async def process_document(prd_id: str, file_bytes: bytes, filename: str):
+def _is_missing_content_hash_column_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return "content_hash" in message and ("does not exist" in message or "schema cache" in message or "column" in message)
+
+
+async def _find_completed_duplicate(content_hash: str) -> tuple[dict, dict] | None:
+    """Returns (prd, analysis row) of the newest completed PRD with identical content, if any."""
     try:
-        # 1. Extract text
-        print(f"Extracting text for PRD {prd_id}")
-        text = extract_text(file_bytes, filename)
-        
-        # 2. Analyze with OpenAI
-        print(f"Analyzing text for PRD {prd_id} with OpenAI")
-        analysis: AnalysisResultSchema = await analyze_prd_text(text)
-        
-        # 3. Store results
-        print(f"Storing results for PRD {prd_id}")
-        supabase.table("analysis_results").insert({
-            "prd_id": prd_id,
-            "standardized_prd": analysis.standardized_prd,
-            "quality_score": analysis.quality_score,
-            "missing_requirements": getattr(analysis, 'missing_requirements', []),
-            "qa_risk_insights": getattr(analysis, 'qa_risk_insights', [])
-        }).execute()
-
-        # 4. Update status to completed
-        supabase.table("prds").update({"status": "completed"}).eq("id", prd_id).execute()
-        print(f"Finished processing PRD {prd_id}")
+        source_prd = await repository.find_completed_prd_by_hash(content_hash)
+    except Exception as lookup_err:
+        if not _is_missing_content_hash_column_error(lookup_err):
+            print(f"Duplicate upload lookup failed: {lookup_err}")
+        return None
+    if not source_prd:
+        return None
+    source_analysis = await repository.get_analysis(source_prd["id"])
+    if not source_analysis:
+        return None
+    return source_prd, source_analysis
+
+
+async def _clone_completed_prd(source_prd: dict, source_analysis: dict, filename: str, content_hash: str, clone_test_cases: bool) -> dict | None:
+    """
+    Creates a completed PRD that shares the source's stored document and copies
+    its analysis (and test cases). Returns None when the copy fails; the partial
+    clone is removed so the caller can process the upload normally instead.
+    """
+    prd_record = (await repository.insert_prds([{
+        "user_id": ANON_USER_ID,
+        "filename": filename,
+        "storage_path": source_prd["storage_path"],
+        "content_hash": content_hash,
+        "status": "processing"
+    }]))[0]
+
+    try:
+        await repository.insert_analysis({
+            "prd_id": prd_record["id"],
+            **{field: source_analysis.get(field) for field in ANALYSIS_CLONE_FIELDS},
+            "test_cases_hash": source_analysis.get("test_cases_hash") if clone_test_cases else None,
+        })
+
+        if clone_test_cases:
+            source_test_cases = await repository.get_test_cases(source_prd["id"])
+            await repository.insert_test_cases([
+                {**{field: value for field, value in row.items() if field not in ("id", "prd_id", "created_at")}, "prd_id": prd_record["id"]}
+                for row in source_test_cases
+            ])
+
+        await repository.update_prd(prd_record["id"], {"status": "completed"})
+    except Exception as clone_err:
+        print(f"Failed to clone analysis of PRD {source_prd['id']}: {clone_err}")
+        try:
+            # analysis_results / test_cases rows copied so far go with it (ON DELETE CASCADE)
+            await repository.delete_prd(prd_record["id"])
+        except Exception as cleanup_err:
+            print(f"Failed to remove partial clone {prd_record['id']}: {cleanup_err}")
+            await mark_document_failed(prd_record["id"])
+        return None
+
+    prd_record["status"] = "completed"
+    print(f"Cloned analysis of PRD {source_prd['id']} into duplicate upload {prd_record['id']}")
+    return prd_record
+
+async def _store_upload(upload: SpooledUpload) -> tuple[str, bool]:
+    """Uploads the spooled document to Supabase Storage. Returns (storage_path, stored)."""
+    storage_path = f"{ANON_USER_ID}/{uuid.uuid4()}_{upload.filename}"
+    # Try to upload to Supabase Storage (may fail if storage RLS is strict)
+    try:
+        await repository.upload_document(storage_path, upload.path)
+        return storage_path, True
+    except Exception as storage_err:
+        print(f"Storage upload skipped (non-critical): {storage_err}")
+        return storage_path, False
+
+
+def _new_prd_row(upload: SpooledUpload, storage_path: str) -> dict:
+    return {
+        "user_id": ANON_USER_ID,
+        "filename": upload.filename,
+        "storage_path": storage_path,
+        "content_hash": upload.sha256,
+        "status": "processing"
+    }
+
+
+async def _insert_prd_rows(prd_rows: list[dict]) -> list[dict]:
+    try:
+        return await repository.insert_prds(prd_rows)
+    except Exception as insert_err:
+        if not _is_missing_content_hash_column_error(insert_err):
+            raise
+        print("prds.content_hash column does not exist yet; storing PRDs without it.")
+        for prd_row in prd_rows:
+            prd_row.pop("content_hash", None)
+        return await repository.insert_prds(prd_rows)
+
+
+def _prd_response(prd_record: dict) -> PRDResponse:
+    return PRDResponse(
+        id=prd_record['id'],
+        filename=prd_record['filename'],
+        status=prd_record['status'],
+        created_at=prd_record['created_at']
+    )
 
-    except Exception as e:
-        print(f"Error processing document: {e}")
-        supabase.table("prds").update({"status": "failed"}).eq("id", prd_id).execute()
 
 @router.post("/analyze", response_model=PRDResponse)
 async def upload_and_analyze(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
+    clone_test_cases: bool = True,
 ):
-    if not file.filename.lower().endswith(('.pdf', '.md', '.docx')):
-         raise HTTPException(status_code=400, detail="Only .pdf, .docx, and .md files are supported")
+    """
+    Accepts one document as the multipart field `file`. The body is parsed as
+    it arrives, so oversized or mistyped uploads are refused without being
+    received in full. Follow the analysis on /prds/{id}/analysis/stream.
+    """
+    try:
+        uploads, _ = await spool_multipart_uploads(
+            request,
+            "file",
+            max_files=1,
+            max_body_bytes=settings.upload_max_bytes + UPLOAD_MULTIPART_OVERHEAD_BYTES,
+        )
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    upload = uploads[0]
 
-    file_bytes = await file.read()
-    
-    # Generate unique storage path
-    storage_path = f"{ANON_USER_ID}/{uuid.uuid4()}_{file.filename}"
-    
+    job_enqueued = False
     try:
-        # Try to upload to Supabase Storage (may fail if storage RLS is strict)
-        try:
-            supabase.storage.from_("prd_documents").upload(storage_path, file_bytes)
-        except Exception as storage_err:
-            print(f"Storage upload skipped (non-critical): {storage_err}")
-        
+        # Identical content that was already analyzed: reuse the stored document
+        # and copy the analysis instead of re-running extraction and the LLM.
+        duplicate = await _find_completed_duplicate(upload.sha256)
+        prd_record = await _clone_completed_prd(*duplicate, upload.filename, upload.sha256, clone_test_cases) if duplicate else None
+        if prd_record:
+            await pipeline_events.publish(prd_record['id'], "completed", deduplicated_from=duplicate[0]['id'])
+            return _prd_response(prd_record)
+
+        storage_path, _ = await _store_upload(upload)
+
         # Create database record (user_id is text to avoid FK constraint issues)
-        db_res = supabase.table("prds").insert({
-            "user_id": ANON_USER_ID,
-            "filename": file.filename,
-            "storage_path": storage_path,
-            "status": "processing"
-        }).execute()
-        
-        prd_record = db_res.data[0]
+        prd_record = (await _insert_prd_rows([_new_prd_row(upload, storage_path)]))[0]
         
-        # Background processing
-        background_tasks.add_task(process_document, prd_record['id'], file_bytes, file.filename)
+        # Queue processing for the workers
+        await job_queue.enqueue(
+            PROCESS_DOCUMENT_JOB,
+            {"prd_id": prd_record['id'], "filename": upload.filename, "spool_path": upload.path},
+        )
+        job_enqueued = True
+        await pipeline_events.publish(prd_record['id'], "queued")
         
-        return PRDResponse(
-            id=prd_record['id'],
-            filename=prd_record['filename'],
-            status=prd_record['status'],
-            created_at=prd_record['created_at']
+        return _prd_response(prd_record)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # The spooled file now belongs to the queued job; otherwise it is no longer needed.
+        if not job_enqueued:
+            discard_spooled_upload(upload.path)
+
+@router.post("/analyze/batch", response_model=BatchUploadResponse)
+async def upload_and_analyze_batch(
+    request: Request,
+    clone_test_cases: bool = True,
+):
+    """
+    Accepts several documents and/or .zip archives of documents as the
+    multipart field `files`. All new PRD rows are created with one insert and
+    processed by a single batch job that pipelines extraction and analysis;
+    files with identical content are analyzed once. Poll /batches/{batch_id}
+    for progress.
+    """
+    try:
+        spooled, rejected = await spool_multipart_uploads(request, "files", allow_zip=True, fail_fast=False)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    uploads: list[SpooledUpload] = []
+    try:
+        for index, upload in enumerate(spooled):
+            if upload.filename.lower().endswith(".zip"):
+                members, skipped = await spool_zip_members(upload, settings.batch_max_files - len(uploads))
+                uploads.extend(members)
+                rejected.extend(skipped)
+            elif len(uploads) >= settings.batch_max_files:
+                discard_spooled_upload(upload.path)
+                rejected.append({"filename": upload.filename, "detail": f"Batch is limited to {settings.batch_max_files} documents"})
+            else:
+                uploads.append(upload)
+    except BaseException:
+        for upload in uploads + spooled[index:]:
+            discard_spooled_upload(upload.path)
+        raise
+
+    # The spooled files of the documents handed to the batch job; the rest are discarded here.
+    job_spool_paths: set[str] = set()
+    try:
+        # Identical files in one batch are stored and analyzed once; the copies get
+        # their own PRD rows and receive the first one's analysis.
+        groups: dict[str, list[SpooledUpload]] = {}
+        for upload in uploads:
+            groups.setdefault(upload.sha256, []).append(upload)
+
+        semaphore = asyncio.Semaphore(max(1, settings.batch_upload_concurrency))
+
+        async def prepare_group(group: list[SpooledUpload]) -> tuple[list[dict], list[SpooledUpload], str | None]:
+            """Returns (cloned PRDs, uploads still to process, their shared storage_path)."""
+            async with semaphore:
+                cloned: list[dict] = []
+                duplicate = await _find_completed_duplicate(group[0].sha256)
+                if duplicate:
+                    for upload in group:
+                        prd_record = await _clone_completed_prd(*duplicate, upload.filename, upload.sha256, clone_test_cases)
+                        if not prd_record:
+                            break
+                        await pipeline_events.publish(prd_record['id'], "completed", deduplicated_from=duplicate[0]['id'])
+                        cloned.append(prd_record)
+                remaining = group[len(cloned):]
+                storage_path = (await _store_upload(remaining[0]))[0] if remaining else None
+                return cloned, remaining, storage_path
+
+        prepared = await asyncio.gather(*(prepare_group(group) for group in groups.values()))
+        prd_records = [prd_record for cloned, _, _ in prepared for prd_record in cloned]
+        pending = [(remaining, storage_path) for _, remaining, storage_path in prepared if remaining]
+
+        batch_id = None
+        if pending:
+            new_records = await _insert_prd_rows([
+                _new_prd_row(upload, storage_path) for remaining, storage_path in pending for upload in remaining
+            ])
+            records = iter(new_records)
+            documents = []
+            for remaining, _ in pending:
+                group_records = [next(records) for _ in remaining]
+                documents.append({
+                    "prd_id": group_records[0]['id'],
+                    "filename": remaining[0].filename,
+                    "spool_path": remaining[0].path,
+                    "duplicate_prd_ids": [prd_record['id'] for prd_record in group_records[1:]],
+                })
+            batch_id = await job_queue.enqueue(PROCESS_BATCH_JOB, {"documents": documents})
+            job_spool_paths = {document["spool_path"] for document in documents}
+            for prd_record in new_records:
+                await pipeline_events.publish(prd_record['id'], "queued", batch_id=batch_id)
+            prd_records.extend(new_records)
+
+        return BatchUploadResponse(
+            batch_id=batch_id,
+            prds=[_prd_response(prd_record) for prd_record in prd_records],
+            rejected=rejected,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for upload in uploads:
+            if upload.path not in job_spool_paths:
+                discard_spooled_upload(upload.path)
+
+@router.get("/batches/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(batch_id: str):
+    job = await job_queue.get(batch_id)
+    if job is None or job.kind != PROCESS_BATCH_JOB:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    try:
+        prd_ids = [
+            prd_id
+            for document in job.payload["documents"]
+            for prd_id in [document["prd_id"], *document.get("duplicate_prd_ids", [])]
+        ]
+        prd_rows = await repository.get_prds(prd_ids, columns="id, filename, status, created_at")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    prds_by_id = {prd["id"]: prd for prd in prd_rows}
+    prds = [_prd_response(prds_by_id[prd_id]) for prd_id in prd_ids if prd_id in prds_by_id]
+    completed = sum(1 for prd in prds if prd.status == "completed")
+    failed = sum(1 for prd in prds if prd.status == "failed")
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        job_status=job.status,
+        total=len(prds),
+        processing=len(prds) - completed - failed,
+        completed=completed,
+        failed=failed,
+        prds=prds,
+    )
+
+async def _pipeline_stage_events(prd_id: str | None = None):
+    """
+    Stage events, or None when a keep-alive is due. For one PRD, starts with its
+    latest event and ends once its pipeline finishes.
+    """
+    after_seq = None
+    if prd_id:
+        latest = await pipeline_events.latest_for_prd(prd_id)
+        if latest:
+            yield latest
+            if latest["stage"] in TERMINAL_STAGES:
+                return
+        # Resume right after the snapshot so events published meanwhile are not lost.
+        after_seq = latest["seq"] if latest else 0
+    async for event in pipeline_events.subscribe(prd_id, after_seq=after_seq):
+        if event is not None and event["stage"] == DRAFT_EVENT:
+            continue
+        yield event
+        if prd_id and event is not None and event["stage"] in TERMINAL_STAGES:
+            return
+
+
+async def _pipeline_event_stream(prd_id: str | None = None):
+    async for event in _pipeline_stage_events(prd_id):
+        yield ": keep-alive\n\n" if event is None else _format_sse_event("stage", event)
+
+@router.get("/prds/events")
+async def stream_pipeline_events():
+    """Stage events for every PRD pipeline (queued, extracting, analyzing, upgrading, storing, completed/failed)."""
+    return _sse_response(_pipeline_event_stream())
+
+def _encode_prd_cursor(prd: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([prd["created_at"], prd["id"]]).encode("utf-8")).decode("ascii")
+
+
+def _decode_prd_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, prd_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        # Both values end up inside a PostgREST filter, so only accept well-formed ones.
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        return created_at, str(uuid.UUID(prd_id))
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _prd_list_etag(prds: List[dict], next_cursor: str | None) -> str:
+    digest = hashlib.sha256()
+    for prd in prds:
+        digest.update(f"{prd['id']}\t{prd['status']}\t{prd['created_at']}\t{prd['filename']}\n".encode("utf-8"))
+    digest.update((next_cursor or "").encode("ascii"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
 
 @router.get("/prds", response_model=List[PRDResponse])
-async def list_prds():
+async def list_prds(
+    request: Request,
+    limit: int = Query(settings.prd_list_default_limit, ge=1, le=settings.prd_list_max_limit),
+    cursor: Optional[str] = None,
+    statuses: Optional[List[str]] = Query(None, alias="status"),
+):
+    """
+    Newest PRDs first, one page at a time. The body stays a plain list; the
+    cursor for the next page (if any) is returned in X-Next-Cursor. Responses
+    carry an ETag, and a matching If-None-Match gets an empty 304.
+    """
+    after = _decode_prd_cursor(cursor) if cursor else None
     try:
-        response = supabase.table("prds").select("*").order("created_at", desc=True).execute()
-        return [PRDResponse(**item) for item in response.data]
+        prds = await repository.list_prds(limit + 1, after=after, statuses=statuses, columns=PRD_LIST_COLUMNS)
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
 
+    next_cursor = _encode_prd_cursor(prds[limit - 1]) if len(prds) > limit else None
+    prds = prds[:limit]
+    etag = _prd_list_etag(prds, next_cursor)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # Rows are already projected to PRDResponse's fields.
+    return JSONResponse(content=prds, headers=headers)
+
 @router.get("/prds/{prd_id}", response_model=PRDDetailResponse)
 async def get_prd_detail(prd_id: str):
+    """Read-only: quality scores are finalized when an analysis is written (pipeline, refine, chat)."""
     try:
-        # Get PRD
-        prd_res = supabase.table("prds").select("*").eq("id", prd_id).execute()
-        if not prd_res.data:
+        prd, analysis_data = await repository.get_prd_with_analysis(prd_id)
+        if not prd:
             raise HTTPException(status_code=404, detail="PRD not found")
             
-        prd = prd_res.data[0]
         response_model = PRDDetailResponse(**prd)
-        
-        # If completed, get analysis
-        if prd['status'] == 'completed':
-             analysis_res = supabase.table("analysis_results").select("*").eq("prd_id", prd_id).execute()
-             if analysis_res.data:
-                 analysis_data = analysis_res.data[0]
-                 stored_score = int(analysis_data.get("quality_score") or 0)
-                 recalculated_score = calculate_dynamic_quality_score(
-                     standardized_prd=analysis_data.get("standardized_prd") or "",
-                     missing_requirements=analysis_data.get("missing_requirements") or [],
-                     qa_risk_insights=analysis_data.get("qa_risk_insights") or [],
-                     model_score=analysis_data.get("quality_score"),
-                 )
-                 recalculated_score = max(recalculated_score, stored_score, TARGET_FINAL_SCORE)
-                 if recalculated_score != analysis_data.get("quality_score"):
-                     supabase.table("analysis_results").update({
-                         "quality_score": recalculated_score
-                     }).eq("prd_id", prd_id).execute()
-                 analysis_data["quality_score"] = recalculated_score
-                 response_model.analysis = AnalysisResultSchema(**analysis_data)
+        if prd['status'] == 'completed' and analysis_data:
+            response_model.analysis = AnalysisResultSchema(**analysis_data)
                  
         return response_model
     except HTTPException:
@@ -243,23 +596,175 @@ async def get_prd_detail(prd_id: str):
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
 
+def _compressed_json_response(request: Request, payload: dict, headers: dict) -> Response:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    if len(body) >= WORKSPACE_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", "").lower():
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/prds/{prd_id}/workspace", response_model=PRDWorkspaceResponse)
+async def get_prd_workspace(
+    request: Request,
+    prd_id: str,
+    prd_version: Optional[str] = None,
+    analysis_version: Optional[str] = None,
+    test_cases_version: Optional[str] = None,
+    qa_intelligence_version: Optional[str] = None,
+):
+    """
+    Everything the viewer shows for one PRD: the PRD, its analysis, its test
+    cases and the cached QA intelligence when it is still valid for both. The
+    three lookups run concurrently. Each part carries a version hash; parts
+    whose *_version the client sends back unchanged are omitted.
+    """
+    try:
+        (prd, analysis_data), test_case_rows, qa_cache_record = await asyncio.gather(
+            repository.get_prd_with_analysis(prd_id),
+            repository.get_test_cases(prd_id),
+            _fetch_qa_intelligence_cache_record(prd_id),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not prd:
+        raise HTTPException(status_code=404, detail="PRD not found")
+
+    analysis = AnalysisResultSchema(**analysis_data) if prd["status"] == "completed" and analysis_data else None
+    test_cases = [TestCaseSchema(**item) for item in test_case_rows]
+    cached_intelligence = None
+    if analysis and test_cases:
+        cached_intelligence = _validate_cached_qa_intelligence(prd_id, qa_cache_record, *_qa_versions(analysis_data, test_case_rows))
+
+    parts = {
+        "prd": _dump_model(PRDResponse(**prd)),
+        "analysis": _dump_model(analysis) if analysis else None,
+        "test_cases": [_dump_model(test_case) for test_case in test_cases],
+        "qa_intelligence": _dump_model(cached_intelligence.intelligence) if cached_intelligence else None,
+    }
+    known_versions = {
+        "prd": prd_version,
+        "analysis": analysis_version,
+        "test_cases": test_cases_version,
+        "qa_intelligence": qa_intelligence_version,
+    }
+    payload = {"prd_id": prd_id, "versions": {}, "unchanged": []}
+    for name, part in parts.items():
+        payload[name] = part
+        if part is None:
+            continue
+        version = stable_hash(part)[:16]
+        payload["versions"][name] = version
+        if known_versions[name] == version:
+            payload["unchanged"].append(name)
+            payload[name] = None
+
+    etag = f'"{stable_hash(payload["versions"])[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return _compressed_json_response(request, payload, headers)
+
+
+@router.get("/prds/{prd_id}/analysis/stream")
+async def stream_prd_analysis(prd_id: str, regenerate: bool = False):
+    """
+    Server-Sent Events view of a PRD's analysis. Relays the worker's `status`
+    events per stage and `draft` events with the standardized PRD text as the
+    first analysis pass decodes it, then a final `analysis` event once the
+    scored result has been persisted (or `error` if the pipeline gave up).
+    A completed PRD is replayed from `analysis_results`; with `regenerate`, or
+    for a failed PRD, the document is queued for the workers again first.
+    """
+    try:
+        prd = await repository.get_prd(prd_id)
+        if not prd:
+            raise HTTPException(status_code=404, detail="PRD not found")
+
+        existing_analysis = None
+        if prd["status"] == "completed" and not regenerate:
+            analysis_data = await repository.get_analysis(prd_id)
+            if analysis_data:
+                existing_analysis = AnalysisResultSchema(**analysis_data)
+
+        if prd["status"] != "processing" and not existing_analysis:
+            await repository.update_prd(prd_id, {"status": "processing"})
+            await job_queue.enqueue(
+                PROCESS_DOCUMENT_JOB,
+                {"prd_id": prd_id, "filename": prd["filename"], "storage_path": prd["storage_path"], "regenerate": regenerate},
+            )
+            await pipeline_events.publish(prd_id, "queued")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        if existing_analysis:
+            yield _format_sse_event("analysis", _dump_model(existing_analysis))
+            return
+        async for chunk in _relay_pipeline_analysis(prd_id):
+            yield chunk
+
+    return _sse_response(event_stream())
+
+
+async def _relay_pipeline_analysis(prd_id: str):
+    """
+    The analysis of a PRD the workers are processing, from its pipeline events:
+    the current run is replayed first (so a late viewer gets the draft so far),
+    then followed until the stored result or the final failure.
+    """
+    current_run = await pipeline_events.current_run(prd_id)
+    after_seq = current_run[-1]["seq"] if current_run else 0
+
+    async def _events():
+        for event in current_run:
+            yield event
+        async for event in pipeline_events.subscribe(prd_id, after_seq=after_seq):
+            yield event
+
+    async for event in _events():
+        if event is None:
+            yield ": keep-alive\n\n"
+        elif event["stage"] == DRAFT_EVENT:
+            yield _format_sse_event("draft", event.get("text", ""))
+        elif event["stage"] == "completed":
+            analysis_data = await repository.get_analysis(prd_id)
+            if analysis_data:
+                yield _format_sse_event("analysis", _dump_model(AnalysisResultSchema(**analysis_data)))
+            else:
+                yield _format_sse_event("error", {"detail": "Analysis finished without a stored result"})
+            return
+        elif event["stage"] == "failed":
+            yield _format_sse_event("error", {"detail": event.get("error") or "Analysis failed"})
+            return
+        else:
+            yield _format_sse_event("status", event["stage"])
+
+@router.get("/prds/{prd_id}/events")
+async def stream_prd_pipeline_events(prd_id: str):
+    """Stage events for one PRD, starting with its latest; the stream ends once the pipeline finishes."""
+    return _sse_response(_pipeline_event_stream(prd_id))
+
 @router.delete("/prds/{prd_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_prd(prd_id: str):
     try:
-        prd_res = supabase.table("prds").select("id, storage_path").eq("id", prd_id).execute()
-        if not prd_res.data:
+        prd = await repository.get_prd(prd_id, columns="id, storage_path")
+        if not prd:
             raise HTTPException(status_code=404, detail="PRD not found")
 
-        prd = prd_res.data[0]
         storage_path = prd.get("storage_path")
 
-        if storage_path:
+        # Deduplicated uploads share the stored document; keep it while others use it.
+        if storage_path and not await repository.storage_path_shared(storage_path, prd_id):
             try:
-                supabase.storage.from_("prd_documents").remove([storage_path])
+                await repository.remove_document(storage_path)
             except Exception as storage_err:
                 print(f"Storage delete skipped (non-critical): {storage_err}")
 
-        supabase.table("prds").delete().eq("id", prd_id).execute()
+        await repository.delete_prd(prd_id)
         return None
     except HTTPException:
         raise
@@ -267,23 +772,22 @@ async def delete_prd(prd_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/prds/{prd_id}/refine", response_model=PRDDetailResponse)
-async def refine_prd(prd_id: str, request: RefinementRequest):
+async def refine_prd(prd_id: str, request: RefinementRequest, regenerate: bool = False):
+    """`regenerate` asks the model again instead of reusing a cached answer to the same instruction."""
     try:
         # 1. Get current PRD and analysis
-        prd_res = supabase.table("prds").select("*").eq("id", prd_id).execute()
-        if not prd_res.data:
+        if not await repository.get_prd(prd_id, columns="id"):
             raise HTTPException(status_code=404, detail="PRD not found")
             
-        analysis_res = supabase.table("analysis_results").select("*").eq("prd_id", prd_id).execute()
-        if not analysis_res.data:
+        current_analysis = await repository.get_analysis(prd_id)
+        if not current_analysis:
             raise HTTPException(status_code=400, detail="PRD has no analysis to refine")
-            
-        current_analysis = analysis_res.data[0]
         
         # 2. Call refinement logic
         new_analysis: AnalysisResultSchema = await refine_prd_text(
             current_analysis['standardized_prd'], 
-            request.instruction
+            request.instruction,
+            use_cache=not regenerate,
         )
 
         current_score = int(current_analysis.get("quality_score") or 0)
@@ -321,13 +825,13 @@ async def refine_prd(prd_id: str, request: RefinementRequest):
         new_analysis.quality_score = adjusted_score
         
         # 3. Update database
-        supabase.table("analysis_results").update({
+        await repository.update_analysis(prd_id, {
             "standardized_prd": new_analysis.standardized_prd,
             "quality_score": new_analysis.quality_score,
             "missing_requirements": getattr(new_analysis, 'missing_requirements', []),
-            "qa_risk_insights": getattr(new_analysis, 'qa_risk_insights', [])
-        }).eq("prd_id", prd_id).execute()
-        _invalidate_qa_intelligence_cache(prd_id)
+            "qa_risk_insights": getattr(new_analysis, 'qa_risk_insights', []),
+            "prd_hash": compute_prd_hash(new_analysis.standardized_prd),
+        })
         
         # 4. Return updated PRD detail
         return await get_prd_detail(prd_id)
@@ -336,84 +840,92 @@ async def refine_prd(prd_id: str, request: RefinementRequest):
         print(f"Error refining PRD: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/prds/{prd_id}/chat", response_model=ChatResponse)
-async def chat_prd(prd_id: str, request: ChatRequest):
-    try:
-        # 1. Get current PRD and analysis
-        prd_res = supabase.table("prds").select("*").eq("id", prd_id).execute()
-        if not prd_res.data:
-            raise HTTPException(status_code=404, detail="PRD not found")
+async def _load_chat_analysis(prd_id: str) -> dict:
+    if not await repository.get_prd(prd_id, columns="id"):
+        raise HTTPException(status_code=404, detail="PRD not found")
 
-        analysis_res = supabase.table("analysis_results").select("*").eq("prd_id", prd_id).execute()
-        if not analysis_res.data:
-            raise HTTPException(status_code=400, detail="PRD has no analysis yet")
+    current_analysis = await repository.get_analysis(prd_id)
+    if not current_analysis:
+        raise HTTPException(status_code=400, detail="PRD has no analysis yet")
 
-        current_analysis = analysis_res.data[0]
-        current_prd_text = current_analysis.get("standardized_prd", "")
+    return current_analysis
 
-        # 2. Call the chat function that classifies intent
-        chat_result = await chat_with_prd(current_prd_text, request.message)
 
-        action = chat_result["action"]
-        ai_message = chat_result["message"]
-        new_analysis = chat_result.get("analysis")
-
-        response_analysis = None
-
-        # 3. If the AI decided to update, persist changes
-        if action == "update" and new_analysis:
-            current_score = int(current_analysis.get("quality_score") or 0)
-            current_missing_count = len(current_analysis.get("missing_requirements") or [])
-            new_missing_count = len(new_analysis.missing_requirements or [])
-            new_risks = new_analysis.qa_risk_insights or []
-            previous_prd_text = current_analysis.get("standardized_prd") or ""
-            previous_bullet_count = _count_markdown_bullets(previous_prd_text)
-            new_bullet_count = _count_markdown_bullets(new_analysis.standardized_prd or "")
-            added_bullets = max(0, new_bullet_count - previous_bullet_count)
-
-            # Recalculate score from scratch based on new content
-            adjusted_score = calculate_dynamic_quality_score(
-                standardized_prd=new_analysis.standardized_prd,
-                missing_requirements=new_analysis.missing_requirements or [],
-                qa_risk_insights=new_risks,
-                model_score=new_analysis.quality_score,
-            )
+async def _apply_chat_result(prd_id: str, current_analysis: dict, chat_result: dict) -> ChatResponse:
+    action = chat_result["action"]
+    ai_message = chat_result["message"]
+    new_analysis = chat_result.get("analysis")
+
+    response_analysis = None
+
+    # If the AI decided to update, persist changes
+    if action == "update" and new_analysis:
+        current_score = int(current_analysis.get("quality_score") or 0)
+        current_missing_count = len(current_analysis.get("missing_requirements") or [])
+        new_missing_count = len(new_analysis.missing_requirements or [])
+        new_risks = new_analysis.qa_risk_insights or []
+        previous_prd_text = current_analysis.get("standardized_prd") or ""
+        previous_bullet_count = _count_markdown_bullets(previous_prd_text)
+        new_bullet_count = _count_markdown_bullets(new_analysis.standardized_prd or "")
+        added_bullets = max(0, new_bullet_count - previous_bullet_count)
 
-            # Never penalize score if missing requirements didn't get worse
-            if new_missing_count <= current_missing_count:
-                adjusted_score = max(adjusted_score, current_score)
+        # Recalculate score from scratch based on new content
+        adjusted_score = calculate_dynamic_quality_score(
+            standardized_prd=new_analysis.standardized_prd,
+            missing_requirements=new_analysis.missing_requirements or [],
+            qa_risk_insights=new_risks,
+            model_score=new_analysis.quality_score,
+        )
 
-            # Boost score when missing requirements are resolved
-            if new_missing_count < current_missing_count:
-                improvement = (current_missing_count - new_missing_count) * 6
-                adjusted_score = max(adjusted_score, min(100, current_score + improvement))
+        # Never penalize score if missing requirements didn't get worse
+        if new_missing_count <= current_missing_count:
+            adjusted_score = max(adjusted_score, current_score)
 
-            # Big boost if ALL missing requirements are now resolved
-            if current_missing_count > 0 and new_missing_count == 0:
-                adjusted_score = max(adjusted_score, 90)
+        # Boost score when missing requirements are resolved
+        if new_missing_count < current_missing_count:
+            improvement = (current_missing_count - new_missing_count) * 6
+            adjusted_score = max(adjusted_score, min(100, current_score + improvement))
 
-            # Boost if user added substantial requirement detail (new bullets)
-            if current_missing_count > 0 and added_bullets >= 2:
-                adjusted_score = max(adjusted_score, min(100, current_score + min(10, added_bullets)))
+        # Big boost if ALL missing requirements are now resolved
+        if current_missing_count > 0 and new_missing_count == 0:
+            adjusted_score = max(adjusted_score, 90)
 
-            adjusted_score = max(adjusted_score, TARGET_FINAL_SCORE)
-            new_analysis.quality_score = adjusted_score
+        # Boost if user added substantial requirement detail (new bullets)
+        if current_missing_count > 0 and added_bullets >= 2:
+            adjusted_score = max(adjusted_score, min(100, current_score + min(10, added_bullets)))
 
-            supabase.table("analysis_results").update({
-                "standardized_prd": new_analysis.standardized_prd,
-                "quality_score": new_analysis.quality_score,
-                "missing_requirements": new_analysis.missing_requirements,
-                "qa_risk_insights": new_analysis.qa_risk_insights,
-            }).eq("prd_id", prd_id).execute()
-            _invalidate_qa_intelligence_cache(prd_id)
+        adjusted_score = max(adjusted_score, TARGET_FINAL_SCORE)
+        new_analysis.quality_score = adjusted_score
 
-            response_analysis = new_analysis
+        await repository.update_analysis(prd_id, {
+            "standardized_prd": new_analysis.standardized_prd,
+            "quality_score": new_analysis.quality_score,
+            "missing_requirements": new_analysis.missing_requirements,
+            "qa_risk_insights": new_analysis.qa_risk_insights,
+            "prd_hash": compute_prd_hash(new_analysis.standardized_prd),
+        })
 
-        return ChatResponse(
-            action=action,
-            message=ai_message,
-            analysis=response_analysis,
-        )
+        response_analysis = new_analysis
+
+    return ChatResponse(
+        action=action,
+        message=ai_message,
+        analysis=response_analysis,
+    )
+
+
+@router.post("/prds/{prd_id}/chat", response_model=ChatResponse)
+async def chat_prd(prd_id: str, request: ChatRequest):
+    try:
+        # 1. Get current PRD and analysis
+        current_analysis = await _load_chat_analysis(prd_id)
+        current_prd_text = current_analysis.get("standardized_prd", "")
+
+        # 2. Call the chat function that classifies intent
+        chat_result = await chat_with_prd(current_prd_text, request.message)
+
+        # 3. Persist any PRD update and build the response
+        return await _apply_chat_result(prd_id, current_analysis, chat_result)
 
     except HTTPException:
         raise
@@ -421,42 +933,78 @@ async def chat_prd(prd_id: str, request: ChatRequest):
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/prds/{prd_id}/chat/stream")
+async def chat_prd_stream(prd_id: str, request: ChatRequest):
+    """
+    Server-Sent Events variant of /chat. Emits `token` events with raw model
+    deltas, `message` events with the decoded reply text as it arrives, and a
+    final `result` event carrying the persisted ChatResponse.
+    """
+    try:
+        current_analysis = await _load_chat_analysis(prd_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    current_prd_text = current_analysis.get("standardized_prd", "")
+
+    async def event_stream():
+        try:
+            chat_result = None
+            async for event, payload in stream_chat_with_prd(current_prd_text, request.message):
+                if event == "result":
+                    chat_result = payload
+                else:
+                    yield _format_sse_event(event, payload)
+
+            chat_response = await _apply_chat_result(prd_id, current_analysis, chat_result)
+            yield _format_sse_event("result", _dump_model(chat_response))
+        except Exception as e:
+            print(f"Error in chat stream: {e}")
+            yield _format_sse_event("error", {"detail": str(e)})
+
+    return _sse_response(event_stream())
+
 @router.post("/prds/{prd_id}/generate-test-cases", response_model=TestCaseListResponse)
-async def create_test_cases(prd_id: str):
+async def create_test_cases(prd_id: str, regenerate: bool = False):
+    """`regenerate` produces a fresh suite instead of the cached answer for the same PRD text."""
     try:
         # 1. Get PRD analysis
-        analysis_res = supabase.table("analysis_results").select("standardized_prd").eq("prd_id", prd_id).execute()
-        if not analysis_res.data:
+        analysis_data = await repository.get_analysis(prd_id, columns="standardized_prd")
+        if not analysis_data:
             raise HTTPException(status_code=400, detail="PRD has no analysis to generate test cases from")
             
-        prd_text = analysis_res.data[0]['standardized_prd']
-        
-        # 2. Generate test cases
-        print(f"Generating test cases for PRD {prd_id}...")
-        test_cases = await generate_test_cases(prd_text)
-        
-        if not test_cases:
-            raise HTTPException(status_code=500, detail="AI failed to generate test cases. Please try again.")
-            
-        # 3. Store in database
-        try:
-            # Delete existing test cases for this PRD first if any
-            supabase.table("test_cases").delete().eq("prd_id", prd_id).execute()
-            
-            insert_data = []
-            for tc in test_cases:
-                tc_dict = tc.model_dump() if hasattr(tc, 'model_dump') else tc.dict()
-                tc_dict['prd_id'] = prd_id
-                insert_data.append(tc_dict)
-                
-            supabase.table("test_cases").insert(insert_data).execute()
-            _invalidate_qa_intelligence_cache(prd_id)
-        except Exception as db_err:
-            print(f"Database error while saving test cases: {db_err}")
-            if "relation \"public.test_cases\" does not exist" in str(db_err):
-                 raise HTTPException(status_code=500, detail="Database table 'test_cases' is missing. Please run the SQL migration in Supabase.")
-            raise HTTPException(status_code=500, detail=f"Failed to save test cases to database: {str(db_err)}")
+        prd_text = analysis_data['standardized_prd']
         
+        # 2-3. Generate and store test cases. Concurrent requests for the same PRD
+        # content (double-clicks, several viewers) share one generation.
+        async def _generate_and_store() -> list[TestCaseSchema]:
+            # 2. Generate test cases
+            print(f"Generating test cases for PRD {prd_id}...")
+            test_cases = await generate_test_cases(prd_text, use_cache=not regenerate)
+
+            if not test_cases:
+                raise HTTPException(status_code=500, detail="AI failed to generate test cases. Please try again.")
+
+            # 3. Store in database, writing only the cases that changed
+            try:
+                changes = await persist_test_cases(prd_id, test_cases)
+                print(f"Stored test cases for PRD {prd_id}: {changes}")
+            except Exception as db_err:
+                print(f"Database error while saving test cases: {db_err}")
+                if "relation \"public.test_cases\" does not exist" in str(db_err):
+                     raise HTTPException(status_code=500, detail="Database table 'test_cases' is missing. Please run the SQL migration in Supabase.")
+                raise HTTPException(status_code=500, detail=f"Failed to save test cases to database: {str(db_err)}")
+
+            return test_cases
+
+        test_cases = await generation_flights.run(
+            ("test_cases", prd_id, compute_prd_hash(prd_text), regenerate),
+            _generate_and_store,
+        )
+
         return TestCaseListResponse(prd_id=prd_id, test_cases=test_cases)
         
     except HTTPException:
@@ -468,40 +1016,78 @@ async def create_test_cases(prd_id: str):
 @router.get("/prds/{prd_id}/test-cases", response_model=TestCaseListResponse)
 async def get_test_cases(prd_id: str):
     try:
-        res = supabase.table("test_cases").select("*").eq("prd_id", prd_id).execute()
-        test_cases = [TestCaseSchema(**item) for item in res.data]
+        test_cases = [TestCaseSchema(**item) for item in await repository.get_test_cases(prd_id)]
         return TestCaseListResponse(prd_id=prd_id, test_cases=test_cases)
     except Exception as e:
         print(f"Error fetching test cases: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _load_analysis_versions(prd_id: str) -> dict | None:
+    """The analysis row's version stamps ({} when the columns are not migrated yet), or None without an analysis."""
+    try:
+        return await repository.get_analysis(prd_id, columns="prd_hash, test_cases_hash")
+    except Exception as version_err:
+        if "prd_hash" not in str(version_err) and "test_cases_hash" not in str(version_err):
+            raise
+        return {} if await repository.get_analysis(prd_id, columns="id") else None
+
+
 @router.get("/prds/{prd_id}/qa-intelligence", response_model=QAIntelligenceResponse)
 async def get_qa_intelligence(prd_id: str, regenerate: bool = False):
     try:
-        analysis_res = supabase.table("analysis_results").select("standardized_prd").eq("prd_id", prd_id).execute()
-        if not analysis_res.data:
+        # The version stamps are enough to validate the cache; content is only loaded to generate.
+        versions = await _load_analysis_versions(prd_id)
+        if versions is None:
             raise HTTPException(status_code=400, detail="PRD has no analysis to evaluate")
+        prd_hash, test_cases_hash = versions.get("prd_hash"), versions.get("test_cases_hash")
+
+        if not regenerate and prd_hash and test_cases_hash:
+            cached_response = await _load_cached_qa_intelligence(prd_id, prd_hash, test_cases_hash)
+            if cached_response:
+                return cached_response
 
-        standardized_prd = analysis_res.data[0]["standardized_prd"]
-        test_case_res = supabase.table("test_cases").select("*").eq("prd_id", prd_id).execute()
-        test_cases = [TestCaseSchema(**item) for item in test_case_res.data]
+        analysis_data = await repository.get_analysis(prd_id, columns="standardized_prd")
+        if not analysis_data:
+            raise HTTPException(status_code=400, detail="PRD has no analysis to evaluate")
+        standardized_prd = analysis_data["standardized_prd"]
+        test_case_rows = await repository.get_test_cases(prd_id)
+        test_cases = [TestCaseSchema(**item) for item in test_case_rows]
         if not test_cases:
             raise HTTPException(status_code=400, detail="Generate test cases before requesting QA intelligence")
 
-        prd_hash = _compute_content_hash(standardized_prd)
-        test_cases_hash = _compute_test_cases_hash(test_cases)
-
-        if not regenerate:
-            cached_response = _load_cached_qa_intelligence(prd_id, prd_hash, test_cases_hash)
-            if cached_response:
-                return cached_response
+        if not (prd_hash and test_cases_hash):
+            # Analysis predates the version stamps: hash once and store them.
+            prd_hash, test_cases_hash = _qa_versions(analysis_data, test_case_rows)
+            try:
+                await repository.update_analysis(prd_id, {"prd_hash": prd_hash, "test_cases_hash": test_cases_hash})
+            except Exception as stamp_err:
+                print(f"Failed to store QA versions for {prd_id}: {stamp_err}")
+            if not regenerate:
+                cached_response = await _load_cached_qa_intelligence(prd_id, prd_hash, test_cases_hash)
+                if cached_response:
+                    return cached_response
+
+        async def _generate_and_store() -> QAIntelligenceSchema:
+            # The stale cache row is kept across edits: modules whose PRD sections
+            # and test cases did not change reuse its entries (unless forced).
+            previous_record = None if regenerate else await _fetch_qa_intelligence_cache_record(prd_id)
+            intelligence = await generate_qa_intelligence(
+                standardized_prd,
+                test_cases,
+                use_cache=not regenerate,
+                previous=_parse_cached_qa_intelligence(prd_id, previous_record),
+                previous_module_hashes=(previous_record or {}).get("module_hashes"),
+            )
+            await _store_qa_intelligence_cache(
+                prd_id, prd_hash, test_cases_hash, intelligence, qa_module_hashes(standardized_prd, test_cases)
+            )
+            return intelligence
 
-        intelligence = await generate_qa_intelligence(
-            standardized_prd,
-            test_cases,
+        intelligence = await generation_flights.run(
+            ("qa_intelligence", prd_id, prd_hash, test_cases_hash, regenerate),
+            _generate_and_store,
         )
-        _store_qa_intelligence_cache(prd_id, prd_hash, test_cases_hash, intelligence)
         return QAIntelligenceResponse(prd_id=prd_id, intelligence=intelligence, cached=False)
     except HTTPException:
         raise
@@ -511,13 +1097,16 @@ async def get_qa_intelligence(prd_id: str, regenerate: bool = False):
 
 
 @router.post("/prds/{prd_id}/automation-script", response_model=AutomationScriptResponse)
-async def create_automation_script(prd_id: str, request: AutomationScriptRequest):
+async def create_automation_script(prd_id: str, request: AutomationScriptRequest, regenerate: bool = False):
+    """`regenerate` produces a fresh script instead of the cached answer for the same request."""
     try:
-        prd_res = supabase.table("prds").select("id").eq("id", prd_id).execute()
-        if not prd_res.data:
+        if not await repository.get_prd(prd_id, columns="id"):
             raise HTTPException(status_code=404, detail="PRD not found")
 
-        return await generate_automation_script(request)
+        return await generation_flights.run(
+            ("automation_script", prd_id, stable_hash(_dump_model(request)), regenerate),
+            lambda: generate_automation_script(request, use_cache=not regenerate),
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -1,3 +1,5 @@
+from typing import Any
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +9,113 @@ class Settings(BaseSettings):
     openai_api_key: str
     huggingface_api_key: str
 
+    # LLM backend: "huggingface", "openai" (OpenAI-compatible HTTP server),
+    # "replay" (serve recordings offline) or "record" (call upstream and save)
+    llm_backend: str = "huggingface"
+    llm_model: str = "Qwen/Qwen2.5-Coder-32B-Instruct"
+    # Optional smaller/faster model for lightweight tasks, plus per-task overrides
+    # of model, temperature and latency_slo_seconds (see app/services/llm_routing.py)
+    llm_small_model: str = ""
+    llm_task_routes: dict[str, dict[str, Any]] = {}
+    llm_openai_base_url: str = "http://localhost:8080/v1"
+    llm_openai_api_key: str = ""
+    llm_record_upstream: str = "huggingface"
+    llm_replay_dir: str = ".llm_recordings"
+    llm_replay_strict: bool = False
+    llm_replay_latency_base_seconds: float = 0.5
+    llm_replay_latency_per_token_seconds: float = 0.02
+    llm_replay_latency_jitter: float = 0.1
+
+    # LLM response cache (in-process LRU + on-disk tier)
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 256
+    llm_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    llm_cache_dir: str = ".llm_cache"
+
+    # Inference scheduler: concurrent request slots and token budget (0 = unlimited)
+    llm_max_concurrency: int = 4
+    llm_tokens_per_minute: int = 0
+
+    # Adaptive max_tokens per prompt type (disable to use the fixed historical budgets)
+    llm_adaptive_max_tokens: bool = True
+    llm_max_output_tokens: int = 8192
+
+    # Inference resilience: deadlines, retries, hedged requests and circuit breaker.
+    # Each task has its own deadline (see app/services/llm_routing.py), capped at
+    # llm_request_deadline_seconds.
+    llm_request_deadline_seconds: float = 300
+    llm_attempt_timeout_seconds: float = 150
+    llm_stream_idle_timeout_seconds: float = 60
+    llm_max_retries: int = 2
+    llm_retry_base_backoff_seconds: float = 1.0
+    llm_retry_max_backoff_seconds: float = 20.0
+    llm_hedge_enabled: bool = False
+    llm_hedge_min_samples: int = 20
+    llm_circuit_failure_threshold: int = 5
+    llm_circuit_reset_seconds: float = 30
+    analysis_pipeline_deadline_seconds: float = 1200
+
+    # Parallel test case generation across PRD sections
+    test_case_shard_concurrency: int = 4
+
+    # Map-reduce analysis for source documents beyond the single-pass token budget
+    analysis_single_pass_max_tokens: int = 12000
+    analysis_chunk_tokens: int = 6000
+    analysis_chunk_overlap_tokens: int = 300
+    analysis_map_concurrency: int = 4
+
+    # Uploads are streamed to upload_spool_dir (shared with the workers) up to this size
+    upload_max_bytes: int = 50 * 1024 * 1024
+    upload_spool_dir: str = ".upload_spool"
+
+    # Batch uploads (/analyze/batch): document count and archive size caps, concurrent
+    # storage uploads / duplicate lookups while accepting a batch, and the
+    # extraction -> analysis pipeline shape (extracted texts buffered, analysis workers)
+    batch_max_files: int = 300
+    batch_max_archive_bytes: int = 500 * 1024 * 1024
+    batch_upload_concurrency: int = 8
+    batch_pipeline_depth: int = 2
+    batch_analysis_concurrency: int = 2
+
+    # Process pool for CPU-bound document parsing (0 workers = one per core)
+    extraction_pool_workers: int = 0
+    extraction_cpu_seconds_limit: int = 60
+    extraction_memory_limit_mb: int = 1024
+    extraction_timeout_seconds: float = 120
+    # Split PDFs across the pool by page range (each worker gets at least this many pages)
+    pdf_parallel_extraction: bool = True
+    pdf_parallel_min_pages_per_worker: int = 10
+
+    # Durable job queue (SQLite) drained by `python -m app.worker`. Set
+    # job_embedded_workers > 0 to also run workers inside the API process.
+    job_queue_path: str = ".job_queue.sqlite3"
+    job_visibility_timeout_seconds: float = 120
+    job_max_attempts: int = 3
+    job_retry_backoff_seconds: float = 10
+    job_done_retention_seconds: float = 7 * 24 * 60 * 60
+    job_poll_interval_seconds: float = 1.0
+    job_worker_concurrency: int = 2
+    job_embedded_workers: int = 0
+
+    # Pipeline stage events (stored next to the job queue, pushed to the UI over SSE)
+    pipeline_events_poll_seconds: float = 0.5
+    pipeline_events_retention_seconds: float = 24 * 60 * 60
+    # The draft PRD text of a running analysis is published in chunks at most this often
+    pipeline_draft_publish_seconds: float = 0.5
+
+    # Supabase queries run on a bounded thread pool (kept below the client's
+    # httpx keep-alive pool so threads never wait on a connection)
+    db_max_concurrency: int = 16
+
+    # Read-through cache of prds / analysis_results / test_cases rows by prd_id
+    db_cache_enabled: bool = True
+    db_cache_max_entries: int = 1024
+    db_cache_ttl_seconds: float = 60
+
+    # GET /prds page size
+    prd_list_default_limit: int = 100
+    prd_list_max_limit: int = 500
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,361 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from supabase import Client
+
+from app.core.config import settings
+from app.core.database import supabase
+
+DOCUMENTS_BUCKET = "prd_documents"
+
+# PRDs still moving through the pipeline are updated by worker processes whose
+# writes never reach this process's cache, so only settled rows are cached.
+CACHEABLE_PRD_STATUSES = {"completed", "failed"}
+
+# Version stamps of an analysis row (see app/services/content_hashes.py)
+ANALYSIS_VERSION_COLUMNS = ("prd_hash", "test_cases_hash")
+
+
+def _is_missing_version_column_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(column in message for column in ANALYSIS_VERSION_COLUMNS) and (
+        "column" in message or "schema cache" in message
+    )
+
+
+def _project(row: dict, columns: str) -> dict:
+    if columns == "*":
+        return dict(row)
+    return {column.strip(): row.get(column.strip()) for column in columns.split(",")}
+
+
+class RecordCache:
+    """
+    In-process LRU of rows keyed by (table, prd_id), bounded by entry count and
+    TTL. Values are copied in and out so callers can mutate what they get.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def _count(self, table: str, outcome: str) -> None:
+        table_counters = self._counters.setdefault(table, {"hits": 0, "misses": 0, "invalidations": 0})
+        table_counters[outcome] += 1
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return [dict(row) for row in value] if isinstance(value, list) else dict(value)
+
+    def get(self, table: str, prd_id: str) -> Any | None:
+        key = (table, prd_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if self.ttl_seconds <= 0 or time.monotonic() - created_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._count(table, "hits")
+                return self._copy(value)
+            del self._entries[key]
+        self._count(table, "misses")
+        return None
+
+    def set(self, table: str, prd_id: str, value: Any) -> None:
+        key = (table, prd_id)
+        self._entries[key] = (time.monotonic(), self._copy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, prd_id: str, *tables: str) -> None:
+        for table in tables:
+            if self._entries.pop((table, prd_id), None) is not None:
+                self._count(table, "invalidations")
+
+    def stats(self) -> dict:
+        tables = {}
+        for table, counters in self._counters.items():
+            lookups = counters["hits"] + counters["misses"]
+            tables[table] = {**counters, "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else None}
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "tables": tables}
+
+
+class SupabaseRepository:
+    """
+    Async data access for the API and workers. The supabase client is
+    synchronous, so every query runs on a bounded thread pool instead of the
+    event loop; the client's shared httpx session keeps connections alive and
+    pooled across those threads (db_max_concurrency stays below its keep-alive
+    pool size). All table and storage access goes through the methods below.
+
+    prds, analysis_results, test_cases and qa_intelligence_cache rows are read
+    through an optional RecordCache keyed by prd_id; every write method below
+    invalidates the entries of the PRD it touches.
+    """
+
+    def __init__(self, client: Client, max_workers: int, cache: RecordCache | None = None):
+        self.client = client
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+        self._max_workers = max_workers
+        self._in_flight = 0
+        self._counters = {"queries": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+    async def run(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(function, *args, **kwargs)
+            )
+        except Exception:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_flight -= 1
+            self._counters["queries"] += 1
+            self._counters["total_seconds"] += elapsed
+            self._counters["max_seconds"] = max(self._counters["max_seconds"], elapsed)
+
+    async def execute(self, query) -> list[dict]:
+        response = await self.run(query.execute)
+        return response.data or []
+
+    async def _first(self, query) -> dict | None:
+        rows = await self.execute(query)
+        return rows[0] if rows else None
+
+    # prds
+
+    def _invalidate(self, prd_id: str, *tables: str) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(prd_id, *tables)
+
+    async def get_prd(self, prd_id: str, columns: str = "*") -> dict | None:
+        if self.cache is None:
+            return await self._first(self.client.table("prds").select(columns).eq("id", prd_id))
+        prd = self.cache.get("prds", prd_id)
+        if prd is None:
+            prd = await self._first(self.client.table("prds").select("*").eq("id", prd_id))
+            if prd is None:
+                return None
+            if prd.get("status") in CACHEABLE_PRD_STATUSES:
+                self.cache.set("prds", prd_id, prd)
+        return _project(prd, columns)
+
+    async def get_prds(self, prd_ids: list[str], columns: str = "*") -> list[dict]:
+        return await self.execute(self.client.table("prds").select(columns).in_("id", prd_ids))
+
+    async def get_prd_with_analysis(self, prd_id: str) -> tuple[dict | None, dict | None]:
+        """The PRD row and its analysis row, fetched together with one embedded select."""
+        if self.cache is not None:
+            prd = self.cache.get("prds", prd_id)
+            analysis = self.cache.get("analysis_results", prd_id) if prd is not None else None
+            if prd is not None and (analysis is not None or prd["status"] != "completed"):
+                return prd, analysis
+
+        prd = await self._first(self.client.table("prds").select("*, analysis_results(*)").eq("id", prd_id))
+        if prd is None:
+            return None, None
+        embedded = prd.pop("analysis_results", None)
+        # analysis_results.prd_id is not unique, so PostgREST embeds a list
+        analysis = (embedded[0] if embedded else None) if isinstance(embedded, list) else embedded
+        if self.cache is not None:
+            if prd.get("status") in CACHEABLE_PRD_STATUSES:
+                self.cache.set("prds", prd_id, prd)
+            if analysis is not None:
+                self.cache.set("analysis_results", prd_id, analysis)
+        return prd, analysis
+
+    async def list_prds(
+        self,
+        limit: int,
+        after: tuple[str, str] | None = None,
+        statuses: list[str] | None = None,
+        columns: str = "*",
+    ) -> list[dict]:
+        """Newest first, keyset-paginated on (created_at, id); `after` is the last row of the previous page."""
+        query = self.client.table("prds").select(columns)
+        if statuses:
+            query = query.in_("status", statuses)
+        if after:
+            created_at, prd_id = after
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{prd_id})')
+        return await self.execute(query.order("created_at", desc=True).order("id", desc=True).limit(limit))
+
+    async def insert_prds(self, rows: list[dict]) -> list[dict]:
+        return await self.execute(self.client.table("prds").insert(rows))
+
+    async def update_prd(self, prd_id: str, values: dict) -> None:
+        await self.execute(self.client.table("prds").update(values).eq("id", prd_id))
+        self._invalidate(prd_id, "prds")
+
+    async def delete_prd(self, prd_id: str) -> None:
+        # analysis_results, test_cases and qa_intelligence_cache rows go with it (ON DELETE CASCADE)
+        await self.execute(self.client.table("prds").delete().eq("id", prd_id))
+        self._invalidate(prd_id, "prds", "analysis_results", "test_cases", "qa_intelligence_cache")
+
+    async def find_completed_prd_by_hash(self, content_hash: str) -> dict | None:
+        return await self._first(
+            self.client.table("prds")
+            .select("id, storage_path")
+            .eq("content_hash", content_hash)
+            .eq("status", "completed")
+            .order("created_at", desc=True)
+            .limit(1)
+        )
+
+    async def storage_path_shared(self, storage_path: str, excluding_prd_id: str) -> bool:
+        rows = await self.execute(
+            self.client.table("prds").select("id").eq("storage_path", storage_path).neq("id", excluding_prd_id).limit(1)
+        )
+        return bool(rows)
+
+    # analysis_results
+
+    async def get_analysis(self, prd_id: str, columns: str = "*") -> dict | None:
+        if self.cache is None:
+            return await self._first(self.client.table("analysis_results").select(columns).eq("prd_id", prd_id))
+        analysis = self.cache.get("analysis_results", prd_id)
+        if analysis is None:
+            analysis = await self._first(self.client.table("analysis_results").select("*").eq("prd_id", prd_id))
+            if analysis is None:
+                return None
+            self.cache.set("analysis_results", prd_id, analysis)
+        return _project(analysis, columns)
+
+    async def _write_analysis(self, prd_id: str, build_query: Callable[[dict], Any], values: dict) -> None:
+        try:
+            await self.execute(build_query(values))
+        except Exception as write_err:
+            unversioned = {key: value for key, value in values.items() if key not in ANALYSIS_VERSION_COLUMNS}
+            if unversioned == values or not _is_missing_version_column_error(write_err):
+                raise
+            print("analysis_results version columns do not exist yet; storing the analysis without them.")
+            if any(key != "prd_id" for key in unversioned):
+                await self.execute(build_query(unversioned))
+        finally:
+            self._invalidate(prd_id, "analysis_results")
+
+    async def insert_analysis(self, row: dict) -> None:
+        await self._write_analysis(row["prd_id"], lambda values: self.client.table("analysis_results").insert(values), row)
+
+    async def update_analysis(self, prd_id: str, values: dict) -> None:
+        await self._write_analysis(
+            prd_id, lambda row: self.client.table("analysis_results").update(row).eq("prd_id", prd_id), values
+        )
+
+    async def save_analysis(self, prd_id: str, values: dict) -> None:
+        """Update-or-insert of the PRD's single analysis row."""
+        if await self.get_analysis(prd_id, columns="id"):
+            await self.update_analysis(prd_id, values)
+        else:
+            await self.insert_analysis({"prd_id": prd_id, **values})
+
+    # test_cases
+
+    async def get_test_cases(self, prd_id: str) -> list[dict]:
+        if self.cache is None:
+            return await self.execute(self.client.table("test_cases").select("*").eq("prd_id", prd_id))
+        test_cases = self.cache.get("test_cases", prd_id)
+        if test_cases is None:
+            test_cases = await self.execute(self.client.table("test_cases").select("*").eq("prd_id", prd_id))
+            self.cache.set("test_cases", prd_id, test_cases)
+        return test_cases
+
+    async def insert_test_cases(self, rows: list[dict]) -> None:
+        if rows:
+            await self.execute(self.client.table("test_cases").insert(rows))
+            for prd_id in {row["prd_id"] for row in rows}:
+                self._invalidate(prd_id, "test_cases")
+
+    async def replace_test_cases(self, prd_id: str, rows: list[dict]) -> None:
+        await self.execute(self.client.table("test_cases").delete().eq("prd_id", prd_id))
+        self._invalidate(prd_id, "test_cases")
+        await self.insert_test_cases(rows)
+
+    async def sync_test_cases(self, prd_id: str, upserts: list[dict], delete_ids: list[str], test_cases_hash: str) -> None:
+        """
+        Deletes, upserts (on prd_id, case_key) and stamps the analysis's
+        test_cases_hash in one transaction via the sync_test_cases function.
+        """
+        try:
+            await self.run(
+                self.client.rpc(
+                    "sync_test_cases",
+                    {
+                        "p_prd_id": prd_id,
+                        "p_upserts": upserts,
+                        "p_delete_ids": delete_ids,
+                        "p_test_cases_hash": test_cases_hash,
+                    },
+                ).execute
+            )
+        finally:
+            self._invalidate(prd_id, "test_cases", "analysis_results")
+
+    # qa_intelligence_cache
+
+    async def get_qa_cache(self, prd_id: str, refresh: bool = False) -> dict | None:
+        """Read through the record cache; `refresh` skips a possibly stale entry."""
+        if self.cache is not None and not refresh:
+            cached = self.cache.get("qa_intelligence_cache", prd_id)
+            if cached is not None:
+                return cached
+        row = await self._first(self.client.table("qa_intelligence_cache").select("*").eq("prd_id", prd_id))
+        if self.cache is not None:
+            if row is None:
+                self.cache.invalidate(prd_id, "qa_intelligence_cache")
+            else:
+                self.cache.set("qa_intelligence_cache", prd_id, row)
+        return row
+
+    async def upsert_qa_cache(self, row: dict) -> None:
+        try:
+            rows = await self.execute(self.client.table("qa_intelligence_cache").upsert(row, on_conflict="prd_id"))
+        except Exception:
+            self._invalidate(row["prd_id"], "qa_intelligence_cache")
+            raise
+        if self.cache is not None:
+            self.cache.set("qa_intelligence_cache", row["prd_id"], rows[0] if rows else row)
+
+    # storage
+
+    async def upload_document(self, storage_path: str, local_path: str) -> None:
+        await self.run(self.client.storage.from_(DOCUMENTS_BUCKET).upload, storage_path, local_path)
+
+    async def download_document(self, storage_path: str) -> bytes:
+        return await self.run(self.client.storage.from_(DOCUMENTS_BUCKET).download, storage_path)
+
+    async def remove_document(self, storage_path: str) -> None:
+        await self.run(self.client.storage.from_(DOCUMENTS_BUCKET).remove, [storage_path])
+
+    def stats(self) -> dict:
+        queries = self._counters["queries"]
+        return {
+            "max_concurrency": self._max_workers,
+            "in_flight": self._in_flight,
+            "queries": queries,
+            "errors": self._counters["errors"],
+            "avg_seconds": round(self._counters["total_seconds"] / queries, 4) if queries else None,
+            "max_seconds": round(self._counters["max_seconds"], 4),
+            "record_cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+repository = SupabaseRepository(
+    supabase,
+    max_workers=settings.db_max_concurrency,
+    cache=(
+        RecordCache(settings.db_cache_max_entries, settings.db_cache_ttl_seconds)
+        if settings.db_cache_enabled
+        else None
+    ),
+)
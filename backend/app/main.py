@@ -1,3 +1,6 @@
+import asyncio
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -9,12 +12,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 from app.api.endpoints import router as api_router
+from app.core.config import settings
+from app.core.repository import repository
+from app.services.extraction_pool import extraction_pool
+from app.services.job_queue import job_queue
+from app.services.llm_cache import llm_cache
+from app.services.llm_resilience import llm_resilience
+from app.services.llm_routing import task_router
+from app.services.llm_scheduler import inference_scheduler
+from app.services.output_budget import output_estimator
+from app.services.pipeline_events import pipeline_events
+from app.services.single_flight import generation_flights
+from app.worker import worker_loop
+
+embedded_worker_tasks: list[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_embedded_workers():
+    # Convenience for single-process development; production runs `python -m app.worker`.
+    for index in range(settings.job_embedded_workers):
+        embedded_worker_tasks.append(asyncio.create_task(worker_loop(f"api-{os.getpid()}-{index}")))
+
+@app.on_event("shutdown")
+async def stop_embedded_workers():
+    for task in embedded_worker_tasks:
+        task.cancel()
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "llm_cache": llm_cache.stats(),
+        "llm_scheduler": inference_scheduler.stats(),
+        "llm_resilience": llm_resilience.stats(),
+        "llm_routing": task_router.stats(),
+        "single_flight": generation_flights.stats(),
+        "job_queue": await job_queue.stats(),
+        "extraction_pool": extraction_pool.stats(),
+        "pipeline_events": pipeline_events.stats(),
+        "output_budget": output_estimator.stats(),
+        "database": repository.stats(),
+    }
+
 app.include_router(api_router, prefix="/api/v1")
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 class AnalysisResultSchema(BaseModel):
@@ -13,6 +13,24 @@ class PRDResponse(BaseModel):
     status: str
     created_at: str
 
+class BatchRejectedFileSchema(BaseModel):
+    filename: str
+    detail: str
+
+class BatchUploadResponse(BaseModel):
+    batch_id: Optional[str] = None
+    prds: List[PRDResponse]
+    rejected: List[BatchRejectedFileSchema] = []
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    job_status: str
+    total: int
+    processing: int
+    completed: int
+    failed: int
+    prds: List[PRDResponse]
+
 class PRDDetailResponse(PRDResponse):
     analysis: Optional[AnalysisResultSchema] = None
 
@@ -87,6 +105,17 @@ class QAIntelligenceResponse(BaseModel):
     cached: bool = False
 
 
+class PRDWorkspaceResponse(BaseModel):
+    prd_id: str
+    # Content hash per part present; parts listed in `unchanged` matched the client's version and are omitted
+    versions: Dict[str, str]
+    unchanged: List[str] = []
+    prd: Optional[PRDResponse] = None
+    analysis: Optional[AnalysisResultSchema] = None
+    test_cases: Optional[List[TestCaseSchema]] = None
+    qa_intelligence: Optional[QAIntelligenceSchema] = None
+
+
 class AutomationScriptRequest(BaseModel):
     framework: str
     scenario: str
@@ -1,6 +1,15 @@
+import asyncio
+import hashlib
 import json
-from huggingface_hub import AsyncInferenceClient
+import time
+from typing import AsyncIterator, Awaitable, Callable
 from app.core.config import settings
+from app.services.llm_backends import Completion, create_llm_backend
+from app.services.llm_cache import compute_request_key, llm_cache
+from app.services.llm_resilience import LLMUnavailableError, llm_resilience
+from app.services.llm_routing import task_router
+from app.services.llm_scheduler import InferencePriority, inference_scheduler
+from app.services.output_budget import OutputBudget, estimate_tokens, output_estimator
 from app.models.schemas import (
     AnalysisResultSchema,
     AutomationScriptRequest,
@@ -14,7 +23,7 @@ from app.models.schemas import (
 )
 
 
-client = AsyncInferenceClient(token=settings.huggingface_api_key)
+llm_backend = create_llm_backend()
 TARGET_FINAL_SCORE = 85
 REQUIRED_SECTIONS = (
     "## Overview",
@@ -55,6 +64,27 @@ Here is the raw text to analyze:
 """
 
 
+ANALYSIS_MAX_REDUCE_ROUNDS = 2
+
+SOURCE_CHUNK_EXTRACTION_PROMPT = """
+You are an expert Business Analyst.
+The text below is part {part} of {total} of a longer PRD or BRD. Parts overlap slightly at their edges.
+Extract everything from THIS part that a product team needs to write a standardized PRD:
+- Product overview, background and context statements
+- Objectives and success metrics
+- Functional requirements: field names, buttons, validations, user flows and expected behavior
+- Explicit inclusions and exclusions
+- Open questions, ambiguities and constraints
+
+Rules:
+1. Preserve specific names, values and rules verbatim where possible.
+2. Do NOT invent requirements or summarize away detail.
+3. Use plain text with short headings and bullet points. No tables, no emojis, no JSON.
+
+Source Text (part {part} of {total}):
+{chunk}
+"""
+
 REFINE_PRD_PROMPT = """
 You are an expert Senior Product Manager and Software Architect.
 Current PRD Content:
@@ -120,34 +150,434 @@ You MUST return ONLY valid JSON using:
 }
 """
 
-async def analyze_prd_text(text: str) -> AnalysisResultSchema:
-    response = await client.chat_completion(
-        model="Qwen/Qwen2.5-Coder-32B-Instruct",
-        messages=[
-            {"role": "system", "content": "You are a highly capable Product Management AI assistant. Always return valid JSON."},
-            {"role": "user", "content": MASTER_PRD_ANALYSIS_PROMPT.replace("{text}", text)}
-        ],
-        max_tokens=4000,
-        temperature=0.2,
+def _build_request_payload(model: str, messages: list[dict[str, str]], max_tokens: int, temperature: float) -> dict:
+    return {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+
+
+def _estimate_request_tokens(request_payload: dict) -> int:
+    # Rough budget charge: ~4 characters per prompt token plus the full decode allowance.
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in request_payload["messages"])
+    return prompt_tokens + int(request_payload["max_tokens"])
+
+
+def _record_output_usage(task: str, budget: OutputBudget, completion: Completion) -> None:
+    # Backends that report no usage fall back to the character estimate.
+    output_tokens = completion.completion_tokens
+    if output_tokens is None:
+        output_tokens = estimate_tokens(completion.content)
+    output_estimator.record(task, budget, output_tokens, truncated=completion.truncated)
+
+
+async def _lookup_cached_completion(request_payload: dict, use_cache: bool) -> tuple[str | None, str | None]:
+    if not (use_cache and settings.llm_cache_enabled):
+        llm_cache.record_bypass()
+        return None, None
+    # max_tokens moves with the self-calibrating output budget, so it is left out of the
+    # key; completions that hit the budget are never cached, so any hit is a full answer.
+    cache_key = compute_request_key({key: value for key, value in request_payload.items() if key != "max_tokens"})
+    return cache_key, await llm_cache.get(cache_key)
+
+
+def _is_json_object(content: str) -> bool:
+    try:
+        return isinstance(json.loads(_clean_json_content(content)), dict)
+    except Exception:
+        return False
+
+
+def _is_json_array(content: str) -> bool:
+    try:
+        return isinstance(json.loads(_clean_json_content(content)), list)
+    except Exception:
+        return False
+
+
+async def _chat_completion(
+    messages: list[dict[str, str]],
+    budget: OutputBudget,
+    task: str,
+    use_cache: bool = True,
+    priority: InferencePriority = InferencePriority.ON_DEMAND,
+    deadline_seconds: float | None = None,
+    validate: Callable[[str], bool] | None = None,
+    model: str | None = None,
+) -> str:
+    """
+    Single entry point for every model call. The task's route picks the model,
+    temperature and deadline (`deadline_seconds` overrides the latter); identical
+    requests are answered from the LLM response cache; misses wait for a slot
+    from the inference scheduler at the given priority and then, holding it, run
+    under the retry/deadline/circuit-breaker policy of llm_resilience. When
+    `validate` rejects a small-model response, the call is escalated to LLM_MODEL.
+    """
+    route = task_router.resolve(task)
+    request_payload = _build_request_payload(model or route.model, messages, budget.max_tokens, route.temperature)
+    cache_key, cached_content = await _lookup_cached_completion(request_payload, use_cache)
+    if cached_content is not None:
+        return cached_content
+
+    async def _attempt(attempt_timeout: float) -> Completion:
+        return await asyncio.wait_for(llm_backend.complete(request_payload), timeout=attempt_timeout)
+
+    # The slot is taken before the deadline starts, so local queueing never counts as an
+    # upstream timeout (breaker failure, retry) and hedges share the caller's slot.
+    async with inference_scheduler.slot(priority, _estimate_request_tokens(request_payload)):
+        started_at = time.monotonic()
+        completion = await llm_resilience.call(
+            _attempt,
+            deadline_seconds=deadline_seconds if deadline_seconds is not None else route.deadline_seconds,
+        )
+        upstream_seconds = time.monotonic() - started_at
+    task_router.record_call(route, upstream_seconds)
+    content = completion.content
+    _record_output_usage(task, budget, completion)
+
+    if validate is not None and not validate(content):
+        escalation_model = task_router.escalation_model(request_payload["model"])
+        task_router.record_validation_failure(task, escalated=escalation_model is not None)
+        if escalation_model:
+            print(f"Escalating {task} from {request_payload['model']} to {escalation_model} after invalid output")
+            return await _chat_completion(
+                messages,
+                budget,
+                task,
+                use_cache=use_cache,
+                priority=priority,
+                deadline_seconds=deadline_seconds,
+                model=escalation_model,
+            )
+        return content
+
+    if cache_key and content.strip() and not completion.truncated:
+        await llm_cache.set(cache_key, content)
+    return content
+
+
+async def _stream_chat_completion(
+    messages: list[dict[str, str]],
+    budget: OutputBudget,
+    task: str,
+    use_cache: bool = True,
+    priority: InferencePriority = InferencePriority.ON_DEMAND,
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of _chat_completion: yields content deltas as the model
+    produces them. A cache hit is replayed as a single delta. Streams cannot be
+    escalated transparently; callers validate the joined output themselves.
+    """
+    route = task_router.resolve(task)
+    request_payload = _build_request_payload(route.model, messages, budget.max_tokens, route.temperature)
+    cache_key, cached_content = await _lookup_cached_completion(request_payload, use_cache)
+    if cached_content is not None:
+        yield cached_content
+        return
+
+    parts: list[str] = []
+    completion = Completion()
+    async with inference_scheduler.slot(priority, _estimate_request_tokens(request_payload)):
+        started_at = time.monotonic()
+        async for delta in llm_resilience.stream(lambda: llm_backend.open_stream(request_payload, completion)):
+            parts.append(delta)
+            yield delta
+        upstream_seconds = time.monotonic() - started_at
+
+    completion.content = "".join(parts)
+    task_router.record_call(route, upstream_seconds)
+    _record_output_usage(task, budget, completion)
+    if cache_key and completion.content.strip() and not completion.truncated:
+        await llm_cache.set(cache_key, completion.content)
+
+
+async def _escalate_invalid_stream(
+    content: str,
+    messages: list[dict[str, str]],
+    budget: OutputBudget,
+    task: str,
+    validate: Callable[[str], bool],
+    use_cache: bool = True,
+    priority: InferencePriority = InferencePriority.ON_DEMAND,
+) -> str:
+    """Re-runs a streamed request on LLM_MODEL (non-streaming) when its joined output fails validation."""
+    if validate(content):
+        return content
+    escalation_model = task_router.escalation_model(task_router.resolve(task).model)
+    task_router.record_validation_failure(task, escalated=escalation_model is not None)
+    if not escalation_model:
+        return content
+    print(f"Escalating streamed {task} to {escalation_model} after invalid output")
+    return await _chat_completion(
+        messages,
+        budget,
+        task,
+        use_cache=use_cache,
+        priority=priority,
+        model=escalation_model,
     )
-    initial_analysis = parse_huggingface_response(response.choices[0].message.content)
-    upgraded_analysis = await _upgrade_prd_quality(text, initial_analysis)
+
+
+class _StreamedJsonStringReader:
+    """
+    Incrementally decodes the string value of one top-level field from a JSON
+    document that is still being streamed, so its text can be shown as it arrives.
+    """
+
+    _ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", '"': '"', "\\": "\\", "/": "/"}
+
+    def __init__(self, field_name: str):
+        self._marker = f'"{field_name}"'
+        self._buffer = ""
+        self._cursor: int | None = None
+        self._search_from = 0
+        self._done = False
+
+    @staticmethod
+    def _decode_unicode_escape(buffer: str, index: int) -> tuple[str | None, int]:
+        """
+        Decodes the \\uXXXX escape at `index`, joining a UTF-16 surrogate pair into
+        one character (a lone surrogate would break UTF-8 encoding of the SSE
+        response, so it becomes U+FFFD). Returns (None, index) while incomplete.
+        """
+        if index + 6 > len(buffer):
+            return None, index
+        try:
+            code_point = int(buffer[index + 2:index + 6], 16)
+        except ValueError:
+            return "", index + 6
+        if 0xD800 <= code_point <= 0xDBFF:
+            following = buffer[index + 6:index + 12]
+            if len(following) < 6 and "\\u".startswith(following[:2]):
+                return None, index
+            if following.startswith("\\u"):
+                try:
+                    low_surrogate = int(following[2:], 16)
+                except ValueError:
+                    low_surrogate = -1
+                if 0xDC00 <= low_surrogate <= 0xDFFF:
+                    return chr(0x10000 + ((code_point - 0xD800) << 10) + (low_surrogate - 0xDC00)), index + 12
+            return "\ufffd", index + 6
+        if 0xDC00 <= code_point <= 0xDFFF:
+            return "\ufffd", index + 6
+        return chr(code_point), index + 6
+
+    @staticmethod
+    def _skip_whitespace(buffer: str, index: int) -> int:
+        while index < len(buffer) and buffer[index] in " \t\r\n":
+            index += 1
+        return index
+
+    def feed(self, delta: str) -> str:
+        if self._done:
+            return ""
+        self._buffer += delta
+        buffer = self._buffer
+
+        while self._cursor is None:
+            marker_index = buffer.find(self._marker, self._search_from)
+            if marker_index == -1:
+                return ""
+            index = self._skip_whitespace(buffer, marker_index + len(self._marker))
+            if index >= len(buffer):
+                return ""
+            if buffer[index] != ":":
+                # The field name quoted inside some other value, not the key
+                self._search_from = marker_index + 1
+                continue
+            index = self._skip_whitespace(buffer, index + 1)
+            if index >= len(buffer):
+                return ""
+            if buffer[index] != '"':
+                # null, a number, an object...: there is no string to stream
+                self._done = True
+                return ""
+            self._cursor = index + 1
+
+        decoded: list[str] = []
+        index = self._cursor
+        while index < len(buffer):
+            char = buffer[index]
+            if char == "\\":
+                if index + 1 >= len(buffer):
+                    break
+                escaped = buffer[index + 1]
+                if escaped == "u":
+                    text, index = self._decode_unicode_escape(buffer, index)
+                    if text is None:
+                        break
+                    decoded.append(text)
+                    continue
+                decoded.append(self._ESCAPES.get(escaped, escaped))
+                index += 2
+                continue
+            if char == '"':
+                self._done = True
+                index += 1
+                break
+            decoded.append(char)
+            index += 1
+
+        self._cursor = index
+        return "".join(decoded)
+
+
+def _build_analysis_messages(text: str) -> list[dict[str, str]]:
+    return [
+        {"role": "system", "content": "You are a highly capable Product Management AI assistant. Always return valid JSON."},
+        {"role": "user", "content": MASTER_PRD_ANALYSIS_PROMPT.replace("{text}", text)}
+    ]
+
+async def analyze_prd_text(
+    text: str,
+    use_cache: bool = True,
+    on_stage: Callable[..., Awaitable[None]] | None = None,
+    on_draft: Callable[[str], Awaitable[None]] | None = None,
+) -> AnalysisResultSchema:
+    """
+    `on_stage(stage, **detail)` is awaited as the pipeline moves between stages.
+    With `on_draft`, the first analysis pass is streamed and `on_draft(text)` is
+    awaited with each newly decoded piece of its "standardized_prd" field.
+    """
+    if _needs_condensing(text) and on_stage:
+        await on_stage("condensing", source_tokens=estimate_tokens(text))
+    text = await _condense_source_text(text, use_cache=use_cache, priority=InferencePriority.BACKGROUND)
+    if on_stage:
+        await on_stage("analyzing")
+    messages = _build_analysis_messages(text)
+    budget = output_estimator.estimate("analysis", input_tokens=estimate_tokens(text))
+    if on_draft is None:
+        raw_content = await _chat_completion(
+            messages=messages,
+            budget=budget,
+            use_cache=use_cache,
+            priority=InferencePriority.BACKGROUND,
+            task="analysis",
+            validate=_is_json_object,
+        )
+    else:
+        draft_reader = _StreamedJsonStringReader("standardized_prd")
+        parts: list[str] = []
+        async for delta in _stream_chat_completion(
+            messages=messages,
+            budget=budget,
+            use_cache=use_cache,
+            priority=InferencePriority.BACKGROUND,
+            task="analysis",
+        ):
+            parts.append(delta)
+            draft_delta = draft_reader.feed(delta)
+            if draft_delta:
+                await on_draft(draft_delta)
+        raw_content = await _escalate_invalid_stream(
+            "".join(parts),
+            messages,
+            budget,
+            task="analysis",
+            validate=_is_json_object,
+            use_cache=use_cache,
+            priority=InferencePriority.BACKGROUND,
+        )
+    initial_analysis = parse_huggingface_response(raw_content)
+    upgraded_analysis = await _upgrade_prd_quality(text, initial_analysis, use_cache=use_cache, on_stage=on_stage)
     return upgraded_analysis
 
-async def refine_prd_text(current_prd: str, instruction: str) -> AnalysisResultSchema:
+def _needs_condensing(text: str) -> bool:
+    return estimate_tokens(text) > settings.analysis_single_pass_max_tokens
+
+
+def _chunk_source_text(text: str, chunk_chars: int, overlap_chars: int) -> list[str]:
+    """Splits text into overlapping windows, preferring paragraph then line boundaries."""
+    chunks: list[str] = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            boundary = text.rfind("\n\n", start + chunk_chars // 2, end)
+            if boundary == -1:
+                boundary = text.rfind("\n", start + chunk_chars // 2, end)
+            if boundary != -1:
+                end = boundary
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return chunks
+
+
+async def _condense_source_text(
+    text: str,
+    use_cache: bool = True,
+    priority: InferencePriority = InferencePriority.BACKGROUND,
+) -> str:
+    """
+    Map-reduce front end for very long source documents. Text within the single-pass
+    token budget is returned unchanged; longer text is split into overlapping chunks
+    whose requirements are extracted in parallel and joined into condensed notes that
+    replace the raw text for the analysis and upgrade prompts.
+    """
+    for _ in range(ANALYSIS_MAX_REDUCE_ROUNDS):
+        if not _needs_condensing(text):
+            return text
+
+        chunks = _chunk_source_text(
+            text,
+            chunk_chars=settings.analysis_chunk_tokens * 4,
+            overlap_chars=settings.analysis_chunk_overlap_tokens * 4,
+        )
+        semaphore = asyncio.Semaphore(max(1, settings.analysis_map_concurrency))
+
+        async def _extract_chunk(index: int, chunk: str) -> str:
+            prompt = (
+                SOURCE_CHUNK_EXTRACTION_PROMPT
+                .replace("{part}", str(index + 1))
+                .replace("{total}", str(len(chunks)))
+                .replace("{chunk}", chunk)
+            )
+            async with semaphore:
+                return await _chat_completion(
+                    messages=[
+                        {"role": "system", "content": "You are a meticulous Business Analyst who extracts requirements without inventing any."},
+                        {"role": "user", "content": prompt},
+                    ],
+                    budget=output_estimator.estimate("chunk_extraction", input_tokens=estimate_tokens(chunk)),
+                    use_cache=use_cache,
+                    priority=priority,
+                    task="chunk_extraction",
+                )
+
+        print(f"Condensing {estimate_tokens(text)}-token source document in {len(chunks)} chunks")
+        extracted_notes = await asyncio.gather(
+            *(_extract_chunk(index, chunk) for index, chunk in enumerate(chunks))
+        )
+        text = "\n\n".join(
+            f"Requirements extracted from part {index + 1} of {len(chunks)}:\n{notes.strip()}"
+            for index, notes in enumerate(extracted_notes)
+            if notes.strip()
+        )
+
+    return text
+
+async def refine_prd_text(current_prd: str, instruction: str, use_cache: bool = True) -> AnalysisResultSchema:
     prompt = REFINE_PRD_PROMPT.replace("{current_prd}", current_prd).replace("{instruction}", instruction)
     
-    response = await client.chat_completion(
-        model="Qwen/Qwen2.5-Coder-32B-Instruct",
+    raw_content = await _chat_completion(
         messages=[
             {"role": "system", "content": "You are a helpful PM assistant specializing in PRD refinement. Always return valid JSON."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=4000,
-        temperature=0.2,
+        budget=output_estimator.estimate("refine", input_tokens=estimate_tokens(current_prd + instruction)),
+        use_cache=use_cache,
+        priority=InferencePriority.INTERACTIVE,
+        task="refine",
+        validate=_is_json_object,
     )
     
-    return parse_huggingface_response(response.choices[0].message.content)
+    return parse_huggingface_response(raw_content)
 
 
 CHAT_WITH_PRD_PROMPT = """
@@ -181,6 +611,37 @@ You MUST return ONLY a valid JSON object (no markdown formatting, no ```json):
 If action is "chat", set "updated_prd" to null.
 """
 
+CHAT_INTENT_PROMPT = """
+Classify the intent of the user's message to a PRD (Product Requirements Document) management tool.
+
+- "update": the user explicitly asks to UPDATE, ADD, REMOVE, MODIFY, or CHANGE something in the PRD.
+- "chat": anything else, including greetings, casual conversation and questions ABOUT the PRD content.
+
+User Message:
+{message}
+
+Return ONLY a valid JSON object (no markdown formatting): {"action": "chat"} or {"action": "update"}
+"""
+
+CHAT_ANSWER_PROMPT = """
+You are a smart AI assistant embedded in a PRD (Product Requirements Document) management tool.
+The user is chatting or asking a question; do NOT modify the PRD.
+
+Current PRD Content:
+{current_prd}
+
+User Message:
+{message}
+
+Answer conversationally. If the question is about the PRD, answer based on the PRD content above.
+
+You MUST return ONLY a valid JSON object (no markdown formatting, no ```json):
+{
+  "action": "chat",
+  "message": "(string) Your natural language response to the user."
+}
+"""
+
 TEST_CASE_GENERATION_PROMPT = """
 You are an expert QA Engineer and SDET.
 Your task is to generate a comprehensive set of test cases for the following Product Requirements Document (PRD).
@@ -227,6 +688,19 @@ PRD Content:
 {prd_text}
 """
 
+TEST_CASE_SHARD_MIN_CHARS = 1500
+
+TEST_CASE_SHARD_TEMPLATE = """
+NOTE: This is one part of a larger PRD. Generate test cases ONLY for the requirements under "Section To Cover".
+Use "Document Context" solely to understand the product; do not generate test cases for it.
+
+Document Context:
+{context}
+
+Section To Cover:
+{section}
+"""
+
 QA_INTELLIGENCE_PROMPT = """
 You are an expert QA architect and product quality analyst.
 
@@ -289,6 +763,7 @@ Rules:
 - Use short, concrete requirement statements.
 - Risk levels must be one of: High, Medium, Low.
 - If test coverage is weak, add recommended test scenarios.
+- Name modules after the test cases' feature_name values, one module per feature.
 
 PRD:
 {prd_text}
@@ -297,6 +772,12 @@ TEST CASES:
 {test_cases}
 """
 
+QA_INTELLIGENCE_CHANGED_MODULES_RULE = """
+Only the modules below changed since the last analysis; the PRD and test cases above are limited to them.
+Report on these modules alone, using exactly these names for module_name and risk area:
+{module_names}
+"""
+
 PLAYWRIGHT_AUTOMATION_SCRIPT_PROMPT = """
 You are a senior Playwright automation engineer writing production-quality UI tests for a real automation framework.
 
@@ -600,24 +1081,117 @@ The value of "code" must contain only runnable API automation code and nothing e
 """
 
 
-async def chat_with_prd(current_prd: str, message: str) -> dict:
+def _build_chat_messages(current_prd: str, message: str) -> list[dict[str, str]]:
+    prompt = CHAT_WITH_PRD_PROMPT.replace("{current_prd}", current_prd).replace("{message}", message)
+    return [
+        {"role": "system", "content": "You are a helpful AI assistant for a PRD tool. You can chat naturally AND update PRDs. Always return valid JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _build_chat_answer_messages(current_prd: str, message: str) -> list[dict[str, str]]:
+    prompt = CHAT_ANSWER_PROMPT.replace("{current_prd}", current_prd).replace("{message}", message)
+    return [
+        {"role": "system", "content": "You are a helpful AI assistant for a PRD tool. Always return valid JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _is_chat_intent(content: str) -> bool:
+    try:
+        data = json.loads(_clean_json_content(content))
+    except Exception:
+        return False
+    return isinstance(data, dict) and data.get("action") in {"chat", "update"}
+
+
+async def _classify_chat_intent(message: str, use_cache: bool = True) -> str:
+    if task_router.resolve("chat_intent").model == task_router.resolve("chat_update").model:
+        # No cheaper model to classify with: a separate round-trip would only add latency,
+        # and the combined prompt can still decide to only chat.
+        return "update"
+    raw_content = await _chat_completion(
+        messages=[
+            {"role": "system", "content": "You classify user intent for a PRD tool. Always return valid JSON."},
+            {"role": "user", "content": CHAT_INTENT_PROMPT.replace("{message}", message)},
+        ],
+        budget=output_estimator.estimate("chat_intent"),
+        use_cache=use_cache,
+        priority=InferencePriority.INTERACTIVE,
+        task="chat_intent",
+        validate=_is_chat_intent,
+    )
+    if not _is_chat_intent(raw_content):
+        # Fall back to the combined prompt, which can still decide to only chat.
+        return "update"
+    return json.loads(_clean_json_content(raw_content))["action"]
+
+
+def _chat_request(current_prd: str, message: str, intent: str) -> dict:
+    """Messages, budget, route and validator for the reply call chosen by the intent."""
+    if intent == "update":
+        return {
+            "messages": _build_chat_messages(current_prd, message),
+            "budget": output_estimator.estimate("chat_update", input_tokens=estimate_tokens(current_prd)),
+            "task": "chat_update",
+        }
+    return {
+        "messages": _build_chat_answer_messages(current_prd, message),
+        "budget": output_estimator.estimate("chat_answer", input_tokens=estimate_tokens(current_prd + message)),
+        "task": "chat_answer",
+    }
+
+
+async def chat_with_prd(current_prd: str, message: str, use_cache: bool = True) -> dict:
     """
     Classifies intent and either chats or updates the PRD.
+    When a small model is configured, intent classification and conversational
+    answers run on their own (cheaper) routes and only update requests go to the
+    full PRD rewrite prompt; otherwise a single combined call does both.
     Returns dict with keys: action, message, analysis (optional).
     """
-    prompt = CHAT_WITH_PRD_PROMPT.replace("{current_prd}", current_prd).replace("{message}", message)
+    intent = await _classify_chat_intent(message, use_cache=use_cache)
+    raw_content = await _chat_completion(
+        **_chat_request(current_prd, message, intent),
+        use_cache=use_cache,
+        priority=InferencePriority.INTERACTIVE,
+        validate=_is_json_object,
+    )
+    return _parse_chat_response(raw_content)
 
-    response = await client.chat_completion(
-        model="Qwen/Qwen2.5-Coder-32B-Instruct",
-        messages=[
-            {"role": "system", "content": "You are a helpful AI assistant for a PRD tool. You can chat naturally AND update PRDs. Always return valid JSON."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=4000,
-        temperature=0.3,
+
+async def stream_chat_with_prd(current_prd: str, message: str, use_cache: bool = True) -> AsyncIterator[tuple[str, object]]:
+    """
+    Streaming variant of chat_with_prd. Yields ("token", str) for every raw model
+    delta, ("message", str) for newly decoded text of the reply's "message" field,
+    and finally ("result", dict) in the same shape chat_with_prd returns.
+    """
+    intent = await _classify_chat_intent(message, use_cache=use_cache)
+    chat_request = _chat_request(current_prd, message, intent)
+    message_reader = _StreamedJsonStringReader("message")
+    parts: list[str] = []
+    async for delta in _stream_chat_completion(
+        **chat_request,
+        use_cache=use_cache,
+        priority=InferencePriority.INTERACTIVE,
+    ):
+        parts.append(delta)
+        yield ("token", delta)
+        message_delta = message_reader.feed(delta)
+        if message_delta:
+            yield ("message", message_delta)
+
+    raw_content = await _escalate_invalid_stream(
+        "".join(parts),
+        **chat_request,
+        validate=_is_json_object,
+        use_cache=use_cache,
+        priority=InferencePriority.INTERACTIVE,
     )
+    yield ("result", _parse_chat_response(raw_content))
 
-    raw_content = response.choices[0].message.content
+
+def _parse_chat_response(raw_content: str) -> dict:
     try:
         # Clean markdown wrappers
         content = raw_content.strip()
@@ -668,23 +1242,67 @@ async def chat_with_prd(current_prd: str, message: str) -> dict:
         }
 
 
-async def generate_test_cases(prd_text: str) -> list[TestCaseSchema]:
+async def generate_test_cases(prd_text: str, use_cache: bool = True) -> list[TestCaseSchema]:
     """
     Generates test cases from PRD text using the same client/model as analysis.
+    Large PRDs are sharded on their ## / ### headings and the shards are generated
+    concurrently, so wall-clock time follows the largest section. Sections such as
+    Objectives or Exclusions may legitimately yield no cases; failed or empty
+    shards are logged, and generation only fails when every shard failed or
+    nothing was generated at all.
     """
+    shards = _build_test_case_shards(prd_text)
+    if len(shards) == 1:
+        return await _generate_test_cases_for_text(shards[0], use_cache=use_cache)
+
+    semaphore = asyncio.Semaphore(max(1, settings.test_case_shard_concurrency))
+
+    async def _generate_shard(shard_text: str) -> list[TestCaseSchema]:
+        async with semaphore:
+            return await _generate_test_cases_for_text(shard_text, use_cache=use_cache)
+
+    shard_results = await asyncio.gather(
+        *(_generate_shard(shard) for shard in shards),
+        return_exceptions=True,
+    )
+
+    merged: list[TestCaseSchema] = []
+    failed_shards = 0
+    for index, shard_result in enumerate(shard_results):
+        if isinstance(shard_result, BaseException):
+            print(f"Test case shard {index + 1}/{len(shards)} failed: {shard_result!r}")
+            failed_shards += 1
+        elif not shard_result:
+            print(f"Test case shard {index + 1}/{len(shards)} returned no test cases")
+        else:
+            merged.extend(shard_result)
+    if failed_shards == len(shards):
+        raise RuntimeError("Test case generation failed for every PRD section. Please try again.")
+    test_cases = _dedupe_test_cases(merged)
+    if not test_cases:
+        raise RuntimeError("No test cases could be generated from this PRD. Please try again.")
+    return test_cases
+
+
+async def _generate_test_cases_for_text(prd_text: str, use_cache: bool = True) -> list[TestCaseSchema]:
     prompt = TEST_CASE_GENERATION_PROMPT.replace("{prd_text}", prd_text)
     
-    response = await client.chat_completion(
-        model="Qwen/Qwen2.5-Coder-32B-Instruct",
+    raw_content = await _chat_completion(
         messages=[
             {"role": "system", "content": "You are a professional QA Engineer. Always return valid JSON."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=8000,
-        temperature=0.3,
+        budget=output_estimator.estimate(
+            "test_cases",
+            sections=len(_split_prd_sections(prd_text)),
+            bullets=_count_bullets(prd_text),
+        ),
+        use_cache=use_cache,
+        priority=InferencePriority.ON_DEMAND,
+        task="test_cases",
+        validate=_is_json_array,
     )
-    
-    raw_content = response.choices[0].message.content.strip()
+    raw_content = raw_content.strip()
     
     # Clean markdown wrappers
     content = raw_content
@@ -708,41 +1326,309 @@ async def generate_test_cases(prd_text: str) -> list[TestCaseSchema]:
         return []
 
 
-async def generate_qa_intelligence(prd_text: str, test_cases: list[TestCaseSchema]) -> QAIntelligenceSchema:
+def _split_prd_sections(markdown_text: str) -> list[tuple[str, str, str]]:
+    """
+    Splits a standardized PRD on its ## and ### headings.
+    Returns (parent ## heading, own heading, section text) tuples in document order;
+    text before the first heading is returned with empty headings.
+    """
+    sections: list[tuple[str, str, str]] = []
+    parent_heading = ""
+    heading = ""
+    lines: list[str] = []
+
+    for line in markdown_text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("## ") or stripped.startswith("### "):
+            if heading or any(existing.strip() for existing in lines):
+                sections.append((parent_heading, heading, "\n".join(lines).strip()))
+            heading = stripped
+            if stripped.startswith("## "):
+                parent_heading = stripped
+            lines = [line]
+        else:
+            lines.append(line)
+
+    if heading or any(existing.strip() for existing in lines):
+        sections.append((parent_heading, heading, "\n".join(lines).strip()))
+    return sections
+
+
+def _build_test_case_shards(prd_text: str) -> list[str]:
+    sections = _split_prd_sections(prd_text)
+    if len(sections) <= 1 or len(prd_text) < TEST_CASE_SHARD_MIN_CHARS * 2:
+        return [prd_text]
+
+    # The preamble and Overview are sent with every shard as context, not as work.
+    context_parts = [
+        text
+        for _, heading, text in sections
+        if not heading or heading.lower().startswith("## overview")
+    ]
+    work_sections = [
+        (parent_heading, heading, text)
+        for parent_heading, heading, text in sections
+        if heading and not heading.lower().startswith("## overview")
+    ]
+
+    shard_bodies: list[str] = []
+    current: list[str] = []
+    current_size = 0
+    for parent_heading, heading, text in work_sections:
+        if not current and heading.startswith("### ") and parent_heading:
+            current.append(parent_heading)
+        current.append(text)
+        current_size += len(text)
+        if current_size >= TEST_CASE_SHARD_MIN_CHARS:
+            shard_bodies.append("\n\n".join(current))
+            current = []
+            current_size = 0
+    if current:
+        if shard_bodies and current_size < TEST_CASE_SHARD_MIN_CHARS // 2:
+            shard_bodies[-1] = shard_bodies[-1] + "\n\n" + "\n\n".join(current)
+        else:
+            shard_bodies.append("\n\n".join(current))
+
+    if len(shard_bodies) <= 1:
+        return [prd_text]
+
+    context = "\n\n".join(context_parts).strip() or "(no overview provided)"
+    return [
+        TEST_CASE_SHARD_TEMPLATE.replace("{context}", context).replace("{section}", shard_body)
+        for shard_body in shard_bodies
+    ]
+
+
+def _normalize_dedupe_text(value: str) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def _dedupe_test_cases(test_cases: list[TestCaseSchema]) -> list[TestCaseSchema]:
+    seen: set[tuple[str, str, str]] = set()
+    unique: list[TestCaseSchema] = []
+    for test_case in test_cases:
+        key = (
+            _normalize_dedupe_text(test_case.feature_name),
+            _normalize_dedupe_text(test_case.sub_feature_name),
+            _normalize_dedupe_text(test_case.scenario),
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(test_case)
+    return unique
+
+
+def _qa_module_name(test_case: TestCaseSchema) -> str:
+    return (test_case.feature_name or test_case.sub_feature_name or "General").strip() or "General"
+
+
+def _module_key(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+def _group_test_cases_by_module(test_cases: list[TestCaseSchema]) -> dict[str, list[TestCaseSchema]]:
+    grouped: dict[str, list[TestCaseSchema]] = {}
+    for test_case in test_cases:
+        grouped.setdefault(_qa_module_name(test_case), []).append(test_case)
+    return grouped
+
+
+def _module_prd_sections(prd_text: str, module_names: list[str]) -> tuple[list[str], dict[str, list[str] | None]]:
+    """
+    Returns (context sections, sections per module). A module's sections are
+    those whose heading or text mention it; None means no section does, so
+    the module depends on the whole PRD.
+    """
+    sections = _split_prd_sections(prd_text)
+    context = [text for _, heading, text in sections if not heading or heading.lower().startswith("## overview")]
+    per_module: dict[str, list[str] | None] = {}
+    for module_name in module_names:
+        needle = _module_key(module_name)
+        matching = [
+            text
+            for _, heading, text in sections
+            if heading and not heading.lower().startswith("## overview") and needle in _module_key(text)
+        ]
+        per_module[module_name] = matching or None
+    return context, per_module
+
+
+def qa_module_hashes(prd_text: str, test_cases: list[TestCaseSchema]) -> dict[str, str]:
+    """
+    Fingerprint per module (feature_name): its test cases plus the PRD
+    sections that mention it, so an edit elsewhere leaves it unchanged.
+    """
+    grouped = _group_test_cases_by_module(test_cases)
+    _, sections_by_module = _module_prd_sections(prd_text, list(grouped))
+    module_hashes = {}
+    for module_name, module_cases in grouped.items():
+        module_sections = sections_by_module[module_name]
+        payload = {
+            "prd": module_sections if module_sections is not None else prd_text,
+            "test_cases": sorted(
+                json.dumps(_qa_test_case_payload(test_case), sort_keys=True, ensure_ascii=False)
+                for test_case in module_cases
+            ),
+        }
+        serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        module_hashes[_module_key(module_name)] = hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:32]
+    return module_hashes
+
+
+def _qa_test_case_payload(test_case: TestCaseSchema) -> dict:
+    return {
+        "scenario": test_case.scenario,
+        "testing_type": test_case.testing_type,
+        "severity": test_case.severity,
+        "priority": test_case.priority,
+        "feature_name": test_case.feature_name,
+        "sub_feature_name": test_case.sub_feature_name,
+        "acceptance_criteria": test_case.acceptance_criteria,
+    }
+
+
+def _overall_coverage_percentage(coverage_modules: list[CoverageModuleSchema]) -> int:
+    total_requirements = sum(module.total_requirements for module in coverage_modules)
+    if not total_requirements:
+        return 0
+    covered_requirements = sum(min(module.covered_requirements, module.total_requirements) for module in coverage_modules)
+    return _clamp_score(round(covered_requirements * 100 / total_requirements))
+
+
+def _merge_qa_intelligence(
+    previous: QAIntelligenceSchema,
+    changed: QAIntelligenceSchema | None,
+    kept_modules: set[str],
+) -> QAIntelligenceSchema:
+    """
+    Keeps previous entries of unchanged modules (kept_modules, by _module_key),
+    adds the changed modules' fresh entries and recomputes overall coverage.
+    """
+    fresh = changed or QAIntelligenceSchema(
+        overall_coverage_percentage=0, coverage_modules=[], uncovered_requirement_alerts=[], risk_analysis=[], mind_map=[]
+    )
+    fresh_areas = {_module_key(item.area) for item in fresh.risk_analysis}
+    coverage_modules = [
+        module for module in previous.coverage_modules if _module_key(module.module_name) in kept_modules
+    ] + fresh.coverage_modules
+    mind_map = [
+        module for module in previous.mind_map if _module_key(module.module_name) in kept_modules
+    ] + fresh.mind_map
+    # Risk areas that are not modules (e.g. "General") stay until the fresh result reports them again.
+    risk_analysis = [
+        item
+        for item in previous.risk_analysis
+        if _module_key(item.area) not in fresh_areas
+        and (_module_key(item.area) in kept_modules or not _is_module_area(item.area, previous))
+    ] + fresh.risk_analysis
+    kept_alerts = [
+        alert
+        for alert in previous.uncovered_requirement_alerts
+        if any(module_name in _module_key(alert) for module_name in kept_modules)
+    ]
+    return QAIntelligenceSchema(
+        overall_coverage_percentage=_overall_coverage_percentage(coverage_modules),
+        coverage_modules=coverage_modules,
+        uncovered_requirement_alerts=kept_alerts + fresh.uncovered_requirement_alerts,
+        risk_analysis=risk_analysis,
+        mind_map=mind_map,
+    )
+
+
+def _is_module_area(area: str, intelligence: QAIntelligenceSchema) -> bool:
+    return _module_key(area) in {_module_key(module.module_name) for module in intelligence.coverage_modules}
+
+
+async def generate_qa_intelligence(
+    prd_text: str,
+    test_cases: list[TestCaseSchema],
+    use_cache: bool = True,
+    previous: QAIntelligenceSchema | None = None,
+    previous_module_hashes: dict[str, str] | None = None,
+) -> QAIntelligenceSchema:
+    """
+    Full QA intelligence for the PRD, or, given the previous result and its
+    qa_module_hashes, an incremental update: entries of unchanged modules are
+    kept and only the changed modules (with their PRD sections and test
+    cases) are sent to the model.
+    """
+    if previous is None or not previous_module_hashes:
+        return await _request_qa_intelligence(prd_text, test_cases, use_cache=use_cache)
+
+    grouped = _group_test_cases_by_module(test_cases)
+    current_module_hashes = qa_module_hashes(prd_text, test_cases)
+    changed_modules = [
+        module_name
+        for module_name in grouped
+        if previous_module_hashes.get(_module_key(module_name)) != current_module_hashes[_module_key(module_name)]
+    ]
+    kept_modules = {_module_key(module_name) for module_name in grouped} - {_module_key(name) for name in changed_modules}
+    previous_modules = {_module_key(module.module_name) for module in previous.coverage_modules}
+    if not kept_modules or not kept_modules <= previous_modules:
+        # Nothing to reuse, or the previous result does not use the feature names as modules.
+        return await _request_qa_intelligence(prd_text, test_cases, use_cache=use_cache)
+    if not changed_modules:
+        return _merge_qa_intelligence(previous, None, kept_modules)
+
+    print(f"Regenerating QA intelligence for {len(changed_modules)} of {len(grouped)} modules")
+    context, sections_by_module = _module_prd_sections(prd_text, changed_modules)
+    if any(sections_by_module[module_name] is None for module_name in changed_modules):
+        changed_prd_text = prd_text
+    else:
+        changed_sections = []
+        for module_name in changed_modules:
+            for text in sections_by_module[module_name]:
+                if text not in changed_sections:
+                    changed_sections.append(text)
+        changed_prd_text = "\n\n".join(context + changed_sections)
+
+    changed = await _request_qa_intelligence(
+        changed_prd_text,
+        [test_case for module_name in changed_modules for test_case in grouped[module_name]],
+        use_cache=use_cache,
+        module_names=changed_modules,
+    )
+    return _merge_qa_intelligence(previous, changed, kept_modules)
+
+
+async def _request_qa_intelligence(
+    prd_text: str,
+    test_cases: list[TestCaseSchema],
+    use_cache: bool = True,
+    module_names: list[str] | None = None,
+) -> QAIntelligenceSchema:
     prompt = (
         QA_INTELLIGENCE_PROMPT
         .replace("{prd_text}", prd_text)
         .replace(
             "{test_cases}",
-            json.dumps(
-                [
-                    {
-                        "scenario": test_case.scenario,
-                        "testing_type": test_case.testing_type,
-                        "severity": test_case.severity,
-                        "priority": test_case.priority,
-                        "feature_name": test_case.feature_name,
-                        "sub_feature_name": test_case.sub_feature_name,
-                        "acceptance_criteria": test_case.acceptance_criteria,
-                    }
-                    for test_case in test_cases
-                ],
-                ensure_ascii=False,
-            ),
+            json.dumps([_qa_test_case_payload(test_case) for test_case in test_cases], ensure_ascii=False),
         )
     )
+    if module_names:
+        prompt += QA_INTELLIGENCE_CHANGED_MODULES_RULE.replace("{module_names}", json.dumps(module_names, ensure_ascii=False))
 
-    response = await client.chat_completion(
-        model="Qwen/Qwen2.5-Coder-32B-Instruct",
-        messages=[
-            {"role": "system", "content": "You are a QA intelligence engine. Always return valid JSON."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=8000,
-        temperature=0.2,
-    )
-
-    raw_content = response.choices[0].message.content.strip()
+    try:
+        raw_content = await _chat_completion(
+            messages=[
+                {"role": "system", "content": "You are a QA intelligence engine. Always return valid JSON."},
+                {"role": "user", "content": prompt},
+            ],
+            budget=output_estimator.estimate(
+                "qa_intelligence",
+                sections=len(_split_prd_sections(prd_text)),
+                items=len(test_cases),
+            ),
+            use_cache=use_cache,
+            priority=InferencePriority.ON_DEMAND,
+            task="qa_intelligence",
+            validate=_is_json_object,
+        )
+    except LLMUnavailableError as e:
+        print(f"Inference unavailable, using deterministic QA intelligence: {e}")
+        return _fallback_qa_intelligence(test_cases)
+    raw_content = raw_content.strip()
     content = _clean_json_content(raw_content)
 
     try:
@@ -754,21 +1640,32 @@ async def generate_qa_intelligence(prd_text: str, test_cases: list[TestCaseSchem
         return _fallback_qa_intelligence(test_cases)
 
 
-async def generate_automation_script(request: AutomationScriptRequest) -> AutomationScriptResponse:
+async def generate_automation_script(request: AutomationScriptRequest, use_cache: bool = True) -> AutomationScriptResponse:
     automation_ir = _build_automation_ir(request)
     prompt = _build_automation_script_prompt(request, automation_ir)
 
-    response = await client.chat_completion(
-        model="Qwen/Qwen2.5-Coder-32B-Instruct",
-        messages=[
-            {"role": "system", "content": "You generate production-grade test automation, apply framework best practices, and always return valid JSON."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=4000,
-        temperature=0.15,
-    )
-
-    raw_content = response.choices[0].message.content.strip()
+    try:
+        raw_content = await _chat_completion(
+            messages=[
+                {"role": "system", "content": "You generate production-grade test automation, apply framework best practices, and always return valid JSON."},
+                {"role": "user", "content": prompt},
+            ],
+            budget=output_estimator.estimate("automation", items=len(_extract_ordered_test_steps(request))),
+            use_cache=use_cache,
+            priority=InferencePriority.ON_DEMAND,
+            task="automation",
+            validate=_is_json_object,
+        )
+    except LLMUnavailableError as e:
+        print(f"Inference unavailable, using fallback automation template: {e}")
+        return AutomationScriptResponse(
+            framework=request.framework,
+            language=_default_language_for_framework(request.framework),
+            file_name=_default_file_name(request.framework, request.scenario),
+            code=_fallback_automation_code(request, automation_ir),
+            explanation="Fallback automation template generated because the AI service is currently unavailable.",
+        )
+    raw_content = raw_content.strip()
     content = _clean_json_content(raw_content)
 
     try:
@@ -1586,7 +2483,29 @@ def calculate_dynamic_quality_score(
     return _clamp_score(blended_score)
 
 
-async def _upgrade_prd_quality(raw_text: str, initial_analysis: AnalysisResultSchema) -> AnalysisResultSchema:
+def final_quality_score(
+    standardized_prd: str,
+    missing_requirements: list[str],
+    qa_risk_insights: list[str],
+    score: int | None = None,
+) -> int:
+    """The score stored with an analysis: never below the deterministic score, the given score or the target."""
+    recalculated_score = calculate_dynamic_quality_score(
+        standardized_prd=standardized_prd,
+        missing_requirements=missing_requirements,
+        qa_risk_insights=qa_risk_insights,
+        model_score=score,
+    )
+    return max(recalculated_score, int(score or 0), TARGET_FINAL_SCORE)
+
+
+async def _upgrade_prd_quality(
+    raw_text: str,
+    initial_analysis: AnalysisResultSchema,
+    use_cache: bool = True,
+    priority: InferencePriority = InferencePriority.BACKGROUND,
+    on_stage: Callable[..., Awaitable[None]] | None = None,
+) -> AnalysisResultSchema:
     best = initial_analysis
     best_score = calculate_dynamic_quality_score(
         standardized_prd=best.standardized_prd,
@@ -1596,9 +2515,11 @@ async def _upgrade_prd_quality(raw_text: str, initial_analysis: AnalysisResultSc
     )
     best.quality_score = best_score
 
-    for _ in range(2):
+    for upgrade_pass in range(1, 3):
         if best.quality_score >= TARGET_FINAL_SCORE and len(best.missing_requirements) <= 1:
             break
+        if on_stage:
+            await on_stage("upgrading", upgrade_pass=upgrade_pass, quality_score=best.quality_score)
 
         prompt = (
             QUALITY_UPGRADE_PROMPT
@@ -1608,16 +2529,22 @@ async def _upgrade_prd_quality(raw_text: str, initial_analysis: AnalysisResultSc
             .replace("{qa_risks}", json.dumps(best.qa_risk_insights))
         )
 
-        response = await client.chat_completion(
-            model="Qwen/Qwen2.5-Coder-32B-Instruct",
+        raw_content = await _chat_completion(
             messages=[
                 {"role": "system", "content": "You produce robust implementation-ready PRDs and always return valid JSON."},
                 {"role": "user", "content": prompt},
             ],
-            max_tokens=4000,
-            temperature=0.15,
+            budget=output_estimator.estimate(
+                "upgrade",
+                input_tokens=estimate_tokens(best.standardized_prd),
+                items=len(best.missing_requirements),
+            ),
+            use_cache=use_cache,
+            priority=priority,
+            task="upgrade",
+            validate=_is_json_object,
         )
-        candidate = parse_huggingface_response(response.choices[0].message.content)
+        candidate = parse_huggingface_response(raw_content)
 
         candidate_score = calculate_dynamic_quality_score(
             standardized_prd=candidate.standardized_prd,
@@ -0,0 +1,38 @@
+import hashlib
+import json
+
+# Test case fields that make up its content (everything but ids and keys)
+TEST_CASE_CONTENT_FIELDS = (
+    "scenario",
+    "testing_type",
+    "severity",
+    "priority",
+    "feature_name",
+    "sub_feature_name",
+    "test_conditions",
+    "test_idea",
+    "test_data",
+    "acceptance_criteria",
+    "test_steps",
+)
+
+
+def stable_hash(value: object) -> str:
+    serialized = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def prd_hash(standardized_prd: str) -> str:
+    return stable_hash(standardized_prd)
+
+
+def test_case_hash(test_case: dict) -> str:
+    return stable_hash({field: test_case.get(field) for field in TEST_CASE_CONTENT_FIELDS})[:32]
+
+
+def test_suite_hash(test_cases: list[dict]) -> str:
+    """
+    Version of a whole suite, independent of row order. Uses each row's stored
+    case_hash when present so it can be computed without re-reading content.
+    """
+    return stable_hash(sorted(test_case.get("case_hash") or test_case_hash(test_case) for test_case in test_cases))
@@ -0,0 +1,177 @@
+import asyncio
+
+from app.core.config import settings
+from app.core.repository import repository
+from app.models.schemas import AnalysisResultSchema
+from app.services.analyzer import analyze_prd_text, final_quality_score
+from app.services.content_hashes import prd_hash
+from app.services.extraction_pool import extract_text_async
+from app.services.job_queue import Job
+from app.services.pipeline_events import PipelineProgress, pipeline_events
+from app.services.upload_spool import discard_spooled_upload
+
+PROCESS_DOCUMENT_JOB = "process_document"
+PROCESS_BATCH_JOB = "process_batch"
+
+
+async def save_analysis_result(prd_id: str, analysis: AnalysisResultSchema, duplicate_prd_ids: list[str] | None = None) -> None:
+    # The score is final once stored; reads serve it as-is.
+    analysis.quality_score = final_quality_score(
+        analysis.standardized_prd,
+        analysis.missing_requirements,
+        analysis.qa_risk_insights,
+        analysis.quality_score,
+    )
+    analysis_payload = {
+        "standardized_prd": analysis.standardized_prd,
+        "quality_score": analysis.quality_score,
+        "missing_requirements": analysis.missing_requirements,
+        "qa_risk_insights": analysis.qa_risk_insights,
+        "prd_hash": prd_hash(analysis.standardized_prd),
+    }
+    for target_prd_id in [prd_id, *(duplicate_prd_ids or [])]:
+        await repository.save_analysis(target_prd_id, analysis_payload)
+
+
+async def mark_document_failed(prd_id: str) -> None:
+    await repository.update_prd(prd_id, {"status": "failed"})
+
+
+async def extract_document(prd_id: str, source: bytes | str, filename: str, progress: PipelineProgress) -> str:
+    print(f"Extracting text for PRD {prd_id}")
+    await progress.emit("extracting")
+    return await extract_text_async(source, filename)
+
+
+async def analyze_and_store(
+    prd_id: str,
+    text: str,
+    progress: PipelineProgress,
+    use_cache: bool = True,
+    duplicate_prd_ids: list[str] | None = None,
+) -> None:
+    """
+    Analyzes `text` and stores the result for `prd_id` and for any PRDs uploaded
+    with identical content (`duplicate_prd_ids`). The duplicates are completed
+    first, so a completed `prd_id` means they are all done.
+    """
+    print(f"Analyzing text for PRD {prd_id}")
+    analysis: AnalysisResultSchema = await asyncio.wait_for(
+        analyze_prd_text(text, use_cache=use_cache, on_stage=progress.emit, on_draft=progress.draft),
+        timeout=settings.analysis_pipeline_deadline_seconds,
+    )
+
+    # Update-or-insert, so a retried job does not duplicate rows
+    print(f"Storing results for PRD {prd_id}")
+    await progress.emit("storing")
+    await save_analysis_result(prd_id, analysis, duplicate_prd_ids)
+
+    for duplicate_prd_id in duplicate_prd_ids or []:
+        await repository.update_prd(duplicate_prd_id, {"status": "completed"})
+        await pipeline_events.publish(duplicate_prd_id, "completed", deduplicated_from=prd_id, quality_score=analysis.quality_score)
+    await repository.update_prd(prd_id, {"status": "completed"})
+    await progress.emit("completed", quality_score=analysis.quality_score)
+    print(f"Finished processing PRD {prd_id}")
+
+
+async def process_document(prd_id: str, source: bytes | str, filename: str, attempt: int = 1, use_cache: bool = True):
+    """
+    Extracts, analyzes and stores one uploaded document. `source` is the
+    document's bytes or the path of its spooled upload. Raises on failure so the
+    job can be retried. Stage events (and the analysis draft) are published to
+    pipeline_events.
+    """
+    progress = PipelineProgress(prd_id, attempt=attempt)
+    text = await extract_document(prd_id, source, filename, progress)
+    await analyze_and_store(prd_id, text, progress, use_cache=use_cache)
+
+
+async def run_process_document_job(job: Job) -> None:
+    spool_path = job.payload.get("spool_path")
+    try:
+        source = spool_path or job.blob
+        if not source:
+            # Re-analysis of an earlier upload: its spooled copy is gone, read it from storage.
+            source = await repository.download_document(job.payload["storage_path"])
+        await process_document(
+            job.payload["prd_id"],
+            source,
+            job.payload["filename"],
+            attempt=job.attempts,
+            use_cache=not job.payload.get("regenerate", False),
+        )
+    except Exception as e:
+        if job.attempts < job.max_attempts:
+            await pipeline_events.publish(job.payload["prd_id"], "retrying", attempt=job.attempts, error=str(e))
+        raise
+    # The spooled upload is kept until the job succeeds so retries can re-read it.
+    discard_spooled_upload(spool_path)
+
+
+async def on_process_document_dead(job: Job) -> None:
+    print(f"Giving up on PRD {job.payload['prd_id']} after {job.attempts} attempts")
+    discard_spooled_upload(job.payload.get("spool_path"))
+    await mark_document_failed(job.payload["prd_id"])
+    await pipeline_events.publish(job.payload["prd_id"], "failed", attempt=job.attempts)
+
+
+async def _pending_batch_documents(documents: list[dict]) -> list[dict]:
+    """Documents of a (possibly retried) batch that have not finished yet, in upload order."""
+    status_rows = await repository.get_prds([document["prd_id"] for document in documents], columns="id, status")
+    finished = {row["id"] for row in status_rows if row["status"] in ("completed", "failed")}
+    return [document for document in documents if document["prd_id"] not in finished]
+
+
+async def _fail_batch_document(document: dict, error: Exception) -> None:
+    print(f"Batch document {document['prd_id']} failed: {error!r}")
+    discard_spooled_upload(document.get("spool_path"))
+    for prd_id in [document["prd_id"], *document.get("duplicate_prd_ids", [])]:
+        await mark_document_failed(prd_id)
+        await pipeline_events.publish(prd_id, "failed", error=str(error))
+
+
+async def run_process_batch_job(job: Job) -> None:
+    """
+    Processes a batch upload as a two-stage pipeline: one extractor feeds a
+    bounded queue drained by batch_analysis_concurrency analysis workers, so
+    extracting document N+1 overlaps the LLM analysis of document N while at
+    most batch_pipeline_depth extracted texts wait in memory. Uploads with the
+    same content share one document entry (see `duplicate_prd_ids`). A failing
+    document is marked failed on its own; a retried batch job skips documents
+    that already finished.
+    """
+    documents = await _pending_batch_documents(job.payload["documents"])
+    consumers = max(1, settings.batch_analysis_concurrency)
+    extracted: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.batch_pipeline_depth))
+
+    async def extract_stage() -> None:
+        try:
+            for document in documents:
+                progress = PipelineProgress(document["prd_id"], attempt=job.attempts)
+                try:
+                    text = await extract_document(document["prd_id"], document["spool_path"], document["filename"], progress)
+                except Exception as e:
+                    await _fail_batch_document(document, e)
+                    continue
+                await extracted.put((document, progress, text))
+        finally:
+            for _ in range(consumers):
+                await extracted.put(None)
+
+    async def analyze_stage() -> None:
+        while (item := await extracted.get()) is not None:
+            document, progress, text = item
+            try:
+                await analyze_and_store(document["prd_id"], text, progress, duplicate_prd_ids=document.get("duplicate_prd_ids"))
+            except Exception as e:
+                await _fail_batch_document(document, e)
+                continue
+            discard_spooled_upload(document["spool_path"])
+
+    await asyncio.gather(extract_stage(), *(analyze_stage() for _ in range(consumers)))
+
+
+async def on_process_batch_dead(job: Job) -> None:
+    print(f"Giving up on batch {job.id} after {job.attempts} attempts")
+    for document in await _pending_batch_documents(job.payload["documents"]):
+        await _fail_batch_document(document, RuntimeError("batch job gave up"))
@@ -0,0 +1,206 @@
+import asyncio
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from app.core.config import settings
+from app.services.extractor import count_pdf_pages, extract_pdf_pages, extract_text, merge_pdf_pages
+
+try:
+    import resource
+except ImportError:  # Windows: limits are not enforced
+    resource = None
+
+
+class ExtractionError(Exception):
+    """Raised when a document could not be parsed within the extraction limits."""
+
+
+def _init_extraction_worker(memory_limit_mb: int) -> None:
+    if resource is None or memory_limit_mb <= 0:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError) as limit_err:
+        print(f"Could not set extraction memory limit: {limit_err}")
+
+
+def _run_in_worker(function: Callable, args: tuple, cpu_seconds_limit: int) -> tuple[object, float, float]:
+    """Runs one job inside a pool process. Returns (result, started_at, parse_seconds)."""
+    started_at = time.time()
+    started = time.perf_counter()
+    if resource is not None and cpu_seconds_limit > 0:
+        # RLIMIT_CPU counts the whole process lifetime, so re-arm it per job
+        # relative to the CPU time this worker has already used. Exceeding it
+        # kills the worker (SIGXCPU) and that worker is replaced.
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft_limit = int(usage.ru_utime + usage.ru_stime) + cpu_seconds_limit
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_CPU)
+        if hard_limit != resource.RLIM_INFINITY:
+            soft_limit = min(soft_limit, hard_limit)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft_limit, hard_limit))
+    result = function(*args)
+    return result, started_at, time.perf_counter() - started
+
+
+class ExtractionPool:
+    """
+    Runs CPU-bound document parsing in worker processes so large PDFs never
+    block the event loop. Each job gets a CPU-time budget and each worker a
+    memory cap. Every worker is its own single-process executor that runs one
+    job at a time: a job that blows a limit (or the wall-clock timeout) takes
+    down only its own worker, which is replaced, while jobs running on the
+    other workers carry on.
+    """
+
+    def __init__(self):
+        # Idle workers; None stands for a slot whose worker is started on first use.
+        self._idle: asyncio.Queue[ProcessPoolExecutor | None] | None = None
+        self._counters = {
+            "jobs": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "restarts": 0,
+            "total_queue_wait_seconds": 0.0,
+            "total_parse_seconds": 0.0,
+            "max_parse_seconds": 0.0,
+        }
+
+    @property
+    def max_workers(self) -> int:
+        return settings.extraction_pool_workers or os.cpu_count() or 1
+
+    async def _acquire_worker(self) -> ProcessPoolExecutor:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.max_workers):
+                self._idle.put_nowait(None)
+        worker = await self._idle.get()
+        if worker is None:
+            worker = ProcessPoolExecutor(
+                max_workers=1,
+                initializer=_init_extraction_worker,
+                initargs=(settings.extraction_memory_limit_mb,),
+            )
+        return worker
+
+    def _replace_worker(self, worker: ProcessPoolExecutor) -> None:
+        """Kills one worker (its job timed out or it died) and frees its slot for a fresh one."""
+        self._counters["restarts"] += 1
+        for process in list((getattr(worker, "_processes", None) or {}).values()):
+            if process.is_alive():
+                process.terminate()
+        worker.shutdown(wait=False, cancel_futures=True)
+        self._idle.put_nowait(None)
+
+    async def run(self, function: Callable, *args):
+        submitted_at = time.time()
+        worker = await self._acquire_worker()
+        replaced = False
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                worker, _run_in_worker, function, args, settings.extraction_cpu_seconds_limit
+            )
+            result, started_at, parse_seconds = await asyncio.wait_for(future, timeout=settings.extraction_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._counters["timeouts"] += 1
+            self._counters["failures"] += 1
+            self._replace_worker(worker)
+            replaced = True
+            raise ExtractionError(f"Document extraction exceeded {settings.extraction_timeout_seconds}s")
+        except BrokenProcessPool:
+            self._counters["failures"] += 1
+            self._replace_worker(worker)
+            replaced = True
+            raise ExtractionError("Document extraction worker died (CPU or memory limit exceeded)")
+        except MemoryError:
+            self._counters["failures"] += 1
+            raise ExtractionError(f"Document extraction exceeded {settings.extraction_memory_limit_mb} MB")
+        finally:
+            if not replaced:
+                # Also after a cancelled wait: the worker finishes that job before taking the next.
+                self._idle.put_nowait(worker)
+
+        self._counters["jobs"] += 1
+        self._counters["total_queue_wait_seconds"] += max(0.0, started_at - submitted_at)
+        self._counters["total_parse_seconds"] += parse_seconds
+        self._counters["max_parse_seconds"] = max(self._counters["max_parse_seconds"], parse_seconds)
+        return result
+
+    def stats(self) -> dict:
+        jobs = self._counters["jobs"]
+        return {
+            "workers": self.max_workers,
+            "jobs": jobs,
+            "failures": self._counters["failures"],
+            "timeouts": self._counters["timeouts"],
+            "restarts": self._counters["restarts"],
+            "avg_queue_wait_seconds": round(self._counters["total_queue_wait_seconds"] / jobs, 3) if jobs else None,
+            "avg_parse_seconds": round(self._counters["total_parse_seconds"] / jobs, 3) if jobs else None,
+            "max_parse_seconds": round(self._counters["max_parse_seconds"], 3),
+        }
+
+
+extraction_pool = ExtractionPool()
+
+
+def _split_page_ranges(page_count: int, parts: int) -> list[tuple[int, int]]:
+    """Splits [0, page_count) into `parts` contiguous, near-equal ranges."""
+    size, remainder = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for index in range(parts):
+        end = start + size + (1 if index < remainder else 0)
+        if end > start:
+            ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _spool_to_temp_file(file_bytes: bytes) -> str:
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as spool_file:
+        spool_file.write(file_bytes)
+    return path
+
+
+async def _extract_pdf_parallel(source: bytes | str) -> str:
+    """
+    Splits the page range across the pool and merges the pages back in order.
+    Workers open the PDF by path (served from the OS page cache) instead of
+    each receiving the whole document pickled; bytes are spooled to a temp
+    file first.
+    """
+    spooled_path = None
+    if isinstance(source, bytes):
+        spooled_path = await asyncio.to_thread(_spool_to_temp_file, source)
+    path = spooled_path or source
+    try:
+        page_count = await extraction_pool.run(count_pdf_pages, path)
+        parts = min(extraction_pool.max_workers, math.ceil(page_count / settings.pdf_parallel_min_pages_per_worker))
+        if parts <= 1:
+            return merge_pdf_pages(await extraction_pool.run(extract_pdf_pages, path))
+        page_ranges = _split_page_ranges(page_count, parts)
+        range_texts = await asyncio.gather(
+            *(extraction_pool.run(extract_pdf_pages, path, start, end) for start, end in page_ranges)
+        )
+        return merge_pdf_pages([page_text for pages in range_texts for page_text in pages])
+    finally:
+        if spooled_path:
+            await asyncio.to_thread(os.remove, spooled_path)
+
+
+async def extract_text_async(source: bytes | str, filename: str) -> str:
+    """`source` is the document's bytes or a path to it."""
+    if (
+        filename.lower().endswith(".pdf")
+        and settings.pdf_parallel_extraction
+        and extraction_pool.max_workers > 1
+    ):
+        return await _extract_pdf_parallel(source)
+    return await extraction_pool.run(extract_text, source, filename)
@@ -2,25 +2,38 @@ import io
 import pdfplumber
 import docx
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    text = ""
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + "\n"
-    return text
+def _open_pdf(source: bytes | str):
+    # Accepts raw bytes or a path to a spooled copy (used by the page-parallel workers)
+    return pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source)
 
-def extract_text_from_docx(file_bytes: bytes) -> str:
-    doc = docx.Document(io.BytesIO(file_bytes))
+def count_pdf_pages(source: bytes | str) -> int:
+    with _open_pdf(source) as pdf:
+        return len(pdf.pages)
+
+def extract_pdf_pages(source: bytes | str, start: int = 0, end: int | None = None) -> list[str]:
+    with _open_pdf(source) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages[start:end]]
+
+def merge_pdf_pages(page_texts: list[str]) -> str:
+    return "".join(extracted + "\n" for extracted in page_texts if extracted)
+
+def extract_text_from_pdf(source: bytes | str) -> str:
+    return merge_pdf_pages(extract_pdf_pages(source))
+
+def extract_text_from_docx(source: bytes | str) -> str:
+    doc = docx.Document(io.BytesIO(source) if isinstance(source, bytes) else source)
     return "\n".join(paragraph.text for paragraph in doc.paragraphs)
 
-def extract_text(file_bytes: bytes, filename: str) -> str:
+def extract_text(source: bytes | str, filename: str) -> str:
+    """`source` is the document's bytes or a path to it (e.g. a spooled upload)."""
     if filename.lower().endswith(".pdf"):
-        return extract_text_from_pdf(file_bytes)
+        return extract_text_from_pdf(source)
     elif filename.lower().endswith(".docx"):
-        return extract_text_from_docx(file_bytes)
+        return extract_text_from_docx(source)
     elif filename.lower().endswith((".md", ".txt")):
-        return file_bytes.decode('utf-8')
+        if isinstance(source, str):
+            with open(source, "rb") as text_file:
+                source = text_file.read()
+        return source.decode('utf-8')
     else:
         raise ValueError("Unsupported file type. Only .pdf, .docx, .md, and .txt are supported.")
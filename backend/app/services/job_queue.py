@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+JOB_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    blob BLOB,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    visible_at REAL NOT NULL,
+    locked_by TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready_idx ON jobs (status, visible_at);
+"""
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    payload: dict
+    blob: bytes | None = None
+    attempts: int
+    max_attempts: int
+    status: str = "processing"
+    locked_by: str | None = None
+
+
+class SQLiteJobQueue:
+    """
+    Durable work queue shared by the API (enqueue only) and any number of worker
+    processes on the same host. A claimed job stays invisible to other workers
+    until its visibility timeout expires; workers extend it with heartbeats, so a
+    job whose worker crashed simply becomes claimable again. Failed jobs are
+    retried with exponential backoff until max_attempts, then marked dead. Done
+    jobs are deleted once they are older than the retention period.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        visibility_timeout_seconds: float,
+        max_attempts: int,
+        retry_backoff_seconds: float,
+        done_retention_seconds: float,
+    ):
+        self.path = path
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.done_retention_seconds = done_retention_seconds
+        self._initialized = False
+        self._completed = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(JOB_QUEUE_SCHEMA)
+            self._initialized = True
+        return connection
+
+    def _enqueue_sync(self, kind: str, payload: dict, blob: bytes | None) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, payload, blob, max_attempts, visible_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), blob, self.max_attempts, now, now, now),
+            )
+        return job_id
+
+    def _claim_sync(self, worker_id: str) -> Job | None:
+        now = time.time()
+        connection = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can
+            # never select and claim the same row.
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'processing') AND visible_at <= ? "
+                "AND attempts < max_attempts ORDER BY visible_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'processing', attempts = attempts + 1, locked_by = ?, "
+                "visible_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.visibility_timeout_seconds, now, row["id"]),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            blob=row["blob"],
+            attempts=row["attempts"] + 1,
+            max_attempts=row["max_attempts"],
+            locked_by=worker_id,
+        )
+
+    def _heartbeat_sync(self, job_id: str, worker_id: str) -> None:
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET visible_at = ?, updated_at = ? WHERE id = ? AND locked_by = ? AND status = 'processing'",
+                (now + self.visibility_timeout_seconds, now, job_id, worker_id),
+            )
+
+    def _complete_sync(self, job: Job) -> bool:
+        """Returns False when the job is no longer held by the worker that claimed it."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            # The payload blob is only needed while the job can still run.
+            updated = connection.execute(
+                "UPDATE jobs SET status = 'done', blob = NULL, locked_by = NULL, updated_at = ? WHERE id = ? AND locked_by = ?",
+                (now, job.id, job.locked_by),
+            ).rowcount
+            self._completed += 1
+            if self._completed % 100 == 0:
+                connection.execute(
+                    "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?",
+                    (now - self.done_retention_seconds,),
+                )
+        return updated > 0
+
+    def _fail_sync(self, job: Job, error: str) -> str | None:
+        """
+        Returns the job's new status: 'queued' when it will be retried, 'dead' when
+        it is given up on, or None when the worker that claimed it no longer holds it.
+        """
+        now = time.time()
+        retry = job.attempts < job.max_attempts
+        with closing(self._connect()) as connection:
+            if retry:
+                backoff = self.retry_backoff_seconds * (2 ** (job.attempts - 1))
+                updated = connection.execute(
+                    "UPDATE jobs SET status = 'queued', locked_by = NULL, visible_at = ?, last_error = ?, updated_at = ? "
+                    "WHERE id = ? AND locked_by = ?",
+                    (now + backoff, error, now, job.id, job.locked_by),
+                ).rowcount
+            else:
+                updated = connection.execute(
+                    "UPDATE jobs SET status = 'dead', blob = NULL, locked_by = NULL, last_error = ?, updated_at = ? "
+                    "WHERE id = ? AND locked_by = ?",
+                    (error, now, job.id, job.locked_by),
+                ).rowcount
+        if not updated:
+            return None
+        return "queued" if retry else "dead"
+
+    def _reap_exhausted_sync(self) -> list[Job]:
+        """Marks jobs whose worker died on their final attempt as dead and returns them."""
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'processing' AND visible_at <= ? AND attempts >= max_attempts",
+                (now,),
+            ).fetchall()
+            for row in rows:
+                connection.execute(
+                    "UPDATE jobs SET status = 'dead', blob = NULL, locked_by = NULL, "
+                    "last_error = 'visibility timeout expired on final attempt', updated_at = ? WHERE id = ?",
+                    (now, row["id"]),
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        return [
+            Job(id=row["id"], kind=row["kind"], payload=json.loads(row["payload"]), attempts=row["attempts"], max_attempts=row["max_attempts"])
+            for row in rows
+        ]
+
+    def _get_sync(self, job_id: str) -> Job | None:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT id, kind, payload, status, attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            status=row["status"],
+        )
+
+    def _stats_sync(self) -> dict:
+        with closing(self._connect()) as connection:
+            counts = {row["status"]: row["count"] for row in connection.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")}
+            oldest = connection.execute("SELECT MIN(created_at) AS oldest FROM jobs WHERE status = 'queued'").fetchone()["oldest"]
+        return {
+            "queued": counts.get("queued", 0),
+            "processing": counts.get("processing", 0),
+            "done": counts.get("done", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else None,
+        }
+
+    async def enqueue(self, kind: str, payload: dict, blob: bytes | None = None) -> str:
+        return await asyncio.to_thread(self._enqueue_sync, kind, payload, blob)
+
+    async def claim(self, worker_id: str) -> Job | None:
+        return await asyncio.to_thread(self._claim_sync, worker_id)
+
+    async def heartbeat(self, job_id: str, worker_id: str) -> None:
+        await asyncio.to_thread(self._heartbeat_sync, job_id, worker_id)
+
+    async def keep_claimed(self, job_id: str, worker_id: str) -> None:
+        """Heartbeats a claimed job until cancelled; a failed heartbeat is retried on the next beat."""
+        interval = max(1.0, self.visibility_timeout_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.heartbeat(job_id, worker_id)
+            except sqlite3.OperationalError as e:
+                print(f"[{worker_id}] Heartbeat for job {job_id} failed, retrying: {e}")
+
+    async def complete(self, job: Job) -> bool:
+        return await asyncio.to_thread(self._complete_sync, job)
+
+    async def fail(self, job: Job, error: str) -> str | None:
+        return await asyncio.to_thread(self._fail_sync, job, error)
+
+    async def reap_exhausted(self) -> list[Job]:
+        return await asyncio.to_thread(self._reap_exhausted_sync)
+
+    async def get(self, job_id: str) -> Job | None:
+        return await asyncio.to_thread(self._get_sync, job_id)
+
+    async def stats(self) -> dict:
+        return await asyncio.to_thread(self._stats_sync)
+
+
+job_queue = SQLiteJobQueue(
+    path=settings.job_queue_path,
+    visibility_timeout_seconds=settings.job_visibility_timeout_seconds,
+    max_attempts=settings.job_max_attempts,
+    retry_backoff_seconds=settings.job_retry_backoff_seconds,
+    done_retention_seconds=settings.job_done_retention_seconds,
+)
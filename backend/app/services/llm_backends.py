@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+from typing import AsyncIterator
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services.llm_cache import compute_request_key
+
+
+class Completion(BaseModel):
+    """
+    A model response. completion_tokens is None when the backend does not report
+    usage; truncated is True when generation stopped at max_tokens.
+    """
+
+    content: str = ""
+    completion_tokens: int | None = None
+    truncated: bool = False
+
+
+class LLMBackend:
+    """
+    Interface every chat completion backend implements. `request_payload` is an
+    OpenAI-style dict with model, messages, max_tokens and temperature.
+    """
+
+    name = "base"
+
+    async def complete(self, request_payload: dict) -> Completion:
+        raise NotImplementedError
+
+    async def open_stream(self, request_payload: dict, completion: Completion) -> AsyncIterator[str]:
+        """
+        Returns an async iterator of content deltas. Usage and finish reason are
+        written to `completion` once the stream reports them.
+        """
+        raise NotImplementedError
+
+
+class HuggingFaceBackend(LLMBackend):
+    name = "huggingface"
+
+    def __init__(self, token: str):
+        from huggingface_hub import AsyncInferenceClient
+
+        self.client = AsyncInferenceClient(token=token)
+
+    async def complete(self, request_payload: dict) -> Completion:
+        response = await self.client.chat_completion(**request_payload)
+        usage = getattr(response, "usage", None)
+        return Completion(
+            content=response.choices[0].message.content or "",
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            truncated=response.choices[0].finish_reason == "length",
+        )
+
+    async def open_stream(self, request_payload: dict, completion: Completion) -> AsyncIterator[str]:
+        stream = await self.client.chat_completion(**request_payload, stream=True)
+        return self._iter_deltas(stream, completion)
+
+    @staticmethod
+    async def _iter_deltas(stream, completion: Completion) -> AsyncIterator[str]:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if getattr(usage, "completion_tokens", None) is not None:
+                completion.completion_tokens = usage.completion_tokens
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason == "length":
+                completion.truncated = True
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Talks to any server exposing POST {base_url}/chat/completions (vLLM, llama.cpp, Ollama, TGI)."""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: str):
+        import httpx
+
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        self.client = httpx.AsyncClient(base_url=base_url.rstrip("/"), headers=headers, timeout=None)
+
+    async def complete(self, request_payload: dict) -> Completion:
+        response = await self.client.post("/chat/completions", json=request_payload)
+        response.raise_for_status()
+        data = response.json()
+        choice = data["choices"][0]
+        return Completion(
+            content=choice["message"].get("content") or "",
+            completion_tokens=(data.get("usage") or {}).get("completion_tokens"),
+            truncated=choice.get("finish_reason") == "length",
+        )
+
+    async def open_stream(self, request_payload: dict, completion: Completion) -> AsyncIterator[str]:
+        return self._iter_deltas({**request_payload, "stream": True}, completion)
+
+    async def _iter_deltas(self, request_payload: dict, completion: Completion) -> AsyncIterator[str]:
+        async with self.client.stream("POST", "/chat/completions", json=request_payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if (chunk.get("usage") or {}).get("completion_tokens") is not None:
+                    completion.completion_tokens = chunk["usage"]["completion_tokens"]
+                choices = chunk.get("choices") or []
+                if choices and choices[0].get("finish_reason") == "length":
+                    completion.truncated = True
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if delta:
+                    yield delta
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Deterministic offline stand-in. In "record" mode every request is forwarded to
+    a live backend and the response is saved under a hash of the request; in
+    "replay" mode recordings are served back with a simulated latency of
+    base + per_token * output_tokens (+/- a jitter seeded by the request hash).
+    Unknown requests fall back to a recording made for the same system prompt,
+    so a few recorded runs can drive load tests over arbitrary documents.
+    """
+
+    def __init__(self, recordings_dir: str, mode: str, upstream: LLMBackend | None = None):
+        self.name = mode
+        self.recordings_dir = recordings_dir
+        self.mode = mode
+        self.upstream = upstream
+        self._recordings: dict[str, str] = {}
+        self._by_system_prompt: dict[str, list[str]] = {}
+        self._load_recordings()
+
+    @staticmethod
+    def _system_prompt_key(request_payload: dict) -> str:
+        system_messages = [message["content"] for message in request_payload["messages"] if message["role"] == "system"]
+        return compute_request_key({"system": system_messages})
+
+    def _load_recordings(self) -> None:
+        if not os.path.isdir(self.recordings_dir):
+            return
+        for file_name in sorted(os.listdir(self.recordings_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.recordings_dir, file_name), "r", encoding="utf-8") as recording_file:
+                    recording = json.load(recording_file)
+            except Exception as load_err:
+                print(f"Skipping unreadable LLM recording {file_name}: {load_err}")
+                continue
+            self._remember(recording["key"], recording["system_key"], recording["content"])
+
+    def _remember(self, key: str, system_key: str, content: str) -> None:
+        if key not in self._recordings:
+            self._by_system_prompt.setdefault(system_key, []).append(key)
+        self._recordings[key] = content
+
+    def _save_recording(self, request_payload: dict, key: str, system_key: str, content: str) -> None:
+        os.makedirs(self.recordings_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.recordings_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as recording_file:
+            json.dump(
+                {"key": key, "system_key": system_key, "request": request_payload, "content": content},
+                recording_file,
+                ensure_ascii=False,
+            )
+        os.replace(temp_path, os.path.join(self.recordings_dir, f"{key}.json"))
+
+    def _lookup(self, request_payload: dict) -> tuple[str, str]:
+        key = compute_request_key(request_payload)
+        if key in self._recordings:
+            return key, self._recordings[key]
+        candidates = self._by_system_prompt.get(self._system_prompt_key(request_payload))
+        if candidates and not settings.llm_replay_strict:
+            fallback_key = candidates[int(key, 16) % len(candidates)]
+            return key, self._recordings[fallback_key]
+        raise LookupError(f"No LLM recording for request {key[:12]} in {self.recordings_dir}")
+
+    def _simulated_latency(self, key: str, content: str) -> float:
+        output_tokens = len(content) // 4
+        latency = settings.llm_replay_latency_base_seconds + output_tokens * settings.llm_replay_latency_per_token_seconds
+        jitter = settings.llm_replay_latency_jitter
+        if jitter:
+            latency *= 1 + random.Random(key).uniform(-jitter, jitter)
+        return max(0.0, latency)
+
+    async def _record(self, request_payload: dict) -> Completion:
+        completion = await self.upstream.complete(request_payload)
+        key = compute_request_key(request_payload)
+        system_key = self._system_prompt_key(request_payload)
+        self._remember(key, system_key, completion.content)
+        await asyncio.to_thread(self._save_recording, request_payload, key, system_key, completion.content)
+        return completion
+
+    async def complete(self, request_payload: dict) -> Completion:
+        if self.mode == "record":
+            return await self._record(request_payload)
+        key, content = self._lookup(request_payload)
+        await asyncio.sleep(self._simulated_latency(key, content))
+        return Completion(content=content)
+
+    async def open_stream(self, request_payload: dict, completion: Completion) -> AsyncIterator[str]:
+        if self.mode == "record":
+            recorded = await self._record(request_payload)
+            completion.completion_tokens = recorded.completion_tokens
+            completion.truncated = recorded.truncated
+            return self._replay_deltas(recorded.content, 0.0)
+        key, content = self._lookup(request_payload)
+        return self._replay_deltas(content, self._simulated_latency(key, content))
+
+    @staticmethod
+    async def _replay_deltas(content: str, latency: float, chunk_chars: int = 16) -> AsyncIterator[str]:
+        chunks = [content[index:index + chunk_chars] for index in range(0, len(content), chunk_chars)] or [""]
+        delay = latency / len(chunks)
+        for chunk in chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+def create_llm_backend() -> LLMBackend:
+    backend_name = settings.llm_backend.strip().lower()
+    if backend_name == "huggingface":
+        return HuggingFaceBackend(token=settings.huggingface_api_key)
+    if backend_name == "openai":
+        return OpenAICompatibleBackend(base_url=settings.llm_openai_base_url, api_key=settings.llm_openai_api_key)
+    if backend_name == "replay":
+        return RecordReplayBackend(settings.llm_replay_dir, mode="replay")
+    if backend_name == "record":
+        upstream_name = settings.llm_record_upstream.strip().lower()
+        upstream = (
+            OpenAICompatibleBackend(base_url=settings.llm_openai_base_url, api_key=settings.llm_openai_api_key)
+            if upstream_name == "openai"
+            else HuggingFaceBackend(token=settings.huggingface_api_key)
+        )
+        return RecordReplayBackend(settings.llm_replay_dir, mode="record", upstream=upstream)
+    raise ValueError(f"Unknown LLM backend '{settings.llm_backend}'. Use huggingface, openai, replay or record.")
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+
+
+def compute_request_key(payload: dict) -> str:
+    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for chat completion content: an in-process LRU bounded by
+    entry count and TTL, backed by one JSON file per key on disk so identical
+    requests stay cached across restarts.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, cache_dir: str | None):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and (time.time() - created_at) > self.ttl_seconds
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, created_at: float, content: str) -> None:
+        self._memory[key] = (created_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                record = json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except Exception as read_err:
+            print(f"Failed to read LLM cache entry {key}: {read_err}")
+            return None
+
+        created_at = float(record.get("created_at") or 0)
+        content = record.get("content")
+        if not isinstance(content, str) or self._is_expired(created_at):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return created_at, content
+
+    def _write_disk(self, key: str, created_at: float, content: str) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+                json.dump({"created_at": created_at, "content": content}, cache_file, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    async def get(self, key: str) -> str | None:
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, content = entry
+            if not self._is_expired(created_at):
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return content
+            del self._memory[key]
+
+        if self.cache_dir:
+            disk_entry = await asyncio.to_thread(self._read_disk, key)
+            if disk_entry is not None:
+                created_at, content = disk_entry
+                self._remember(key, created_at, content)
+                self._counters["disk_hits"] += 1
+                return content
+
+        self._counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, content: str) -> None:
+        created_at = time.time()
+        self._remember(key, created_at, content)
+        self._counters["writes"] += 1
+        if self.cache_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, created_at, content)
+            except Exception as write_err:
+                print(f"Failed to persist LLM cache entry {key}: {write_err}")
+
+    def record_bypass(self) -> None:
+        self._counters["bypassed"] += 1
+
+    def stats(self) -> dict:
+        hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            **self._counters,
+            "hits": hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+llm_cache = LLMResponseCache(
+    max_entries=settings.llm_cache_max_entries,
+    ttl_seconds=settings.llm_cache_ttl_seconds,
+    cache_dir=settings.llm_cache_dir or None,
+)
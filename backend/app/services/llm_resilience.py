@@ -0,0 +1,279 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(Exception):
+    """The inference endpoint could not produce a response within the retry/deadline policy."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+def _status_code_of(error: Exception) -> int | None:
+    for candidate in (error, getattr(error, "response", None)):
+        if candidate is None:
+            continue
+        for attribute in ("status_code", "status"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status_code = _status_code_of(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    error_name = type(error).__name__
+    return any(marker in error_name for marker in ("Connection", "Connector", "Disconnected", "Timeout"))
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the reset timeout elapses."""
+
+    def __init__(self, failure_threshold: int, reset_timeout_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_seconds:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self._probe_in_flight or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Gives up a probe that ended without an outcome (e.g. cancelled), so the next request can probe."""
+        self._probe_in_flight = False
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class ResilientCaller:
+    """
+    Wraps upstream inference calls with an overall deadline, per-attempt timeouts,
+    jittered exponential retry on retryable errors, optional hedged duplicates after
+    the observed p95 latency, and a circuit breaker shared by all callers.
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.llm_circuit_failure_threshold,
+            reset_timeout_seconds=settings.llm_circuit_reset_seconds,
+        )
+        self.latency = LatencyTracker()
+        self._counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "short_circuited": 0,
+        }
+
+    def _hedge_delay(self) -> float | None:
+        if not settings.llm_hedge_enabled or len(self.latency) < settings.llm_hedge_min_samples:
+            return None
+        return self.latency.percentile(0.95)
+
+    async def _run_attempt(self, operation: Callable[[float], Awaitable[T]], attempt_timeout: float) -> T:
+        started_at = time.monotonic()
+        primary = asyncio.ensure_future(operation(attempt_timeout))
+        pending = {primary}
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self._counters["hedges"] += 1
+                    pending.add(asyncio.ensure_future(operation(attempt_timeout)))
+
+            last_error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._counters["hedge_wins"] += 1
+                        self.latency.record(time.monotonic() - started_at)
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(
+        self,
+        operation: Callable[[float], Awaitable[T]],
+        deadline_seconds: float | None = None,
+    ) -> T:
+        """
+        Runs `operation(attempt_timeout)` until it succeeds, a non-retryable error is
+        raised, retries are exhausted or the deadline passes.
+        """
+        self._counters["calls"] += 1
+        probing = self.breaker.state == "half_open"
+        if not self.breaker.allow_request():
+            self._counters["short_circuited"] += 1
+            raise CircuitOpenError("Inference endpoint circuit is open; failing fast.")
+
+        try:
+            return await self._call_with_retries(operation, deadline_seconds)
+        finally:
+            # A cancelled probe records nothing; without this the breaker would stay half-open for good.
+            if probing:
+                self.breaker.release_probe()
+
+    async def _call_with_retries(
+        self,
+        operation: Callable[[float], Awaitable[T]],
+        deadline_seconds: float | None,
+    ) -> T:
+        deadline = time.monotonic() + (deadline_seconds or settings.llm_request_deadline_seconds)
+        max_attempts = max(1, settings.llm_max_retries + 1)
+        last_error: Exception | None = None
+
+        for attempt in range(max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            attempt_timeout = min(remaining, settings.llm_attempt_timeout_seconds)
+            try:
+                result = await asyncio.wait_for(self._run_attempt(operation, attempt_timeout), timeout=remaining)
+                self.breaker.record_success()
+                self._counters["successes"] += 1
+                return result
+            except Exception as error:
+                last_error = error
+                if isinstance(error, asyncio.TimeoutError):
+                    self._counters["timeouts"] += 1
+                if not is_retryable_error(error):
+                    self._counters["failures"] += 1
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= max_attempts or self.breaker.state == "open":
+                    break
+
+            backoff = min(
+                settings.llm_retry_max_backoff_seconds,
+                settings.llm_retry_base_backoff_seconds * (2 ** attempt),
+            )
+            delay = random.uniform(0, backoff)
+            if time.monotonic() + delay >= deadline:
+                break
+            self._counters["retries"] += 1
+            print(f"Retrying inference call in {delay:.2f}s after: {last_error!r}")
+            await asyncio.sleep(delay)
+
+        self._counters["failures"] += 1
+        raise LLMUnavailableError(f"Inference call failed after retries: {last_error!r}") from last_error
+
+    async def stream(self, open_stream: Callable[[], Awaitable[AsyncIterator[T]]]) -> AsyncIterator[T]:
+        """
+        Guards a streaming call with the circuit breaker and an idle timeout between
+        items. Streams are not retried: deltas may already have reached the client.
+        """
+        self._counters["calls"] += 1
+        probing = self.breaker.state == "half_open"
+        if not self.breaker.allow_request():
+            self._counters["short_circuited"] += 1
+            raise CircuitOpenError("Inference endpoint circuit is open; failing fast.")
+
+        idle_timeout = settings.llm_stream_idle_timeout_seconds
+        started_at = time.monotonic()
+        try:
+            stream = await asyncio.wait_for(open_stream(), timeout=idle_timeout)
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    item = await asyncio.wait_for(iterator.__anext__(), timeout=idle_timeout)
+                except StopAsyncIteration:
+                    break
+                yield item
+        except Exception as error:
+            self._counters["failures"] += 1
+            if isinstance(error, asyncio.TimeoutError):
+                self._counters["timeouts"] += 1
+            if is_retryable_error(error):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        finally:
+            # Covers GeneratorExit/CancelledError when the client disconnects mid-stream.
+            if probing:
+                self.breaker.release_probe()
+
+        self.breaker.record_success()
+        self._counters["successes"] += 1
+        self.latency.record(time.monotonic() - started_at)
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            **self._counters,
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "latency_p50_seconds": round(p50, 3) if p50 is not None else None,
+            "latency_p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+llm_resilience = ResilientCaller()
@@ -0,0 +1,98 @@
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+# Default route per analyzer task. "tier" picks between LLM_MODEL ("large") and
+# LLM_SMALL_MODEL ("small"); with no small model configured every task runs on
+# LLM_MODEL. "deadline_seconds" bounds a call including its retries (never more
+# than LLM_REQUEST_DEADLINE_SECONDS). LLM_TASK_ROUTES (JSON) may override model,
+# temperature, latency_slo_seconds or deadline_seconds for any task.
+DEFAULT_TASK_ROUTES: dict[str, dict[str, object]] = {
+    "analysis": {"tier": "large", "temperature": 0.2, "latency_slo_seconds": 90, "deadline_seconds": 300},
+    "upgrade": {"tier": "large", "temperature": 0.15, "latency_slo_seconds": 90, "deadline_seconds": 300},
+    "chunk_extraction": {"tier": "small", "temperature": 0.1, "latency_slo_seconds": 30, "deadline_seconds": 120},
+    "refine": {"tier": "large", "temperature": 0.2, "latency_slo_seconds": 60, "deadline_seconds": 180},
+    "chat_intent": {"tier": "small", "temperature": 0.0, "latency_slo_seconds": 3, "deadline_seconds": 10},
+    "chat_answer": {"tier": "small", "temperature": 0.3, "latency_slo_seconds": 15, "deadline_seconds": 45},
+    "chat_update": {"tier": "large", "temperature": 0.3, "latency_slo_seconds": 60, "deadline_seconds": 180},
+    "test_cases": {"tier": "large", "temperature": 0.3, "latency_slo_seconds": 90, "deadline_seconds": 300},
+    "qa_intelligence": {"tier": "large", "temperature": 0.2, "latency_slo_seconds": 90, "deadline_seconds": 300},
+    "automation": {"tier": "small", "temperature": 0.15, "latency_slo_seconds": 30, "deadline_seconds": 90},
+}
+
+
+class TaskRoute(BaseModel):
+    task: str
+    model: str
+    temperature: float
+    latency_slo_seconds: float
+    deadline_seconds: float
+
+
+class TaskRouter:
+    """Resolves the model/temperature/SLO/deadline for each task and tracks SLO attainment and escalations."""
+
+    def __init__(self):
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def resolve(self, task: str) -> TaskRoute:
+        route = dict(DEFAULT_TASK_ROUTES[task])
+        route.update(settings.llm_task_routes.get(task) or {})
+        model = route.get("model")
+        if not model:
+            model = settings.llm_small_model if route.get("tier") == "small" else ""
+        return TaskRoute(
+            task=task,
+            model=model or settings.llm_model,
+            temperature=float(route["temperature"]),
+            latency_slo_seconds=float(route["latency_slo_seconds"]),
+            deadline_seconds=min(
+                float(route.get("deadline_seconds") or settings.llm_request_deadline_seconds),
+                settings.llm_request_deadline_seconds,
+            ),
+        )
+
+    def escalation_model(self, model: str) -> str | None:
+        """The large model to retry with after a parse/validation failure, if not already used."""
+        return settings.llm_model if model != settings.llm_model else None
+
+    def _task_stats(self, task: str) -> dict[str, float]:
+        return self._stats.setdefault(
+            task,
+            {"calls": 0, "total_seconds": 0.0, "slo_violations": 0, "validation_failures": 0, "escalations": 0},
+        )
+
+    def record_call(self, route: TaskRoute, seconds: float) -> None:
+        stats = self._task_stats(route.task)
+        stats["calls"] += 1
+        stats["total_seconds"] += seconds
+        if seconds > route.latency_slo_seconds:
+            stats["slo_violations"] += 1
+
+    def record_validation_failure(self, task: str, escalated: bool) -> None:
+        stats = self._task_stats(task)
+        stats["validation_failures"] += 1
+        if escalated:
+            stats["escalations"] += 1
+
+    def stats(self) -> dict:
+        report = {}
+        for task in DEFAULT_TASK_ROUTES:
+            route = self.resolve(task)
+            stats = self._task_stats(task)
+            calls = int(stats["calls"])
+            report[task] = {
+                "model": route.model,
+                "temperature": route.temperature,
+                "latency_slo_seconds": route.latency_slo_seconds,
+                "deadline_seconds": route.deadline_seconds,
+                "calls": calls,
+                "avg_seconds": round(stats["total_seconds"] / calls, 3) if calls else None,
+                "slo_violations": int(stats["slo_violations"]),
+                "validation_failures": int(stats["validation_failures"]),
+                "escalations": int(stats["escalations"]),
+            }
+        return report
+
+
+task_router = TaskRouter()
@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+
+from app.core.config import settings
+
+
+class InferencePriority(IntEnum):
+    """Lower value is served first."""
+
+    INTERACTIVE = 0  # chat / refine, a user is waiting on the reply
+    ON_DEMAND = 1  # test case, QA intelligence and automation generation
+    BACKGROUND = 2  # upload analysis pipeline
+
+
+class InferenceScheduler:
+    """
+    Admission control for the shared inference client. Requests acquire one of
+    `max_concurrency` slots plus an estimated token cost from a per-minute token
+    bucket; waiters are served strictly by priority, FIFO within a priority.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self._in_flight = 0
+        self._tokens = float(self.tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._waiters: list[tuple[int, int, asyncio.Future, int]] = []
+        self._sequence = itertools.count()
+        self._retry_handle: asyncio.TimerHandle | None = None
+        self._stats = {
+            priority.name.lower(): {"admitted": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for priority in InferencePriority
+        }
+
+    def _refill(self) -> None:
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._last_refill) * self.tokens_per_minute / 60.0,
+        )
+        self._last_refill = now
+
+    def _token_cost(self, estimated_tokens: int) -> int:
+        # A single request may never need more than a full bucket, or it would wait forever.
+        if not self.tokens_per_minute:
+            return 0
+        return min(max(0, estimated_tokens), self.tokens_per_minute)
+
+    def _dispatch(self) -> None:
+        self._refill()
+        while self._waiters and self._in_flight < self.max_concurrency:
+            priority, _, future, cost = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if cost > self._tokens:
+                self._schedule_retry(cost)
+                return
+            heapq.heappop(self._waiters)
+            self._tokens -= cost
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _schedule_retry(self, cost: int) -> None:
+        if self._retry_handle is not None:
+            return
+        deficit = cost - self._tokens
+        delay = max(0.05, deficit * 60.0 / self.tokens_per_minute)
+
+        def _retry() -> None:
+            self._retry_handle = None
+            self._dispatch()
+
+        self._retry_handle = asyncio.get_running_loop().call_later(delay, _retry)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: InferencePriority, estimated_tokens: int = 0):
+        cost = self._token_cost(estimated_tokens)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future, cost))
+        enqueued_at = time.monotonic()
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted between the wake-up and the cancellation: hand the slot back.
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                future.cancel()
+                self._dispatch()
+            raise
+
+        waited = time.monotonic() - enqueued_at
+        stats = self._stats[priority.name.lower()]
+        stats["admitted"] += 1
+        stats["total_wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        self._refill()
+        queued = {priority.name.lower(): 0 for priority in InferencePriority}
+        for priority, _, future, _ in self._waiters:
+            if not future.done():
+                queued[InferencePriority(priority).name.lower()] += 1
+
+        per_priority = {}
+        for name, stats in self._stats.items():
+            admitted = stats["admitted"]
+            per_priority[name] = {
+                "queued": queued[name],
+                "admitted": admitted,
+                "avg_wait_seconds": round(stats["total_wait_seconds"] / admitted, 3) if admitted else 0.0,
+                "max_wait_seconds": round(stats["max_wait_seconds"], 3),
+            }
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "queue_depth": sum(queued.values()),
+            "tokens_per_minute": self.tokens_per_minute,
+            "tokens_available": round(self._tokens) if self.tokens_per_minute else None,
+            "priorities": per_priority,
+        }
+
+
+inference_scheduler = InferenceScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    tokens_per_minute=settings.llm_tokens_per_minute,
+)
@@ -0,0 +1,101 @@
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+# Output-token profiles per prompt type. The raw estimate is
+#   base + sum(coefficient * feature)
+# over the features a caller supplies (input_tokens, sections, bullets, items),
+# clamped to [minimum, maximum]. `fixed` is the historical static max_tokens used
+# when adaptive budgeting is disabled.
+OUTPUT_PROFILES: dict[str, dict[str, float]] = {
+    "analysis": {"base": 800, "input_tokens": 0.9, "minimum": 1500, "maximum": 6000, "fixed": 4000},
+    "upgrade": {"base": 800, "input_tokens": 1.1, "items": 150, "minimum": 2000, "maximum": 6000, "fixed": 4000},
+    "refine": {"base": 500, "input_tokens": 1.15, "minimum": 1500, "maximum": 6000, "fixed": 4000},
+    "chat_intent": {"base": 24, "minimum": 16, "maximum": 64, "fixed": 32},
+    "chat_answer": {"base": 500, "minimum": 400, "maximum": 1500, "fixed": 4000},
+    "chat_update": {"base": 400, "input_tokens": 1.15, "minimum": 1000, "maximum": 6000, "fixed": 4000},
+    "chunk_extraction": {"base": 200, "input_tokens": 0.35, "minimum": 500, "maximum": 1500, "fixed": 1500},
+    "test_cases": {"base": 600, "sections": 200, "bullets": 260, "minimum": 1500, "maximum": 8192, "fixed": 8000},
+    "qa_intelligence": {"base": 900, "sections": 150, "items": 90, "minimum": 1500, "maximum": 8192, "fixed": 8000},
+    "automation": {"base": 1200, "items": 140, "minimum": 1500, "maximum": 4000, "fixed": 4000},
+}
+
+# Observed outputs are scaled by this headroom before they feed the calibration,
+# so budgets converge slightly above what the model actually uses.
+CALIBRATION_HEADROOM = 1.3
+CALIBRATION_ALPHA = 0.2
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class OutputBudget(BaseModel):
+    """max_tokens for one request, and the raw (uncalibrated, unclamped) estimate it came from."""
+
+    max_tokens: int
+    raw_estimate: float
+
+
+class OutputTokenEstimator:
+    """
+    Picks max_tokens per prompt type from input size and document shape, and
+    self-calibrates a per-type multiplier from the output sizes actually observed.
+    """
+
+    def __init__(self):
+        self._calibration: dict[str, dict[str, float]] = {
+            task: {"factor": 1.0, "samples": 0, "output_tokens": 0, "truncations": 0}
+            for task in OUTPUT_PROFILES
+        }
+
+    def estimate(self, task: str, **features: float) -> OutputBudget:
+        profile = OUTPUT_PROFILES[task]
+        raw_estimate = profile["base"] + sum(
+            profile.get(feature, 0) * value for feature, value in features.items()
+        )
+        if not settings.llm_adaptive_max_tokens:
+            return OutputBudget(max_tokens=int(profile["fixed"]), raw_estimate=raw_estimate)
+
+        calibrated = raw_estimate * self._calibration[task]["factor"]
+        maximum = min(profile["maximum"], settings.llm_max_output_tokens)
+        return OutputBudget(max_tokens=int(max(profile["minimum"], min(maximum, calibrated))), raw_estimate=raw_estimate)
+
+    def record(self, task: str, budget: OutputBudget, output_tokens: int, truncated: bool = False) -> None:
+        """
+        `output_tokens` should be the backend's reported completion_tokens and
+        `truncated` its finish_reason == "length"; the 97% check only covers
+        backends that report neither. The factor is calibrated against the raw
+        estimate, not the clamped max_tokens, so hitting a profile's minimum or
+        maximum does not skew it.
+        """
+        calibration = self._calibration.get(task)
+        if calibration is None:
+            return
+
+        calibration["samples"] += 1
+        calibration["output_tokens"] += output_tokens
+        observed_factor = (output_tokens * CALIBRATION_HEADROOM) / max(1.0, budget.raw_estimate)
+        if truncated or output_tokens >= budget.max_tokens * 0.97:
+            # Probably truncated: the real need is unknown, so grow decisively.
+            calibration["truncations"] += 1
+            observed_factor = max(observed_factor, calibration["factor"] * 1.5)
+
+        calibration["factor"] = min(
+            4.0,
+            max(0.25, (1 - CALIBRATION_ALPHA) * calibration["factor"] + CALIBRATION_ALPHA * observed_factor),
+        )
+
+    def stats(self) -> dict:
+        return {
+            task: {
+                "samples": int(calibration["samples"]),
+                "factor": round(calibration["factor"], 3),
+                "avg_output_tokens": round(calibration["output_tokens"] / calibration["samples"]) if calibration["samples"] else None,
+                "truncations": int(calibration["truncations"]),
+            }
+            for task, calibration in self._calibration.items()
+        }
+
+
+output_estimator = OutputTokenEstimator()
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import AsyncIterator
+
+from app.core.config import settings
+
+PIPELINE_EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pipeline_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    prd_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    detail TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pipeline_events_prd_idx ON pipeline_events (prd_id, seq);
+"""
+
+# Stages after which a PRD's pipeline emits nothing more
+TERMINAL_STAGES = {"completed", "failed"}
+
+# Not a stage: a chunk of the standardized PRD text while the analysis pass decodes it
+DRAFT_EVENT = "draft"
+
+
+class PipelineProgress:
+    """
+    Emits the stage events of one pipeline run with elapsed and per-stage
+    timings, and the analysis draft text in chunks of at most one per
+    pipeline_draft_publish_seconds.
+    """
+
+    def __init__(self, prd_id: str, attempt: int = 1):
+        self.prd_id = prd_id
+        self.attempt = attempt
+        self._started = time.perf_counter()
+        self._stage_started = self._started
+        self._draft_parts: list[str] = []
+        self._draft_published_at = 0.0
+
+    async def draft(self, text: str) -> None:
+        self._draft_parts.append(text)
+        if time.perf_counter() - self._draft_published_at >= settings.pipeline_draft_publish_seconds:
+            await self._flush_draft()
+
+    async def _flush_draft(self) -> None:
+        if not self._draft_parts:
+            return
+        text = "".join(self._draft_parts)
+        self._draft_parts = []
+        self._draft_published_at = time.perf_counter()
+        await pipeline_events.publish(self.prd_id, DRAFT_EVENT, text=text, attempt=self.attempt)
+
+    async def emit(self, stage: str, **detail) -> None:
+        # The draft ends where the next stage begins.
+        await self._flush_draft()
+        now = time.perf_counter()
+        detail.update(
+            attempt=self.attempt,
+            elapsed_seconds=round(now - self._started, 2),
+            previous_stage_seconds=round(now - self._stage_started, 2),
+        )
+        self._stage_started = now
+        await pipeline_events.publish(self.prd_id, stage, **detail)
+
+
+class PipelineEventLog:
+    """
+    Append-only log of pipeline stage events, kept in the job queue's SQLite
+    file so worker processes and the API share it. Each API process runs one
+    tailer that reads new rows every pipeline_events_poll_seconds and fans them
+    out to its SSE subscribers, so the cost is one local query per interval
+    however many browsers are watching.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+        self._subscribers: set[tuple[str | None, asyncio.Queue]] = set()
+        self._tailer: asyncio.Task | None = None
+        # Highest seq the tailer has fanned out; later events reach subscribers through their queues.
+        self._tail_seq = 0
+        self._published = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(PIPELINE_EVENTS_SCHEMA)
+            self._initialized = True
+        return connection
+
+    @staticmethod
+    def _row_to_event(row: sqlite3.Row) -> dict:
+        return {
+            "seq": row["seq"],
+            "prd_id": row["prd_id"],
+            "stage": row["stage"],
+            "created_at": row["created_at"],
+            **json.loads(row["detail"]),
+        }
+
+    def _publish_sync(self, prd_id: str, stage: str, detail: dict) -> None:
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT INTO pipeline_events (prd_id, stage, detail, created_at) VALUES (?, ?, ?, ?)",
+                (prd_id, stage, json.dumps(detail), now),
+            )
+            self._published += 1
+            if self._published % 500 == 0:
+                connection.execute(
+                    "DELETE FROM pipeline_events WHERE created_at < ?",
+                    (now - settings.pipeline_events_retention_seconds,),
+                )
+
+    def _read_after_sync(self, seq: int) -> list[dict]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT * FROM pipeline_events WHERE seq > ? ORDER BY seq LIMIT 500", (seq,)).fetchall()
+        return [self._row_to_event(row) for row in rows]
+
+    def _read_range_sync(self, prd_id: str | None, after_seq: int, up_to_seq: int) -> list[dict]:
+        query = "SELECT * FROM pipeline_events WHERE seq > ? AND seq <= ?"
+        params: tuple = (after_seq, up_to_seq)
+        if prd_id:
+            query += " AND prd_id = ?"
+            params += (prd_id,)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query + " ORDER BY seq", params).fetchall()
+        return [self._row_to_event(row) for row in rows]
+
+    def _last_seq_sync(self) -> int:
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COALESCE(MAX(seq), 0) AS seq FROM pipeline_events").fetchone()["seq"]
+
+    def _latest_for_prd_sync(self, prd_id: str) -> dict | None:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT * FROM pipeline_events WHERE prd_id = ? AND stage != ? ORDER BY seq DESC LIMIT 1",
+                (prd_id, DRAFT_EVENT),
+            ).fetchone()
+        return self._row_to_event(row) if row else None
+
+    def _current_run_sync(self, prd_id: str) -> list[dict]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT * FROM pipeline_events WHERE prd_id = ? AND seq >= COALESCE("
+                "(SELECT MAX(seq) FROM pipeline_events WHERE prd_id = ? AND stage IN ('queued', 'retrying', 'analyzing')), "
+                "(SELECT MAX(seq) FROM pipeline_events WHERE prd_id = ?)) ORDER BY seq",
+                (prd_id, prd_id, prd_id),
+            ).fetchall()
+        return [self._row_to_event(row) for row in rows]
+
+    async def publish(self, prd_id: str, stage: str, **detail) -> None:
+        # Progress is advisory: never let a failed write break the pipeline itself.
+        try:
+            await asyncio.to_thread(self._publish_sync, prd_id, stage, detail)
+        except Exception as publish_err:
+            print(f"Failed to publish pipeline event {stage} for PRD {prd_id}: {publish_err}")
+
+    async def latest_for_prd(self, prd_id: str) -> dict | None:
+        """The PRD's latest stage event (draft chunks are skipped)."""
+        return await asyncio.to_thread(self._latest_for_prd_sync, prd_id)
+
+    async def current_run(self, prd_id: str) -> list[dict]:
+        """
+        The PRD's events since it was last queued, retried or began its analysis
+        pass (draft chunks included), or just its latest event, so a viewer
+        joining mid-run can rebuild the current draft.
+        """
+        return await asyncio.to_thread(self._current_run_sync, prd_id)
+
+    async def _tail(self) -> None:
+        while self._subscribers:
+            try:
+                events = await asyncio.to_thread(self._read_after_sync, self._tail_seq)
+            except Exception as read_err:
+                print(f"Failed to read pipeline events: {read_err}")
+                events = []
+            for event in events:
+                self._tail_seq = event["seq"]
+                for prd_filter, queue in list(self._subscribers):
+                    if prd_filter is None or prd_filter == event["prd_id"]:
+                        queue.put_nowait(event)
+            if len(events) < 500:
+                await asyncio.sleep(settings.pipeline_events_poll_seconds)
+        self._tailer = None
+
+    async def subscribe(
+        self,
+        prd_id: str | None = None,
+        after_seq: int | None = None,
+        idle_seconds: float = 15,
+    ) -> AsyncIterator[dict | None]:
+        """
+        Yields events (for one PRD, or all PRDs) until the consumer stops
+        iterating, and None after idle_seconds without one (for keep-alives).
+        Starts with the events after `after_seq` when given, so a caller that
+        read a snapshot first misses nothing published in between; otherwise
+        with the events published from now on.
+        """
+        if self._tailer is None:
+            last_seq = await asyncio.to_thread(self._last_seq_sync)
+            if self._tailer is None:
+                self._tail_seq = last_seq
+                self._tailer = asyncio.create_task(self._tail())
+        # Registered in the same step as the position is read: everything after
+        # it arrives through the queue, everything up to it is replayed below.
+        subscriber = (prd_id, asyncio.Queue())
+        self._subscribers.add(subscriber)
+        replay_up_to = self._tail_seq
+        try:
+            if after_seq is not None and after_seq < replay_up_to:
+                for event in await asyncio.to_thread(self._read_range_sync, prd_id, after_seq, replay_up_to):
+                    yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), timeout=idle_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "tailing": self._tailer is not None}
+
+
+pipeline_events = PipelineEventLog(settings.job_queue_path)
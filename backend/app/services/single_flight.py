@@ -0,0 +1,38 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts the work,
+    later callers await the same task instead of starting duplicate LLM generations.
+    The shared task is shielded so one caller disconnecting does not cancel it for
+    the others.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self._counters = {"leaders": 0, "followers": 0}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        existing = self._in_flight.get(key)
+        if existing is not None:
+            self._counters["followers"] += 1
+            return await asyncio.shield(existing)
+
+        task = asyncio.ensure_future(factory())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        self._counters["leaders"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "in_flight": len(self._in_flight),
+        }
+
+
+generation_flights = SingleFlight()
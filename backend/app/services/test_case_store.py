@@ -0,0 +1,94 @@
+import hashlib
+import re
+
+from app.core.repository import repository
+from app.models.schemas import TestCaseSchema
+from app.services.content_hashes import test_case_hash, test_suite_hash
+
+# Fields that identify a test case across regenerations; the rest is its content
+TEST_CASE_IDENTITY_FIELDS = ("feature_name", "sub_feature_name", "testing_type", "scenario")
+
+
+def _normalize(value: object) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def test_case_key(test_case: dict, occurrence: int = 0) -> str:
+    """
+    Stable key derived from what the case tests, not how it is worded in
+    detail. Identical identities within one generation are told apart by
+    their occurrence index.
+    """
+    identity = "\x1f".join(_normalize(test_case.get(field)) for field in TEST_CASE_IDENTITY_FIELDS)
+    return hashlib.sha256(f"{identity}\x1e{occurrence}".encode("utf-8")).hexdigest()[:32]
+
+
+def diff_test_cases(existing_rows: list[dict], test_cases: list[dict]) -> tuple[list[dict], list[str], dict]:
+    """
+    Returns (rows to upsert, ids to delete, counts). Existing rows without a
+    case_key (stored before keys existed) are replaced.
+    """
+    existing_by_key = {row["case_key"]: row for row in existing_rows if row.get("case_key")}
+    occurrences: dict[str, int] = {}
+    upserts: list[dict] = []
+    kept_keys: set[str] = set()
+    counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+    for test_case in test_cases:
+        identity_key = test_case_key(test_case)
+        occurrence = occurrences.get(identity_key, 0)
+        occurrences[identity_key] = occurrence + 1
+        key = test_case_key(test_case, occurrence)
+        content_hash = test_case_hash(test_case)
+        kept_keys.add(key)
+
+        existing = existing_by_key.get(key)
+        if existing is None:
+            counts["inserted"] += 1
+        elif existing.get("case_hash") != content_hash:
+            counts["updated"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+        upserts.append({**test_case, "case_key": key, "case_hash": content_hash})
+
+    delete_ids = [row["id"] for row in existing_rows if row.get("case_key") not in kept_keys]
+    counts["deleted"] = len(delete_ids)
+    return upserts, delete_ids, counts
+
+
+def _is_missing_sync_function_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return "sync_test_cases" in message and (
+        "could not find" in message or "does not exist" in message or "schema cache" in message
+    )
+
+
+async def persist_test_cases(prd_id: str, test_cases: list[TestCaseSchema]) -> dict:
+    """
+    Stores a regenerated test suite by applying only the difference against
+    the stored one: new cases are inserted, changed ones updated in place and
+    dropped ones deleted, all in one atomic sync_test_cases call that also
+    stamps the suite's test_cases_hash on the analysis. Returns the
+    per-operation counts.
+    """
+    rows = [test_case.model_dump() if hasattr(test_case, "model_dump") else test_case.dict() for test_case in test_cases]
+    existing_rows = await repository.get_test_cases(prd_id)
+    upserts, delete_ids, counts = diff_test_cases(existing_rows, rows)
+    suite_hash = test_suite_hash(rows)
+    if not upserts and not delete_ids:
+        # Same suite; only make sure the analysis carries its stamp (older rows have none).
+        await repository.update_analysis(prd_id, {"test_cases_hash": suite_hash})
+        return counts
+
+    try:
+        await repository.sync_test_cases(prd_id, upserts, delete_ids, suite_hash)
+    except Exception as sync_err:
+        if not _is_missing_sync_function_error(sync_err):
+            raise
+        # Database predates the sync_test_cases migration: fall back to a full replace.
+        print("sync_test_cases function does not exist yet; replacing all test cases.")
+        await repository.replace_test_cases(prd_id, [{**row, "prd_id": prd_id} for row in rows])
+        await repository.update_analysis(prd_id, {"test_cases_hash": suite_hash})
+        counts = {"inserted": len(rows), "updated": 0, "deleted": len(existing_rows), "unchanged": 0}
+    return counts
@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+from typing import Callable
+
+from fastapi import Request
+from pydantic import BaseModel
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import settings
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Leading bytes an upload's type is sniffed from
+SNIFF_BYTES = 4096
+
+
+class UploadRejectedError(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class SpooledUpload(BaseModel):
+    path: str
+    filename: str
+    size: int
+    sha256: str
+
+
+def sniff_document_type(head: bytes) -> str | None:
+    """Identifies an upload from its leading bytes: "pdf", "docx" (zip container), "md" (UTF-8 text) or None."""
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return "docx"
+    if b"\x00" in head:
+        return None
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as decode_err:
+        # The first chunk may end mid-way through a multi-byte character.
+        if decode_err.start < len(head) - 3:
+            return None
+    return "md"
+
+
+def _extension_type(filename: str) -> str | None:
+    extension = os.path.splitext(filename.lower())[1]
+    return {".pdf": "pdf", ".docx": "docx", ".md": "md", ".zip": "zip"}.get(extension)
+
+
+def discard_spooled_upload(path: str | None) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _SpoolingPart:
+    """One file part of a multipart body, written to upload_spool_dir as it is parsed."""
+
+    def __init__(self, filename: str, expected_type: str, max_bytes: int):
+        self.filename = filename
+        self.expected_type = expected_type
+        self.max_bytes = max_bytes
+        self.path: str | None = None
+        self.size = 0
+        self._head = bytearray()
+        self._spool_file = None
+        self._digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejectedError(413, f"File exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit")
+        self._digest.update(data)
+        if self._spool_file is not None:
+            self._spool_file.write(data)
+            return
+        self._head += data
+        if len(self._head) >= SNIFF_BYTES:
+            self._open()
+
+    def _open(self) -> None:
+        # The type is checked from the leading bytes before anything reaches the disk.
+        # A .docx is itself a zip container, so both share the same magic bytes.
+        sniffed_type = sniff_document_type(bytes(self._head[:SNIFF_BYTES]))
+        if sniffed_type != self.expected_type and not (self.expected_type == "zip" and sniffed_type == "docx"):
+            raise UploadRejectedError(400, f"File content does not look like a .{self.expected_type} document")
+        os.makedirs(settings.upload_spool_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=settings.upload_spool_dir, suffix=f".{self.expected_type}")
+        self._spool_file = os.fdopen(fd, "wb")
+        self._spool_file.write(self._head)
+        self._head = bytearray()
+
+    def finish(self) -> SpooledUpload:
+        if self._spool_file is None:
+            self._open()
+        self._spool_file.close()
+        return SpooledUpload(path=self.path, filename=self.filename, size=self.size, sha256=self._digest.hexdigest())
+
+    def discard(self) -> None:
+        if self._spool_file is not None:
+            self._spool_file.close()
+        discard_spooled_upload(self.path)
+
+
+class _MultipartUploadSpooler:
+    """
+    python-multipart callbacks that spool every file part named `field_name`;
+    other fields are ignored. With fail_fast a rejected part aborts the parse,
+    otherwise it is recorded in `rejected` and its remaining bytes are skipped.
+    """
+
+    def __init__(self, field_name: str, allow_zip: bool, max_files: int | None, fail_fast: bool):
+        self.field_name = field_name.encode("utf-8")
+        self.allow_zip = allow_zip
+        self.max_files = max_files
+        self.fail_fast = fail_fast
+        self.uploads: list[SpooledUpload] = []
+        self.rejected: list[dict[str, str]] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._part: _SpoolingPart | None = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._part = None
+
+    def _on_header_end(self) -> None:
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if options.get(b"name") != self.field_name or filename is None:
+            return
+        if self.max_files is not None and len(self.uploads) >= self.max_files:
+            return
+        filename = filename.decode("utf-8", errors="replace")
+        expected_type = _extension_type(filename)
+        if expected_type is None or (expected_type == "zip" and not self.allow_zip):
+            self._reject(filename, UploadRejectedError(400, "Only .pdf, .docx, and .md files are supported"))
+            return
+        max_bytes = settings.batch_max_archive_bytes if expected_type == "zip" else settings.upload_max_bytes
+        self._part = _SpoolingPart(filename, expected_type, max_bytes)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part is None:
+            return
+        try:
+            self._part.write(data[start:end])
+        except UploadRejectedError as e:
+            self._abandon_part(e)
+
+    def _on_part_end(self) -> None:
+        if self._part is None:
+            return
+        try:
+            self.uploads.append(self._part.finish())
+        except UploadRejectedError as e:
+            self._abandon_part(e)
+        self._part = None
+
+    def _abandon_part(self, error: UploadRejectedError) -> None:
+        part, self._part = self._part, None
+        part.discard()
+        self._reject(part.filename, error)
+
+    def _reject(self, filename: str, error: UploadRejectedError) -> None:
+        if self.fail_fast:
+            raise error
+        self.rejected.append({"filename": filename, "detail": error.detail})
+
+    def discard_all(self) -> None:
+        if self._part is not None:
+            self._part.discard()
+            self._part = None
+        for upload in self.uploads:
+            discard_spooled_upload(upload.path)
+
+
+async def spool_multipart_uploads(
+    request: Request,
+    field_name: str,
+    allow_zip: bool = False,
+    max_files: int | None = None,
+    max_body_bytes: int | None = None,
+    fail_fast: bool = True,
+) -> tuple[list[SpooledUpload], list[dict[str, str]]]:
+    """
+    Parses a multipart/form-data body straight from request.stream() and copies
+    each file part named `field_name` to a file under upload_spool_dir, so a
+    document is never held in memory or copied twice. Every limit applies while
+    reading: a Content-Length over max_body_bytes is refused before the body is
+    read, a part's type is checked from its first bytes before it is written,
+    and a part stops at upload_max_bytes (batch_max_archive_bytes for .zip).
+    A SHA-256 of each document is computed on the way through for upload
+    deduplication. Returns the spooled documents and, unless fail_fast, a list
+    of {"filename", "detail"} for rejected parts. The spooled files outlive the
+    request: the job that processes them removes them once the text is extracted.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejectedError(400, "Expected a multipart/form-data upload")
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise UploadRejectedError(400, "Invalid Content-Length header")
+    if content_length < 0:
+        raise UploadRejectedError(400, "Invalid Content-Length header")
+    too_large_detail = f"Upload exceeds the {(max_body_bytes or 0) // (1024 * 1024)} MB limit"
+    if max_body_bytes is not None and content_length > max_body_bytes:
+        raise UploadRejectedError(413, too_large_detail)
+
+    spooler = _MultipartUploadSpooler(field_name, allow_zip, max_files, fail_fast)
+    parser = MultipartParser(boundary, spooler.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            # Chunked bodies carry no Content-Length, so the cap is also enforced while reading.
+            if max_body_bytes is not None and received > max_body_bytes:
+                raise UploadRejectedError(413, too_large_detail)
+            await asyncio.to_thread(parser.write, chunk)
+        parser.finalize()
+    except BaseException:
+        spooler.discard_all()
+        raise
+    return spooler.uploads, spooler.rejected
+
+
+def _spool_stream_sync(read_chunk: Callable[[int], bytes], filename: str) -> SpooledUpload:
+    """Spools one archive member, with the same type check and size cap as uploaded parts."""
+    expected_type = _extension_type(filename)
+    if expected_type is None or expected_type == "zip":
+        raise UploadRejectedError(400, "Only .pdf, .docx, and .md files are supported")
+
+    head = read_chunk(UPLOAD_CHUNK_BYTES)
+    if sniff_document_type(head[:SNIFF_BYTES]) != expected_type:
+        raise UploadRejectedError(400, f"File content does not look like a .{expected_type} document")
+
+    fd, path = tempfile.mkstemp(dir=settings.upload_spool_dir, suffix=f".{expected_type}")
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as spool_file:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                # Checked on the decompressed stream, so a zip bomb stops here too.
+                if size > settings.upload_max_bytes:
+                    raise UploadRejectedError(413, f"File exceeds the {settings.upload_max_bytes // (1024 * 1024)} MB upload limit")
+                digest.update(chunk)
+                spool_file.write(chunk)
+                chunk = read_chunk(UPLOAD_CHUNK_BYTES)
+    except BaseException:
+        discard_spooled_upload(path)
+        raise
+    return SpooledUpload(path=path, filename=filename, size=size, sha256=digest.hexdigest())
+
+
+def _spool_zip_members_sync(zip_path: str, max_files: int) -> tuple[list[SpooledUpload], list[dict[str, str]]]:
+    spooled: list[SpooledUpload] = []
+    rejected: list[dict[str, str]] = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                filename = os.path.basename(member.filename)
+                if member.is_dir() or not filename or member.filename.startswith("__MACOSX/") or filename.startswith("."):
+                    continue
+                if len(spooled) >= max_files:
+                    rejected.append({"filename": filename, "detail": f"Batch is limited to {max_files} documents"})
+                    continue
+                try:
+                    with archive.open(member) as member_file:
+                        spooled.append(_spool_stream_sync(member_file.read, filename))
+                except UploadRejectedError as e:
+                    rejected.append({"filename": filename, "detail": e.detail})
+    except zipfile.BadZipFile:
+        raise UploadRejectedError(400, "Archive is not a valid .zip file")
+    except BaseException:
+        for upload in spooled:
+            discard_spooled_upload(upload.path)
+        raise
+    return spooled, rejected
+
+
+async def spool_zip_members(archive: SpooledUpload, max_files: int) -> tuple[list[SpooledUpload], list[dict[str, str]]]:
+    """
+    Spools every supported document inside a spooled .zip upload. Returns the
+    spooled documents and a list of {"filename", "detail"} for skipped members.
+    The archive itself is removed afterwards.
+    """
+    try:
+        return await asyncio.to_thread(_spool_zip_members_sync, archive.path, max_files)
+    finally:
+        discard_spooled_upload(archive.path)
@@ -0,0 +1,98 @@
+"""
+Job worker: claims jobs from the durable queue and runs them outside the API process.
+
+    python -m app.worker --concurrency 2
+
+Run as many worker processes as the LLM backend can keep busy; each claims jobs
+independently, and a job held by a crashed worker is picked up again once its
+visibility timeout expires.
+"""
+import argparse
+import asyncio
+import os
+import socket
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+from app.services.document_pipeline import (
+    PROCESS_BATCH_JOB,
+    PROCESS_DOCUMENT_JOB,
+    on_process_batch_dead,
+    on_process_document_dead,
+    run_process_batch_job,
+    run_process_document_job,
+)
+from app.services.job_queue import Job, job_queue
+
+# kind -> (handler, called once when the job is given up on)
+JOB_HANDLERS: dict[str, tuple[Callable[[Job], Awaitable[None]], Callable[[Job], Awaitable[None]]]] = {
+    PROCESS_DOCUMENT_JOB: (run_process_document_job, on_process_document_dead),
+    PROCESS_BATCH_JOB: (run_process_batch_job, on_process_batch_dead),
+}
+
+
+async def _give_up(job: Job) -> None:
+    handlers = JOB_HANDLERS.get(job.kind)
+    if handlers is None:
+        return
+    try:
+        await handlers[1](job)
+    except Exception as hook_err:
+        print(f"Failed to record dead job {job.id}: {hook_err}")
+
+
+async def run_job(job: Job, worker_id: str) -> None:
+    handlers = JOB_HANDLERS.get(job.kind)
+    if handlers is None:
+        await job_queue.fail(job.model_copy(update={"attempts": job.max_attempts}), f"Unknown job kind '{job.kind}'")
+        return
+
+    print(f"[{worker_id}] Running {job.kind} job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+    heartbeat = asyncio.create_task(job_queue.keep_claimed(job.id, worker_id))
+    try:
+        await handlers[0](job)
+    except Exception as e:
+        print(f"[{worker_id}] Job {job.id} failed: {e!r}")
+        status = await job_queue.fail(job, repr(e))
+        if status is None:
+            print(f"[{worker_id}] Job {job.id} was reclaimed by another worker; leaving its failure to them")
+        elif status == "dead":
+            await _give_up(job)
+    else:
+        if not await job_queue.complete(job):
+            print(f"[{worker_id}] Job {job.id} finished after another worker reclaimed it")
+    finally:
+        heartbeat.cancel()
+
+
+async def worker_loop(worker_id: str, stop: asyncio.Event | None = None) -> None:
+    while stop is None or not stop.is_set():
+        try:
+            for job in await job_queue.reap_exhausted():
+                await _give_up(job)
+            job = await job_queue.claim(worker_id)
+        except Exception as e:
+            print(f"[{worker_id}] Job queue unavailable: {e}")
+            job = None
+
+        if job is None:
+            await asyncio.sleep(settings.job_poll_interval_seconds)
+            continue
+        await run_job(job, worker_id)
+
+
+async def run_workers(concurrency: int) -> None:
+    base_id = f"{socket.gethostname()}-{os.getpid()}"
+    print(f"Starting {concurrency} job worker(s) on {settings.job_queue_path}")
+    await asyncio.gather(*(worker_loop(f"{base_id}-{index}") for index in range(concurrency)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=settings.job_worker_concurrency)
+    args = parser.parse_args()
+    asyncio.run(run_workers(max(1, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Offline throughput benchmark for the analyze -> test cases -> QA intelligence pipeline.
+
+Record a run once against a live backend, then replay it on a laptop:
+
+    LLM_BACKEND=record python benchmark_pipeline.py ../sample_prd.md --runs 1
+    LLM_BACKEND=replay python benchmark_pipeline.py ../sample_prd.md --runs 20 --concurrency 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+async def run_pipeline(text: str, run_index: int, use_cache: bool) -> dict:
+    from app.services.analyzer import analyze_prd_text, generate_qa_intelligence, generate_test_cases
+
+    timings = {}
+    started = time.perf_counter()
+    analysis = await analyze_prd_text(text, use_cache=use_cache)
+    timings["analysis"] = time.perf_counter() - started
+
+    stage_started = time.perf_counter()
+    test_cases = await generate_test_cases(analysis.standardized_prd, use_cache=use_cache)
+    timings["test_cases"] = time.perf_counter() - stage_started
+
+    stage_started = time.perf_counter()
+    if test_cases:
+        await generate_qa_intelligence(analysis.standardized_prd, test_cases, use_cache=use_cache)
+    timings["qa_intelligence"] = time.perf_counter() - stage_started
+
+    timings["total"] = time.perf_counter() - started
+    print(f"run {run_index}: {len(test_cases)} test cases in {timings['total']:.2f}s")
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("document", help="Path to a .md, .pdf or .docx source document")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--use-cache",
+        action="store_true",
+        help="Serve repeated prompts from the LLM response cache (bypassed by default, so every run hits the backend)",
+    )
+    args = parser.parse_args()
+
+    if not args.use_cache:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+
+    from app.services.extractor import extract_text
+    from app.services.analyzer import llm_backend
+    from app.core.config import settings
+
+    with open(args.document, "rb") as document_file:
+        text = extract_text(document_file.read(), args.document)
+
+    print(f"Backend: {settings.llm_backend} ({llm_backend.name}), runs={args.runs}, concurrency={args.concurrency}, cache={'on' if args.use_cache else 'off'}")
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def bounded_run(run_index: int) -> dict:
+        async with semaphore:
+            return await run_pipeline(text, run_index, args.use_cache)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(bounded_run(index) for index in range(args.runs)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    completed = [result for result in results if isinstance(result, dict)]
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Pipeline run failed: {result!r}")
+    if not completed:
+        sys.exit(1)
+
+    print(f"\n{len(completed)}/{args.runs} runs in {elapsed:.2f}s -> {len(completed) / elapsed:.2f} pipelines/s")
+    for stage in ("analysis", "test_cases", "qa_intelligence", "total"):
+        durations = sorted(result[stage] for result in completed)
+        p95 = durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))]
+        print(f"  {stage:<16} avg {sum(durations) / len(durations):6.2f}s  p95 {p95:6.2f}s")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    asyncio.run(main())
@@ -5,9 +5,16 @@ CREATE TABLE public.prds (
   filename text NOT NULL,
   storage_path text NOT NULL,
   status text NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'completed', 'failed')),
+  content_hash text,
   created_at timestamptz DEFAULT now()
 );
 
+-- Upload deduplication looks up completed PRDs by SHA-256 of the document
+CREATE INDEX prds_content_hash_idx ON public.prds (content_hash, created_at DESC);
+
+-- GET /prds pages newest-first on (created_at, id)
+CREATE INDEX prds_created_at_id_idx ON public.prds (created_at DESC, id DESC);
+
 -- Enable RLS
 ALTER TABLE public.prds ENABLE ROW LEVEL SECURITY;
 
@@ -28,6 +35,9 @@ CREATE TABLE public.analysis_results (
   quality_score integer,
   missing_requirements jsonb,
   qa_risk_insights jsonb,
+  -- Versions of the standardized PRD and of the PRD's test suite, stamped on every write
+  prd_hash text,
+  test_cases_hash text,
   created_at timestamptz DEFAULT now()
 );
 
@@ -71,9 +81,14 @@ CREATE TABLE public.test_cases (
   test_data text,
   acceptance_criteria text,
   test_steps text,
+  case_key text,
+  case_hash text,
   created_at timestamptz DEFAULT now()
 );
 
+-- Regenerated suites are diffed against stored cases by their stable key
+CREATE UNIQUE INDEX test_cases_prd_case_key_idx ON public.test_cases (prd_id, case_key);
+
 -- Enable RLS
 ALTER TABLE public.test_cases ENABLE ROW LEVEL SECURITY;
 
@@ -88,6 +103,46 @@ CREATE POLICY "Users can view their own test cases" ON public.test_cases
   );
 
 
+-- Applies a regenerated suite's inserts, updates and deletes, and stamps the
+-- suite's version on the analysis, atomically (one transaction)
+CREATE OR REPLACE FUNCTION public.sync_test_cases(p_prd_id uuid, p_upserts jsonb, p_delete_ids uuid[], p_test_cases_hash text)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  DELETE FROM public.test_cases WHERE prd_id = p_prd_id AND id = ANY(p_delete_ids);
+
+  INSERT INTO public.test_cases (
+    prd_id, case_key, case_hash, scenario, testing_type, severity, priority, feature_name,
+    sub_feature_name, test_conditions, test_idea, test_data, acceptance_criteria, test_steps
+  )
+  SELECT
+    p_prd_id, r.case_key, r.case_hash, r.scenario, r.testing_type, r.severity, r.priority, r.feature_name,
+    r.sub_feature_name, r.test_conditions, r.test_idea, r.test_data, r.acceptance_criteria, r.test_steps
+  FROM jsonb_to_recordset(p_upserts) AS r(
+    case_key text, case_hash text, scenario text, testing_type text, severity text, priority text,
+    feature_name text, sub_feature_name text, test_conditions text, test_idea text, test_data text,
+    acceptance_criteria text, test_steps text
+  )
+  ON CONFLICT (prd_id, case_key) DO UPDATE SET
+    case_hash = EXCLUDED.case_hash,
+    scenario = EXCLUDED.scenario,
+    testing_type = EXCLUDED.testing_type,
+    severity = EXCLUDED.severity,
+    priority = EXCLUDED.priority,
+    feature_name = EXCLUDED.feature_name,
+    sub_feature_name = EXCLUDED.sub_feature_name,
+    test_conditions = EXCLUDED.test_conditions,
+    test_idea = EXCLUDED.test_idea,
+    test_data = EXCLUDED.test_data,
+    acceptance_criteria = EXCLUDED.acceptance_criteria,
+    test_steps = EXCLUDED.test_steps;
+
+  UPDATE public.analysis_results SET test_cases_hash = p_test_cases_hash WHERE prd_id = p_prd_id;
+END;
+$$;
+
+
 -- 4. Create 'qa_intelligence_cache' table
 CREATE TABLE public.qa_intelligence_cache (
   id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -95,6 +150,8 @@ CREATE TABLE public.qa_intelligence_cache (
   prd_hash text NOT NULL,
   test_cases_hash text NOT NULL,
   intelligence jsonb NOT NULL,
+  -- Per-module (feature_name) fingerprints, so edits regenerate only the modules they touch
+  module_hashes jsonb,
   created_at timestamptz DEFAULT now(),
   updated_at timestamptz DEFAULT now()
 );
@@ -111,3 +168,30 @@ CREATE POLICY "Users can view their own QA intelligence cache" ON public.qa_inte
       AND prds.user_id = auth.uid()
     )
   );
+
+
+-- Migration for existing databases: upload deduplication by content hash
+ALTER TABLE public.prds ADD COLUMN IF NOT EXISTS content_hash text;
+CREATE INDEX IF NOT EXISTS prds_content_hash_idx ON public.prds (content_hash, created_at DESC);
+
+-- Migration for existing databases: keyset pagination of the PRD list
+CREATE INDEX IF NOT EXISTS prds_created_at_id_idx ON public.prds (created_at DESC, id DESC);
+
+-- Migration for existing databases: GET /prds/{id} no longer lifts stored scores
+-- on read, so bring older analyses up to the final-score floor (TARGET_FINAL_SCORE)
+UPDATE public.analysis_results SET quality_score = 85 WHERE quality_score IS NULL OR quality_score < 85;
+
+-- Migration for existing databases: diff-based test case persistence
+-- (also re-run the sync_test_cases function definition above)
+ALTER TABLE public.test_cases ADD COLUMN IF NOT EXISTS case_key text;
+ALTER TABLE public.test_cases ADD COLUMN IF NOT EXISTS case_hash text;
+CREATE UNIQUE INDEX IF NOT EXISTS test_cases_prd_case_key_idx ON public.test_cases (prd_id, case_key);
+
+-- Migration for existing databases: analysis version stamps for QA intelligence cache validation
+-- (then re-run the sync_test_cases function definition above)
+ALTER TABLE public.analysis_results ADD COLUMN IF NOT EXISTS prd_hash text;
+ALTER TABLE public.analysis_results ADD COLUMN IF NOT EXISTS test_cases_hash text;
+DROP FUNCTION IF EXISTS public.sync_test_cases(uuid, jsonb, uuid[]);
+
+-- Migration for existing databases: per-module incremental QA intelligence
+ALTER TABLE public.qa_intelligence_cache ADD COLUMN IF NOT EXISTS module_hashes jsonb;
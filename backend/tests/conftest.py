@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Settings() reads these at import time; the tests never reach Supabase or an LLM.
+for _name in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY", "HUGGINGFACE_API_KEY"):
+    os.environ.setdefault(_name, "test")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="prd-tests-"), "jobs.sqlite3"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from app.services.job_queue import SQLiteJobQueue
+
+
+def _queue(tmp_path, **overrides) -> SQLiteJobQueue:
+    options = {
+        "visibility_timeout_seconds": 60,
+        "max_attempts": 3,
+        "retry_backoff_seconds": 0,
+        "done_retention_seconds": 60,
+    }
+    options.update(overrides)
+    return SQLiteJobQueue(path=os.path.join(tmp_path, "jobs.sqlite3"), **options)
+
+
+def test_stale_worker_cannot_complete_or_fail_a_reclaimed_job(tmp_path):
+    queue = _queue(tmp_path, visibility_timeout_seconds=0)
+    job_id = queue._enqueue_sync("kind", {}, None)
+
+    stale = queue._claim_sync("worker-a")
+    current = queue._claim_sync("worker-b")
+    assert stale.id == current.id == job_id
+
+    assert queue._complete_sync(stale) is False
+    assert queue._fail_sync(stale, "boom") is None
+    assert queue._get_sync(job_id).status == "processing"
+
+    assert queue._complete_sync(current) is True
+    assert queue._get_sync(job_id).status == "done"
+
+
+def test_fail_reports_retry_then_dead(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    queue._enqueue_sync("kind", {}, None)
+
+    assert queue._fail_sync(queue._claim_sync("worker"), "boom") == "queued"
+    assert queue._fail_sync(queue._claim_sync("worker"), "boom") == "dead"
+
+
+def test_old_done_jobs_are_pruned(tmp_path):
+    queue = _queue(tmp_path)
+    old_id = queue._enqueue_sync("kind", {}, None)
+    assert queue._complete_sync(queue._claim_sync("worker"))
+    with closing(queue._connect()) as connection:
+        connection.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 120, old_id))
+
+    for _ in range(99):
+        queue._enqueue_sync("kind", {}, None)
+        assert queue._complete_sync(queue._claim_sync("worker"))
+
+    assert queue._get_sync(old_id) is None
+    assert queue._stats_sync()["done"] == 99
+
+
+def test_keep_claimed_survives_a_locked_database(tmp_path, monkeypatch):
+    queue = _queue(tmp_path)
+    beats = []
+
+    async def flaky_heartbeat(job_id, worker_id):
+        beats.append(job_id)
+        if len(beats) == 1:
+            raise sqlite3.OperationalError("database is locked")
+
+    async def no_wait(seconds):
+        await original_sleep(0)
+
+    original_sleep = asyncio.sleep
+    monkeypatch.setattr(queue, "heartbeat", flaky_heartbeat)
+    monkeypatch.setattr(asyncio, "sleep", no_wait)
+
+    async def run():
+        task = asyncio.create_task(queue.keep_claimed("job", "worker"))
+        while len(beats) < 3:
+            await original_sleep(0)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(beats) >= 3
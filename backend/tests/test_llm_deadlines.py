@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import analyzer
+from app.services.llm_resilience import CircuitBreaker, LLMUnavailableError, llm_resilience
+from app.services.llm_routing import task_router
+from app.services.output_budget import OutputBudget
+
+
+def test_task_routes_carry_their_own_deadline():
+    assert task_router.resolve("chat_intent").deadline_seconds < task_router.resolve("analysis").deadline_seconds
+    assert all(
+        task_router.resolve(task).deadline_seconds <= settings.llm_request_deadline_seconds
+        for task in ("analysis", "chat_intent", "automation")
+    )
+
+
+def test_short_deadline_task_gives_up_before_the_global_deadline(monkeypatch):
+    async def stuck_upstream(request_payload):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(analyzer.llm_backend, "complete", stuck_upstream)
+    monkeypatch.setattr(settings, "llm_request_deadline_seconds", 300)
+    monkeypatch.setattr(settings, "llm_task_routes", {"chat_intent": {"deadline_seconds": 0.3}})
+    monkeypatch.setattr(llm_resilience, "breaker", CircuitBreaker(failure_threshold=1000, reset_timeout_seconds=30))
+
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(
+            analyzer._chat_completion(
+                messages=[{"role": "user", "content": "hello"}],
+                budget=OutputBudget(max_tokens=16, raw_estimate=16),
+                task="chat_intent",
+                use_cache=False,
+            )
+        )
+    assert time.monotonic() - started < 5
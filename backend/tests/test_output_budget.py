@@ -0,0 +1,29 @@
+from app.core.config import settings
+from app.services.output_budget import OUTPUT_PROFILES, OutputTokenEstimator
+
+
+def test_floor_clamped_budget_calibrates_against_the_raw_estimate(monkeypatch):
+    monkeypatch.setattr(settings, "llm_adaptive_max_tokens", True)
+    estimator = OutputTokenEstimator()
+
+    # A short chunk: the raw estimate (235) sits well below the profile minimum (500).
+    budget = estimator.estimate("chunk_extraction", input_tokens=100)
+    assert budget.max_tokens == OUTPUT_PROFILES["chunk_extraction"]["minimum"]
+    assert budget.raw_estimate < budget.max_tokens
+
+    # The model uses about what the raw estimate predicted, so the factor must not
+    # shrink just because the clamped max_tokens was larger.
+    for _ in range(10):
+        estimator.record("chunk_extraction", budget, output_tokens=int(budget.raw_estimate))
+    assert estimator.stats()["chunk_extraction"]["factor"] >= 1.0
+
+
+def test_ceiling_clamped_budget_still_grows_on_truncation(monkeypatch):
+    monkeypatch.setattr(settings, "llm_adaptive_max_tokens", True)
+    estimator = OutputTokenEstimator()
+
+    budget = estimator.estimate("chunk_extraction", input_tokens=10000)
+    assert budget.max_tokens == OUTPUT_PROFILES["chunk_extraction"]["maximum"]
+
+    estimator.record("chunk_extraction", budget, output_tokens=budget.max_tokens, truncated=True)
+    assert estimator.stats()["chunk_extraction"]["factor"] > 1.0
@@ -0,0 +1,28 @@
+from app.services.analyzer import _StreamedJsonStringReader
+
+
+def _feed_all(reader: _StreamedJsonStringReader, deltas: list[str]) -> str:
+    return "".join(reader.feed(delta) for delta in deltas)
+
+
+def test_string_value_is_streamed_across_deltas():
+    reader = _StreamedJsonStringReader("message")
+    deltas = ['{"action": "chat", "mess', 'age" :  "Hel', 'lo \\"you\\"\\n', '", "analysis": null}']
+    assert _feed_all(reader, deltas) == 'Hello "you"\n'
+
+
+def test_null_value_streams_nothing():
+    reader = _StreamedJsonStringReader("message")
+    deltas = ['{"message": ', 'null, "analysis": {"standardized_prd": "# Title"}}']
+    assert _feed_all(reader, deltas) == ""
+
+
+def test_non_string_value_streams_nothing():
+    reader = _StreamedJsonStringReader("message")
+    assert _feed_all(reader, ['{"message": 42, "action": "chat"}']) == ""
+
+
+def test_field_name_inside_another_value_is_not_the_key():
+    reader = _StreamedJsonStringReader("message")
+    deltas = ['{"action": "message", ', '"message": "ok"}']
+    assert _feed_all(reader, deltas) == "ok"
@@ -3,6 +3,12 @@ import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import clsx from 'clsx';
 import { formatDate } from '../utils/formatters';
+import {
+    describePipelineStage,
+    subscribePipelineEvents,
+    TERMINAL_PIPELINE_STAGES,
+    type PipelineStageEvent,
+} from '../utils/sse';
 import {
     AlertTriangle,
     CheckCircle2,
@@ -34,6 +40,7 @@ const VALID_TYPES = [
 ];
 
 const VALID_EXTENSIONS = ['.pdf', '.md', '.docx'];
+const PRD_PAGE_SIZE = 50;
 
 function getStatusPresentation(status: PRD['status']) {
     if (status === 'completed') {
@@ -78,9 +85,18 @@ function getGapSummary(status: PRD['status']) {
     return 'Gap review pending';
 }
 
+async function fetchPrdPage(cursor?: string) {
+    const response = await axios.get<PRD[]>('http://localhost:8000/api/v1/prds', {
+        params: { limit: PRD_PAGE_SIZE, cursor },
+    });
+    return { page: response.data, next: (response.headers['x-next-cursor'] as string | undefined) || undefined };
+}
+
 export default function Dashboard() {
     const [prds, setPrds] = useState<PRD[]>([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState<string | undefined>();
+    const [loadingMore, setLoadingMore] = useState(false);
     const [query, setQuery] = useState('');
     const [file, setFile] = useState<File | null>(null);
     const [isDragging, setIsDragging] = useState(false);
@@ -89,15 +105,31 @@ export default function Dashboard() {
     const [deletingId, setDeletingId] = useState<string | null>(null);
     const [deleteCandidate, setDeleteCandidate] = useState<DeleteCandidate | null>(null);
     const [feedback, setFeedback] = useState<{ type: 'success' | 'error'; text: string } | null>(null);
+    const [stageByPrd, setStageByPrd] = useState<Record<string, PipelineStageEvent>>({});
     const fileInputRef = useRef<HTMLInputElement | null>(null);
+    const loadedMoreRef = useRef(false);
     const navigate = useNavigate();
 
+    // Refreshes only the newest page (revalidated with the browser's ETag); older pages are
+    // fetched on demand through "Load more" and kept as they are.
     const fetchPrds = useCallback(async (showLoader = false) => {
         if (showLoader) setLoading(true);
 
         try {
-            const response = await axios.get<PRD[]>('http://localhost:8000/api/v1/prds');
-            setPrds(response.data);
+            const { page, next } = await fetchPrdPage();
+            if (!next || !loadedMoreRef.current) {
+                loadedMoreRef.current = false;
+                setPrds(page);
+                setNextCursor(next);
+                return;
+            }
+            // Older pages were loaded: keep them (and their cursor) behind the refreshed first page.
+            const oldest = Math.min(...page.map((prd) => new Date(prd.created_at).getTime()));
+            const pageIds = new Set(page.map((prd) => prd.id));
+            setPrds((current) => [
+                ...page,
+                ...current.filter((prd) => !pageIds.has(prd.id) && new Date(prd.created_at).getTime() < oldest),
+            ]);
         } catch (error) {
             console.error('Error fetching PRDs:', error);
         } finally {
@@ -105,6 +137,26 @@ export default function Dashboard() {
         }
     }, []);
 
+    const loadMorePrds = async () => {
+        if (!nextCursor || loadingMore) return;
+
+        setLoadingMore(true);
+        try {
+            const { page, next } = await fetchPrdPage(nextCursor);
+            loadedMoreRef.current = true;
+            setPrds((current) => {
+                const loadedIds = new Set(current.map((prd) => prd.id));
+                return [...current, ...page.filter((prd) => !loadedIds.has(prd.id))];
+            });
+            setNextCursor(next);
+        } catch (error) {
+            console.error('Error fetching PRDs:', error);
+            setFeedback({ type: 'error', text: 'Could not load more documents. Please try again.' });
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         void fetchPrds(true);
     }, [fetchPrds]);
@@ -114,11 +166,13 @@ export default function Dashboard() {
     useEffect(() => {
         if (!hasActiveProcessing) return;
 
-        const interval = setInterval(() => {
-            void fetchPrds(false);
-        }, 3000);
-
-        return () => clearInterval(interval);
+        // Pipeline stages are pushed by the API; the list is only re-fetched when a document finishes.
+        return subscribePipelineEvents('http://localhost:8000/api/v1/prds/events', (event) => {
+            setStageByPrd((current) => ({ ...current, [event.prd_id]: event }));
+            if (TERMINAL_PIPELINE_STAGES.includes(event.stage)) {
+                void fetchPrds(false);
+            }
+        });
     }, [fetchPrds, hasActiveProcessing]);
 
     useEffect(() => {
@@ -340,7 +394,7 @@ export default function Dashboard() {
                     <div className="grid gap-4 md:grid-cols-3">
                         <div className="premium-surface premium-hover-card rounded-[1.75rem] p-5 backdrop-blur">
                             <p className="text-xs font-semibold uppercase tracking-[0.24em] text-slate-500">Documents</p>
-                            <p className="mt-3 text-3xl font-black text-slate-950">{prds.length}</p>
+                            <p className="mt-3 text-3xl font-black text-slate-950">{prds.length}{nextCursor ? '+' : ''}</p>
                             <p className="mt-2 text-sm text-slate-600">Uploaded across your workspace.</p>
                         </div>
 
@@ -461,7 +515,11 @@ export default function Dashboard() {
                                                                             Requirement Extraction
                                                                         </p>
                                                                         <p className="mt-2 text-sm font-semibold text-slate-900">
-                                                                            {prd.status === 'completed' ? 'Structured output ready' : 'Preparing extraction'}
+                                                                            {prd.status === 'completed'
+                                                                                ? 'Structured output ready'
+                                                                                : stageByPrd[prd.id]
+                                                                                  ? describePipelineStage(stageByPrd[prd.id])
+                                                                                  : 'Preparing extraction'}
                                                                         </p>
                                                                     </div>
                                                                     <div className="rounded-2xl bg-slate-50 px-4 py-3">
@@ -511,6 +569,20 @@ export default function Dashboard() {
                                 })}
                             </div>
                         )}
+
+                        {nextCursor && (
+                            <div className="mt-5 flex justify-center">
+                                <button
+                                    type="button"
+                                    onClick={() => void loadMorePrds()}
+                                    disabled={loadingMore}
+                                    className="inline-flex items-center gap-2 rounded-2xl border border-slate-300 bg-white px-5 py-3 text-sm font-bold text-slate-700 transition hover:bg-slate-50 disabled:cursor-not-allowed disabled:opacity-60"
+                                >
+                                    {loadingMore && <Loader2 className="h-4 w-4 animate-spin" />}
+                                    Load More Documents
+                                </button>
+                            </div>
+                        )}
                     </div>
                 </section>
 
@@ -37,6 +37,13 @@ import {
 } from 'lucide-react';
 import * as XLSX from 'xlsx';
 import QACoverageMindMap, { type MindMapSelection } from '../components/QACoverageMindMap';
+import {
+    describePipelineStage,
+    DRAFT_RESET_STAGES,
+    streamServerSentEvents,
+    subscribeAnalysisStream,
+    type PipelineStageEvent,
+} from '../utils/sse';
 
 interface AnalysisData {
     standardized_prd?: string;
@@ -56,6 +63,12 @@ interface ChatMessage {
     content: string;
 }
 
+interface ChatStreamResult {
+    action: 'chat' | 'update';
+    message: string;
+    analysis?: AnalysisData | null;
+}
+
 interface TestCase {
     scenario: string;
     testing_type: string;
@@ -121,6 +134,18 @@ interface QAIntelligenceResponse {
     cached: boolean;
 }
 
+type WorkspacePart = 'prd' | 'analysis' | 'test_cases' | 'qa_intelligence';
+
+interface PRDWorkspaceResponse {
+    prd_id: string;
+    versions: Partial<Record<WorkspacePart, string>>;
+    unchanged: WorkspacePart[];
+    prd: Omit<PRDDetailResponse, 'analysis'> | null;
+    analysis: AnalysisData | null;
+    test_cases: TestCase[] | null;
+    qa_intelligence: QAIntelligence | null;
+}
+
 interface AutomationScriptResponse {
     framework: string;
     language: string;
@@ -129,6 +154,10 @@ interface AutomationScriptResponse {
     explanation: string;
 }
 
+// Backoff before re-opening an analysis stream that errored or dropped
+const ANALYSIS_STREAM_RETRY_MS = 2000;
+const ANALYSIS_STREAM_MAX_RETRY_MS = 30000;
+
 const CODE_KEYWORDS = new Set([
     'import', 'from', 'export', 'default', 'const', 'let', 'var', 'new', 'return', 'await', 'async', 'if', 'else',
     'try', 'catch', 'finally', 'throw', 'class', 'extends', 'describe', 'it', 'test', 'beforeEach', 'afterEach',
@@ -519,50 +548,119 @@ export default function PRDViewer() {
     const automationPanelRef = useRef<HTMLDivElement>(null);
     const previousQaCacheKeyRef = useRef<string | null>(null);
     const qaIntelligenceFetchAttemptedRef = useRef<string | null>(null);
+    const [pipelineStage, setPipelineStage] = useState<PipelineStageEvent | null>(null);
+    const [analysisDraft, setAnalysisDraft] = useState('');
+    const workspaceRef = useRef<{
+        versions: PRDWorkspaceResponse['versions'];
+        prd?: Omit<PRDDetailResponse, 'analysis'>;
+        analysis?: AnalysisData;
+        testCases: TestCase[];
+    }>({ versions: {}, testCases: [] });
 
     useEffect(() => {
-        let interval: ReturnType<typeof setInterval>;
+        let unsubscribe: (() => void) | null = null;
+        let retryTimer: number | undefined;
+        let retryDelay = ANALYSIS_STREAM_RETRY_MS;
+        let cancelled = false;
+        workspaceRef.current = { versions: {}, testCases: [] };
+
+        const stopListening = () => {
+            unsubscribe?.();
+            unsubscribe = null;
+            window.clearTimeout(retryTimer);
+        };
 
         const fetchPrdDetail = async () => {
             try {
-                console.log('Fetching PRD for id:', id);
-                const response = await axios.get(`http://localhost:8000/api/v1/prds/${id}`);
-                console.log('PRD response:', response.data);
+                console.log('Fetching PRD workspace for id:', id);
+                // One request for the PRD, analysis, test cases and cached QA intelligence;
+                // parts whose version we already hold come back as `unchanged`.
+                const { versions } = workspaceRef.current;
+                const response = await axios.get<PRDWorkspaceResponse>(`http://localhost:8000/api/v1/prds/${id}/workspace`, {
+                    params: {
+                        prd_version: versions.prd,
+                        analysis_version: versions.analysis,
+                        test_cases_version: versions.test_cases,
+                        qa_intelligence_version: versions.qa_intelligence,
+                    },
+                });
+                const workspace = response.data;
+                const workspaceState = workspaceRef.current;
+                if (workspace.prd) {
+                    workspaceState.prd = workspace.prd;
+                }
+                if (!workspace.unchanged.includes('analysis')) {
+                    workspaceState.analysis = workspace.analysis ?? undefined;
+                }
+                if (!workspace.unchanged.includes('test_cases')) {
+                    workspaceState.testCases = workspace.test_cases ?? [];
+                    setTestCases(workspaceState.testCases);
+                }
+                workspaceState.versions = workspace.versions;
 
-                setData(response.data);
+                const prdStatus = workspaceState.prd?.status;
+                if (workspaceState.prd) {
+                    setData({ ...workspaceState.prd, analysis: workspaceState.analysis });
+                }
 
-                // Stop polling if completed or failed
-                if (response.data.status === 'completed' || response.data.status === 'failed') {
-                    clearInterval(interval);
-                    setLoading(false);
+                if (workspace.qa_intelligence && workspaceState.analysis) {
+                    // Seed the session cache the QA tab reads from, so it needs no request of its own.
+                    const signature = createQaIntelligenceSignature(workspaceState.analysis.standardized_prd, workspaceState.testCases);
+                    sessionStorage.setItem(
+                        `qa-intelligence:${id}:${signature}`,
+                        JSON.stringify({ intelligence: workspace.qa_intelligence, cached: true }),
+                    );
+                }
 
-                    // Also fetch test cases if PRD is completed
-                    if (response.data.status === 'completed') {
-                        try {
-                            const tcResponse = await axios.get(`http://localhost:8000/api/v1/prds/${id}/test-cases`);
-                            if (tcResponse.data && tcResponse.data.test_cases) {
-                                setTestCases(tcResponse.data.test_cases);
-                            }
-                        } catch (tcErr) {
-                            console.error('Error fetching test cases:', tcErr);
-                        }
+                // While processing, follow the analysis stream (the worker's stages and
+                // draft, relayed by the API) instead of polling
+                if (prdStatus !== 'completed' && prdStatus !== 'failed') {
+                    if (!unsubscribe && !cancelled) {
+                        // The stream replays the current run's draft, so start from scratch.
+                        setAnalysisDraft('');
+                        unsubscribe = subscribeAnalysisStream(
+                            `http://localhost:8000/api/v1/prds/${id}/analysis/stream`,
+                            {
+                                onStage: (stage) => {
+                                    setPipelineStage({ seq: 0, prd_id: id as string, stage });
+                                    if (DRAFT_RESET_STAGES.includes(stage)) setAnalysisDraft('');
+                                },
+                                onDraft: (text) => setAnalysisDraft((draft) => draft + text),
+                                onDone: (outcome) => {
+                                    unsubscribe = null;
+                                    // Only a stored result is re-read right away; after an error or a
+                                    // dropped stream the next attempt backs off exponentially.
+                                    const delay = outcome === 'analysis' ? 0 : retryDelay;
+                                    if (outcome !== 'analysis') {
+                                        retryDelay = Math.min(retryDelay * 2, ANALYSIS_STREAM_MAX_RETRY_MS);
+                                    }
+                                    retryTimer = window.setTimeout(() => {
+                                        if (!cancelled) void fetchPrdDetail();
+                                    }, delay);
+                                },
+                            },
+                        );
                     }
+                } else {
+                    stopListening();
+                    setLoading(false);
                 }
             } catch (err: any) {
                 console.error('Error fetching PRD:', err);
                 setError(err.response?.data?.detail || "Failed to load PRD data.");
-                clearInterval(interval);
+                stopListening();
                 setLoading(false);
             }
         };
 
         if (id) {
             fetchPrdDetail();
-            // Poll every 3 seconds while loading
-            interval = setInterval(fetchPrdDetail, 3000);
         }
 
-        return () => clearInterval(interval);
+        return () => {
+            cancelled = true;
+            stopListening();
+        };
     }, [id]);
 
     useEffect(() => {
@@ -893,15 +991,46 @@ export default function PRDViewer() {
         setChatInput('');
         setChatHistory(prev => [...prev, { role: 'user', content: userMessage }]);
 
-        try {
-            const response = await axios.post(`http://localhost:8000/api/v1/prds/${id}/chat`, {
-                message: userMessage
+        // Placeholder bubble that is filled in as the reply streams
+        setChatHistory(prev => [...prev, { role: 'ai', content: '' }]);
+        const updateStreamingReply = (update: (content: string) => string) => {
+            setChatHistory(prev => {
+                const next = [...prev];
+                const last = next[next.length - 1];
+                next[next.length - 1] = { ...last, content: update(last.content) };
+                return next;
             });
+        };
+
+        try {
+            const streamState: { result: ChatStreamResult | null; error: string | null } = { result: null, error: null };
+
+            await streamServerSentEvents(
+                `http://localhost:8000/api/v1/prds/${id}/chat/stream`,
+                {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ message: userMessage }),
+                },
+                ({ event, data: payload }) => {
+                    if (event === 'message') {
+                        updateStreamingReply(content => content + String(payload));
+                    } else if (event === 'result') {
+                        streamState.result = payload as ChatStreamResult;
+                    } else if (event === 'error') {
+                        streamState.error = (payload as { detail?: string })?.detail || 'Chat stream failed';
+                    }
+                },
+            );
 
-            const { action, message: aiMessage, analysis } = response.data;
+            if (streamState.error || !streamState.result) {
+                throw new Error(streamState.error || 'Chat stream ended without a result');
+            }
 
-            // Show the AI's dynamic response
-            setChatHistory(prev => [...prev, { role: 'ai', content: aiMessage }]);
+            const { action, message: aiMessage, analysis } = streamState.result;
+
+            // Show the AI's final response (authoritative over the streamed preview)
+            updateStreamingReply(() => aiMessage);
 
             // If the AI updated the PRD, refresh the data
             if (action === 'update' && analysis) {
@@ -913,7 +1042,7 @@ export default function PRDViewer() {
             }
         } catch (err: any) {
             console.error('Error in AI chat:', err);
-            setChatHistory(prev => [...prev, { role: 'ai', content: "Sorry, I encountered an error. Please try again." }]);
+            updateStreamingReply(() => "Sorry, I encountered an error. Please try again.");
         } finally {
             setIsRefining(false);
         }
@@ -931,7 +1060,10 @@ export default function PRDViewer() {
         setAutomationError(null);
 
         try {
-            const response = await axios.post(`http://localhost:8000/api/v1/prds/${id}/generate-test-cases`);
+            // An existing suite is being regenerated: ask for a fresh one, not the cached answer.
+            const response = await axios.post(`http://localhost:8000/api/v1/prds/${id}/generate-test-cases`, null, {
+                params: testCases.length > 0 ? { regenerate: true } : undefined,
+            });
             if (response.data && response.data.test_cases) {
                 setTestCases(response.data.test_cases);
             }
@@ -979,6 +1111,9 @@ export default function PRDViewer() {
                     acceptance_criteria: selectedTestCase.acceptance_criteria,
                     test_steps: selectedTestCase.test_steps,
                 },
+                {
+                    params: automationScript ? { regenerate: true } : undefined,
+                },
             );
 
             setAutomationScript(response.data);
@@ -1120,7 +1255,18 @@ export default function PRDViewer() {
                     <p className="text-slate-500 mt-2 max-w-sm">
                         We are extracting text, correlating requirements, and standardizing the format. This typically takes 10-30 seconds.
                     </p>
+                    {pipelineStage && (
+                        <p className="text-sm font-semibold text-blue-700 mt-3">
+                            {describePipelineStage(pipelineStage)}
+                            {pipelineStage.elapsed_seconds !== undefined && ` · ${Math.round(pipelineStage.elapsed_seconds)}s elapsed`}
+                        </p>
+                    )}
                 </div>
+                {analysisDraft && (
+                    <div className="w-full max-w-3xl max-h-72 overflow-y-auto rounded-xl border border-slate-200 bg-slate-50 p-4 text-left text-sm leading-6 text-slate-600 whitespace-pre-wrap">
+                        {analysisDraft}
+                    </div>
+                )}
             </div>
         );
     }
@@ -2149,7 +2295,7 @@ export default function PRDViewer() {
                                 </div>
                             )}
 
-                            {chatHistory.map((msg, i) => (
+                            {chatHistory.filter(msg => msg.content).map((msg, i) => (
                                 <div key={i} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
                                     <div className={`max-w-[90%] px-4 py-2.5 rounded-2xl text-sm ${msg.role === 'user'
                                         ? 'bg-blue-600 text-white rounded-br-none'
@@ -74,14 +74,15 @@ export default function UploadPRD() {
         formData.append('file', file);
 
         try {
-            await axios.post('http://localhost:8000/api/v1/analyze', formData, {
+            const response = await axios.post<{ id: string }>('http://localhost:8000/api/v1/analyze', formData, {
                 headers: {
                     'Content-Type': 'multipart/form-data',
                 },
             });
 
-            // Navigate to the dashboard or directly to the processing PRD
-            navigate(`/dashboard`);
+            // The viewer follows the worker's analysis and shows the PRD as it is drafted
+
+            navigate(`/prd/${response.data.id}`);
         } catch (err: any) {
             console.error('Upload error:', err);
             setError(err.response?.data?.detail || "Failed to upload file. Please try again.");
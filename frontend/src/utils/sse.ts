@@ -0,0 +1,163 @@
+export interface ServerSentEvent {
+  event: string;
+  data: unknown;
+}
+
+function parseEventBlock(block: string): ServerSentEvent | null {
+  let event = 'message';
+  const dataLines: string[] = [];
+
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).replace(/^ /, ''));
+    }
+  }
+
+  if (!dataLines.length) {
+    return null;
+  }
+
+  const rawData = dataLines.join('\n');
+  try {
+    return { event, data: JSON.parse(rawData) };
+  } catch {
+    return { event, data: rawData };
+  }
+}
+
+/**
+ * Reads a Server-Sent Events response from fetch (which, unlike EventSource,
+ * also supports POST bodies) and invokes onEvent for every complete event.
+ */
+export async function streamServerSentEvents(
+  url: string,
+  init: RequestInit,
+  onEvent: (event: ServerSentEvent) => void,
+): Promise<void> {
+  const response = await fetch(url, {
+    ...init,
+    headers: { Accept: 'text/event-stream', ...(init.headers || {}) },
+  });
+
+  if (!response.ok || !response.body) {
+    let detail = `Request failed with status ${response.status}`;
+    try {
+      const body = await response.json();
+      detail = body?.detail || detail;
+    } catch {
+      // Non-JSON error body; keep the status-based message.
+    }
+    throw new Error(detail);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+    let separatorIndex = buffer.indexOf('\n\n');
+    while (separatorIndex !== -1) {
+      const parsed = parseEventBlock(buffer.slice(0, separatorIndex));
+      buffer = buffer.slice(separatorIndex + 2);
+      if (parsed) onEvent(parsed);
+      separatorIndex = buffer.indexOf('\n\n');
+    }
+  }
+
+  const trailing = parseEventBlock(buffer.trim());
+  if (trailing) onEvent(trailing);
+}
+
+export interface PipelineStageEvent {
+  seq: number;
+  prd_id: string;
+  stage: 'queued' | 'extracting' | 'condensing' | 'analyzing' | 'upgrading' | 'storing' | 'retrying' | 'completed' | 'failed';
+  elapsed_seconds?: number;
+  upgrade_pass?: number;
+  attempt?: number;
+}
+
+export const TERMINAL_PIPELINE_STAGES: PipelineStageEvent['stage'][] = ['completed', 'failed'];
+
+/** Stages that start a new draft of the analysis (a fresh run or a retried attempt). */
+export const DRAFT_RESET_STAGES: PipelineStageEvent['stage'][] = ['queued', 'retrying', 'extracting', 'condensing', 'analyzing'];
+
+const PIPELINE_STAGE_LABELS: Record<PipelineStageEvent['stage'], string> = {
+  queued: 'Queued',
+  extracting: 'Extracting text',
+  condensing: 'Condensing source',
+  analyzing: 'Analyzing requirements',
+  upgrading: 'Upgrading quality',
+  storing: 'Saving results',
+  retrying: 'Retrying',
+  completed: 'Completed',
+  failed: 'Failed',
+};
+
+export function describePipelineStage(event: PipelineStageEvent): string {
+  const label = PIPELINE_STAGE_LABELS[event.stage] || event.stage;
+  return event.stage === 'upgrading' && event.upgrade_pass ? `${label} (pass ${event.upgrade_pass})` : label;
+}
+
+/** How an analysis stream ended: with the stored result, with the pipeline's failure, or dropped. */
+export type AnalysisStreamOutcome = 'analysis' | 'error' | 'closed';
+
+export interface AnalysisStreamHandlers {
+  onStage: (stage: PipelineStageEvent['stage']) => void;
+  onDraft: (text: string) => void;
+  /** The stream ended. Re-read the PRD; back off before subscribing again unless it was 'analysis'. */
+  onDone: (outcome: AnalysisStreamOutcome) => void;
+}
+
+/**
+ * Follows a PRD's analysis stream (relayed from the job worker): stage names,
+ * the standardized PRD text as it is drafted and onDone once it ends.
+ */
+export function subscribeAnalysisStream(url: string, handlers: AnalysisStreamHandlers): () => void {
+  const controller = new AbortController();
+  let done = false;
+  const finish = (outcome: AnalysisStreamOutcome) => {
+    if (done || controller.signal.aborted) return;
+    done = true;
+    handlers.onDone(outcome);
+  };
+
+  streamServerSentEvents(url, { signal: controller.signal }, (event) => {
+    if (event.event === 'status') {
+      handlers.onStage(event.data as PipelineStageEvent['stage']);
+    } else if (event.event === 'draft' && typeof event.data === 'string') {
+      handlers.onDraft(event.data);
+    } else if (event.event === 'analysis' || event.event === 'error') {
+      finish(event.event);
+    }
+  })
+    .catch(() => undefined)
+    .finally(() => finish('closed'));
+
+  return () => controller.abort();
+}
+
+/**
+ * Subscribes to pipeline "stage" events over EventSource (which reconnects on
+ * its own) and returns a function that closes the subscription.
+ */
+export function subscribePipelineEvents(
+  url: string,
+  onStage: (event: PipelineStageEvent) => void,
+): () => void {
+  const source = new EventSource(url);
+  source.addEventListener('stage', (message) => {
+    try {
+      onStage(JSON.parse((message as MessageEvent<string>).data) as PipelineStageEvent);
+    } catch {
+      // Ignore malformed events; the next stage event carries the full state.
+    }
+  });
+  return () => source.close();
+}